@@ -1,31 +1,38 @@
 import os
 from dotenv import load_dotenv
 load_dotenv()
-from flask import Flask, jsonify
+from app import startup
+from flask import Flask, jsonify, request
 from flask_pymongo import PyMongo
 from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
 from datetime import datetime
 from flask_cors import CORS
-from app.utils.ai_content_filter import AIContentFilter
+from werkzeug.middleware.proxy_fix import ProxyFix
+from app import background, metrics, model_registry, passwords
+from app.config import Config
+from app.indexes import ensure_indexes
 import ssl
+import hmac
+from functools import wraps
+import time
 from waitress import serve
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
 app.config['MONGO_URI'] = os.getenv('MONGO_URI')
-print(f"MONGO_URI: {os.getenv('MONGO_URI')}")
+if Config.PROXY_COUNT:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=Config.PROXY_COUNT, x_proto=Config.PROXY_COUNT)
 CORS(app, resources={r"/*": {"origins": ["https://wonderful-sky-054cb711e.2.azurestaticapps.net", "http://localhost:4200"]}})
 mongo = PyMongo(app)
 bcrypt = Bcrypt(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
-ai_content_filter = AIContentFilter(modelVersion='original')
 from app import routes
 
 def init_db():
     if mongo.db.users.count_documents({}) == 0:
-        hashed_password = bcrypt.generate_password_hash('password123').decode('utf-8')
+        hashed_password = passwords.hash_password('password123')
         mongo.db.users.insert_one({
             "username": "testuser",
             "email": "testuser@example.com",
@@ -50,7 +57,9 @@ def init_db():
         ]
         mongo.db.communities.insert_many(communities)
 
-init_db()
+    ensure_indexes(mongo.db)
+
+# Seeding and indexes run in the startup thread (app/startup.py), not at import
 
 def create_app():
     app = Flask(__name__)
@@ -64,28 +73,67 @@ def create_app():
 
 @app.route('/debug')
 def debug():
-    try:
-        from detoxify import Detoxify
-        from sentence_transformers import SentenceTransformer
-        ai_models = "loaded"
-    except Exception as e:
-        ai_models = f"failed: {str(e)}"
     return jsonify({
-        "status": "running",
-        "env": dict(os.environ),
-        "mongo_available": mongo.db is not None if 'mongo' in globals() else False,
-        "ai_models": ai_models
+        "status": startup.status(),
+        "mongo_available": mongo.db is not None,
+        "ai_models": model_registry.stats()["models"]
     })
 
+@app.before_request
+def start_background_worker():
+    # Cheap pid check; starts the worker in each gunicorn worker after fork
+    background.ensure_running()
+    startup.begin(mongo.db, init_db)
+
+def admin_only(fn):
+    # Bearer ADMIN_TOKEN; without one configured, only local requests that did not
+    # come through a proxy (e.g. curl on the host) are let in
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if Config.ADMIN_TOKEN:
+            supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+            allowed = hmac.compare_digest(supplied.encode(), Config.ADMIN_TOKEN.encode())
+        else:
+            peer = request.environ.get('werkzeug.proxy_fix.orig', request.environ).get('REMOTE_ADDR')
+            allowed = peer in ('127.0.0.1', '::1') and 'X-Forwarded-For' not in request.headers
+        if not allowed:
+            return jsonify({'message': 'Admin access required'}), 403
+        return fn(*args, **kwargs)
+    return wrapper
+
+@app.route('/admin/metrics')
+@admin_only
+def admin_metrics():
+    return jsonify(metrics.snapshot()), 200
+
+@app.route('/admin/startup')
+@admin_only
+def admin_startup():
+    return jsonify(startup.profile()), 200
+
 @app.route('/health')
 def health():
-    return jsonify({'status': 'healthy'}), 200
+    # Liveness: the process answers while it is still loading; only a failed startup is unhealthy
+    state = startup.status()
+    if state == startup.FAILED:
+        return jsonify({'status': 'failed'}), 503
+    return jsonify({'status': 'healthy' if state == startup.READY else 'starting'}), 200
+
+@app.route('/ready')
+def ready():
+    # Readiness: send traffic here once Mongo, the models and the warm-up are done
+    if startup.ready():
+        return jsonify({'status': 'ready'}), 200
+    return jsonify({'status': startup.status()}), 503
 
 @app.route('/')
 def index():
     return "Welcome to Asksphere!"
 
+startup.record('import', time.perf_counter() - startup.IMPORT_STARTED)
+
 if __name__ == '__main__':
     ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
     ssl_context.load_cert_chain(certfile='/app/asksphere-cert.pem', keyfile='/app/asksphere-key.pem')
+    startup.begin(mongo.db, init_db)
     serve(app, host='0.0.0.0', port=int(os.getenv('PORT', 5000)), ssl_context=ssl_context)
\ No newline at end of file
@@ -0,0 +1,142 @@
+import io
+import re
+import base64
+import hashlib
+import logging
+from flask import url_for
+from gridfs import GridFSBucket, NoFile
+from app import metrics
+from app.cache import Cache, MemoryBackend
+from app.config import Config
+from app.inference import run_blocking
+from app.models import DEFAULT_AVATAR
+
+logger = logging.getLogger(__name__)
+
+# Avatars live in the "avatars" GridFS bucket, one file per thumbnail size, named
+# "<sha256 of the uploaded bytes>/<size>". The same image uploaded twice is stored
+# once, and users only keep the hash (users.avatarHash).
+BUCKET = 'avatars'
+THUMBNAIL_FORMAT = 'WEBP'
+MIMETYPE = 'image/webp'
+
+HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Binary entries of a few KB each: a separate, small LRU rather than the response cache
+thumbnail_cache = Cache(MemoryBackend(Config.AVATAR_CACHE_MAX_ENTRIES))
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _filename(avatar_hash, size):
+    return f"{avatar_hash}/{size}"
+
+
+def make_thumbnails(data, sizes):
+    """
+    Square, center-cropped thumbnails of an uploaded image.
+
+    Returns:
+        Dict of size -> encoded thumbnail bytes
+    Raises:
+        InvalidImage: The data is not an image Pillow can read, or is too large
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        # Checked before decoding, so a small file declaring huge dimensions is never expanded
+        if image.width * image.height > Config.AVATAR_MAX_PIXELS:
+            raise InvalidImage(f"Image is larger than {Config.AVATAR_MAX_PIXELS} pixels")
+        image.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise InvalidImage(f"Unreadable image: {str(e)}")
+
+    # Phones store rotation in EXIF; GIFs keep their first frame
+    image = ImageOps.exif_transpose(image).convert('RGBA')
+    thumbnails = {}
+    for size in sizes:
+        buffer = io.BytesIO()
+        ImageOps.fit(image, (size, size), Image.LANCZOS).save(buffer, THUMBNAIL_FORMAT, quality=Config.AVATAR_QUALITY)
+        thumbnails[size] = buffer.getvalue()
+    return thumbnails
+
+
+def store(db, data):
+    """
+    Store the thumbnails of an uploaded image unless that content is already stored.
+
+    Returns:
+        The content hash to save on the user document
+    """
+    avatar_hash = content_hash(data)
+    names = [_filename(avatar_hash, size) for size in Config.AVATAR_SIZES]
+    existing = {f["filename"] for f in db[f"{BUCKET}.files"].find({"filename": {"$in": names}}, {"filename": 1})}
+    missing = [size for size in Config.AVATAR_SIZES if _filename(avatar_hash, size) not in existing]
+    if missing:
+        bucket = GridFSBucket(db, bucket_name=BUCKET)
+        # Decoding and resizing is CPU-bound; off the request greenlet under gevent
+        for size, thumbnail in run_blocking(make_thumbnails, data, missing).items():
+            bucket.upload_from_stream(_filename(avatar_hash, size), thumbnail, metadata={"contentType": MIMETYPE})
+    return avatar_hash
+
+
+def load(db, avatar_hash, size):
+    """
+    Thumbnail bytes, kept in thumbnail_cache once read. Content-addressed files
+    never change, so nothing invalidates the entries; the TTL only lets rarely
+    requested thumbnails go.
+
+    Raises:
+        NoFile: No thumbnail of that hash and size
+    """
+    def read():
+        return GridFSBucket(db, bucket_name=BUCKET).open_download_stream_by_name(_filename(avatar_hash, size)).read()
+
+    return thumbnail_cache.get_or_set('avatar', f"avatar:{avatar_hash}/{size}", read, Config.AVATAR_CACHE_TTL)
+
+
+def url(user, size=None):
+    """
+    Avatar URL for a user document (or any dict with avatarHash). Users whose
+    avatar has not been migrated still get their stored data URL.
+    """
+    avatar_hash = user.get("avatarHash")
+    if avatar_hash:
+        if size and size != Config.AVATAR_SIZES[0]:
+            return url_for('get_avatar', avatar_hash=avatar_hash, size=size, _external=True)
+        return url_for('get_avatar', avatar_hash=avatar_hash, _external=True)
+    return user.get("avatar") or DEFAULT_AVATAR
+
+
+def migrate(db):
+    """
+    Move base64 avatars from users.avatar into the bucket.
+
+    Returns:
+        (migrated, failed) user counts
+    """
+    migrated = failed = 0
+    for user in db.users.find({"avatar": {"$regex": "^data:"}}, {"avatar": 1}):
+        update = {"$unset": {"avatar": ""}}
+        if user["avatar"] != DEFAULT_AVATAR:
+            try:
+                data = base64.b64decode(user["avatar"].split(",", 1)[1])
+                update["$set"] = {"avatarHash": store(db, data)}
+            except (IndexError, ValueError, InvalidImage) as e:
+                logger.warning(f"Could not migrate avatar of user {user['_id']}: {str(e)}")
+                failed += 1
+                continue
+        # Matching on the old value skips users who uploaded a new avatar meanwhile
+        db.users.update_one({"_id": user["_id"], "avatar": user["avatar"]}, update)
+        migrated += 1
+    return migrated, failed
+
+
+metrics.register('avatarCache', thumbnail_cache.stats)
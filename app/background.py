@@ -0,0 +1,126 @@
+import os
+import time
+import queue
+import logging
+import threading
+from app import metrics
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundWorker:
+    """
+    Daemon thread running fire-and-forget tasks and periodic jobs off the request path.
+
+    The thread is started lazily in whichever process uses it, so it also works
+    in gunicorn workers forked from a preloaded master. At most `max_queue` tasks
+    wait; past that, submitted tasks are dropped (and counted) rather than
+    letting the queue grow without bound behind a slow job.
+    """
+
+    def __init__(self, name, max_queue=0):
+        self.name = name
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(max_queue)
+        self._jobs = []
+        self._thread = None
+        self._pid = None
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def ensure_running(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                if self._pid != os.getpid():
+                    # Tasks queued in the parent belong to the parent
+                    self._queue = queue.Queue(self.max_queue)
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        self.ensure_running()
+        try:
+            self._queue.put_nowait((fn, args, kwargs))
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"{self.name} queue full, dropped {getattr(fn, '__name__', 'task')}")
+
+    def every(self, interval, fn, name=None):
+        """Run fn every `interval` seconds once the worker is running."""
+        with self._lock:
+            self._jobs.append({"name": name or fn.__name__, "interval": interval, "fn": fn, "next": time.monotonic() + interval})
+
+    def _call(self, fn, args, kwargs, name):
+        try:
+            fn(*args, **kwargs)
+            self.completed += 1
+        except Exception:
+            self.failed += 1
+            logger.exception(f"Background task {name} failed")
+
+    def _run(self):
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                jobs = list(self._jobs)
+            timeout = min([job["next"] for job in jobs], default=now + 1.0) - now
+            try:
+                fn, args, kwargs = self._queue.get(timeout=max(0.0, timeout))
+                self._call(fn, args, kwargs, getattr(fn, '__name__', 'task'))
+            except queue.Empty:
+                pass
+            now = time.monotonic()
+            for job in jobs:
+                if job["next"] <= now:
+                    job["next"] = now + job["interval"]
+                    self._call(job["fn"], (), {}, job["name"])
+
+    def stats(self):
+        return {
+            "queueDepth": self._queue.qsize(),
+            "completed": self.completed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "jobs": [job["name"] for job in self._jobs]
+        }
+
+
+# Two lanes, so a feed rebuild or a moderation batch never holds up the short,
+# latency-sensitive tasks (view and notification flushes, small writes) queued behind it
+worker = BackgroundWorker('background', Config.BACKGROUND_QUEUE_SIZE)
+heavy_worker = BackgroundWorker('background-heavy', Config.BACKGROUND_HEAVY_QUEUE_SIZE)
+
+
+def ensure_running():
+    worker.ensure_running()
+    heavy_worker.ensure_running()
+
+
+def submit(fn, *args, **kwargs):
+    worker.submit(fn, *args, **kwargs)
+
+
+def submit_heavy(fn, *args, **kwargs):
+    """Queue slow work (model inference, feed rebuilds, index updates) on the heavy lane."""
+    heavy_worker.submit(fn, *args, **kwargs)
+
+
+def every(interval, fn, name=None, heavy=False):
+    (heavy_worker if heavy else worker).every(interval, fn, name)
+
+
+def queue_depth():
+    return worker.stats()["queueDepth"] + heavy_worker.stats()["queueDepth"]
+
+
+def stats():
+    return dict(worker.stats(), heavy=heavy_worker.stats())
+
+
+metrics.register('background', stats)
@@ -0,0 +1,182 @@
+import time
+import logging
+import threading
+from functools import wraps
+from collections import OrderedDict
+from flask import current_app, request, Response
+from app import metrics
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend:
+    """
+    Storage interface behind Cache. MemoryBackend keeps entries in this process;
+    a shared store (Redis, memcached) only has to implement these methods.
+    """
+
+    def get(self, key):
+        """Return (found, value)."""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None, tags=()):
+        raise NotImplementedError
+
+    def invalidate_tags(self, tags):
+        """Drop every entry stored with any of the tags. Returns the number dropped."""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+class MemoryBackend(CacheBackend):
+    """
+    Size-bounded LRU with per-entry TTL and tag index.
+
+    Args:
+        max_entries: Least recently used entries are evicted beyond this many
+    """
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._tags = {}
+        self.evictions = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+        return True
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value, _ = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl=None, tags=()):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (expires_at, value, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_tags(self, tags):
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys |= self._tags.get(tag, set())
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "tags": len(self._tags), "evictions": self.evictions}
+
+
+class Cache:
+    """Read-through cache with per-name hit ratios, used by the hot read endpoints."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def _count(self, name, hit):
+        with self._lock:
+            counters = self._counters.setdefault(name, {"hits": 0, "misses": 0})
+            counters["hits" if hit else "misses"] += 1
+
+    def get_or_set(self, name, key, compute, ttl=None, tags=()):
+        """Return the cached value for key, or compute(), store and return it."""
+        found, value = self.backend.get(key)
+        self._count(name, found)
+        if found:
+            return value
+        value = compute()
+        self.backend.set(key, value, ttl, tags)
+        return value
+
+    def cached(self, name, ttl, tags=None):
+        """
+        Decorator caching a view's 200 responses per URL (path and query string).
+
+        Args:
+            name: Name the hit ratio is reported under
+            ttl: Seconds an entry lives
+            tags: Optional callable taking the view's kwargs and returning the tags
+                the entry is invalidated by
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                key = f"{name}:{request.full_path}"
+                found, value = self.backend.get(key)
+                self._count(name, found)
+                if found:
+                    data, mimetype = value
+                    return Response(data, status=200, mimetype=mimetype)
+                response = current_app.make_response(view(**kwargs))
+                if response.status_code == 200:
+                    self.backend.set(key, (response.get_data(), response.mimetype), ttl, tags(**kwargs) if tags else ())
+                return response
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        try:
+            return self.backend.invalidate_tags(tags)
+        except Exception as e:
+            logger.warning(f"Cache invalidation of {tags} failed: {str(e)}")
+            return 0
+
+    def stats(self):
+        with self._lock:
+            endpoints = {
+                name: dict(c, hitRatio=round(c["hits"] / (c["hits"] + c["misses"]), 3) if c["hits"] + c["misses"] else 0.0)
+                for name, c in self._counters.items()
+            }
+        return {"backend": self.backend.stats(), "endpoints": endpoints}
+
+
+cache = Cache(MemoryBackend(Config.CACHE_MAX_ENTRIES))
+
+
+def cached(name, ttl, tags=None):
+    return cache.cached(name, ttl, tags)
+
+
+def invalidate(*tags):
+    return cache.invalidate(*tags)
+
+
+metrics.register('cache', cache.stats)
@@ -5,4 +5,145 @@ load_dotenv()
 
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY')
-    MONGO_URI = os.getenv('MONGO_URI')
\ No newline at end of file
+    MONGO_URI = os.getenv('MONGO_URI')
+    # Reverse proxies in front of the app (the application gateway) whose
+    # X-Forwarded-For entry is trusted for request.remote_addr; 0 without one
+    PROXY_COUNT = int(os.getenv('PROXY_COUNT', 1))
+    # Bearer token for /admin/metrics and /admin/startup; unset, they only answer local requests
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+    # Question embedding index used for similar-question lookup
+    VECTOR_INDEX_PATH = os.getenv('VECTOR_INDEX_PATH', os.path.expanduser('~/.cache/asksphere/question_index.npz'))
+    VECTOR_INDEX_FLUSH_EVERY = int(os.getenv('VECTOR_INDEX_FLUSH_EVERY', 20))
+    # Seconds between checks for questions indexed by other worker processes
+    VECTOR_INDEX_SYNC_INTERVAL = int(os.getenv('VECTOR_INDEX_SYNC_INTERVAL', 15))
+
+    # Micro-batching inference worker shared by the toxicity and relevance checks
+    INFERENCE_BATCH_WINDOW_MS = float(os.getenv('INFERENCE_BATCH_WINDOW_MS', 5))
+    INFERENCE_MAX_BATCH = int(os.getenv('INFERENCE_MAX_BATCH', 32))
+    INFERENCE_TIMEOUT = float(os.getenv('INFERENCE_TIMEOUT', 5))
+    # When inference times out: True lets the post through unchecked, False rejects it with a 503
+    INFERENCE_FAIL_OPEN = os.getenv('INFERENCE_FAIL_OPEN', 'false').lower() == 'true'
+
+    # Toxicity score cache shared by all workers on the host
+    SCORE_CACHE_PATH = os.getenv('SCORE_CACHE_PATH', os.path.expanduser('~/.cache/asksphere/score_cache.sqlite3'))
+    SCORE_CACHE_MAX_ENTRIES = int(os.getenv('SCORE_CACHE_MAX_ENTRIES', 10000))
+    SCORE_CACHE_TTL = int(os.getenv('SCORE_CACHE_TTL', 7 * 24 * 3600))
+
+    # Inference backend for Detoxify and MiniLM: eager, quantized (dynamic int8) or onnx
+    INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'eager')
+    ONNX_MODEL_DIR = os.getenv('ONNX_MODEL_DIR', os.path.expanduser('~/.cache/asksphere/onnx'))
+
+    # Chat interactions older than this are removed by a TTL index
+    CHAT_INTERACTIONS_TTL_DAYS = int(os.getenv('CHAT_INTERACTIONS_TTL_DAYS', 90))
+
+    # Reputation an author gains or loses per vote on their questions and answers
+    VOTE_REPUTATION_UP = int(os.getenv('VOTE_REPUTATION_UP', 10))
+    VOTE_REPUTATION_DOWN = int(os.getenv('VOTE_REPUTATION_DOWN', -2))
+    # Most votes accepted by one POST /votes/bulk request
+    VOTE_BULK_MAX = int(os.getenv('VOTE_BULK_MAX', 100))
+
+    # Most items checked by one POST /validate-content/batch request
+    VALIDATE_BATCH_MAX = int(os.getenv('VALIDATE_BATCH_MAX', 32))
+
+    # Write-behind question view counter: flush period, buffered views that force an
+    # early flush, the most views held while writes fail (the most a crash can lose;
+    # past it views are dropped), and per-visitor dedup window
+    VIEW_FLUSH_INTERVAL = float(os.getenv('VIEW_FLUSH_INTERVAL', 5))
+    VIEW_MAX_PENDING = int(os.getenv('VIEW_MAX_PENDING', 1000))
+    VIEW_MAX_BUFFERED = int(os.getenv('VIEW_MAX_BUFFERED', 10000))
+    VIEW_DEDUP_WINDOW = int(os.getenv('VIEW_DEDUP_WINDOW', 1800))
+    VIEW_DEDUP_CAPACITY = int(os.getenv('VIEW_DEDUP_CAPACITY', 100000))
+    VIEW_DEDUP_ERROR_RATE = float(os.getenv('VIEW_DEDUP_ERROR_RATE', 0.01))
+
+    # Notification dispatcher: batch size, flush period, in-memory queue bound
+    # (beyond it events go straight to the outbox) and outbox retry period
+    NOTIFICATION_BATCH_SIZE = int(os.getenv('NOTIFICATION_BATCH_SIZE', 200))
+    NOTIFICATION_FLUSH_INTERVAL = float(os.getenv('NOTIFICATION_FLUSH_INTERVAL', 1))
+    NOTIFICATION_MAX_QUEUED = int(os.getenv('NOTIFICATION_MAX_QUEUED', 5000))
+    NOTIFICATION_OUTBOX_INTERVAL = float(os.getenv('NOTIFICATION_OUTBOX_INTERVAL', 30))
+
+    # Server-sent notification streams: open streams per user and per worker process,
+    # idle heartbeat interval and the reconnect delay suggested to browsers
+    SSE_MAX_CONNECTIONS_PER_USER = int(os.getenv('SSE_MAX_CONNECTIONS_PER_USER', 3))
+    SSE_MAX_CONNECTIONS = int(os.getenv('SSE_MAX_CONNECTIONS', 1000))
+    SSE_HEARTBEAT_SECONDS = float(os.getenv('SSE_HEARTBEAT_SECONDS', 15))
+    SSE_RETRY_MS = int(os.getenv('SSE_RETRY_MS', 3000))
+
+    # Support chatbot intents, and the MiniLM fallback for queries no rule matches
+    CHAT_INTENTS_PATH = os.getenv('CHAT_INTENTS_PATH', os.path.join(os.path.dirname(__file__), 'intents.json'))
+    CHAT_EMBEDDING_FALLBACK = os.getenv('CHAT_EMBEDDING_FALLBACK', 'true').lower() == 'true'
+    CHAT_EMBEDDING_THRESHOLD = float(os.getenv('CHAT_EMBEDDING_THRESHOLD', 0.6))
+
+    # Recommended-questions feed: size, candidate pool, recency half-life, how often
+    # the periodic job rebuilds feeds and how long a read feed is cached per process
+    FEED_SIZE = int(os.getenv('FEED_SIZE', 20))
+    FEED_CANDIDATES = int(os.getenv('FEED_CANDIDATES', 300))
+    FEED_CANDIDATE_DAYS = int(os.getenv('FEED_CANDIDATE_DAYS', 30))
+    FEED_HALF_LIFE_HOURS = float(os.getenv('FEED_HALF_LIFE_HOURS', 48))
+    FEED_REFRESH_INTERVAL = int(os.getenv('FEED_REFRESH_INTERVAL', 900))
+    FEED_REFRESH_BATCH = int(os.getenv('FEED_REFRESH_BATCH', 100))
+    FEED_INACTIVE_DAYS = int(os.getenv('FEED_INACTIVE_DAYS', 14))
+    FEED_CACHE_TTL = int(os.getenv('FEED_CACHE_TTL', 60))
+    FEED_CACHE_MAX_USERS = int(os.getenv('FEED_CACHE_MAX_USERS', 10000))
+
+    # In-process response cache for hot read endpoints (app/cache.py)
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 5000))
+    CACHE_USER_TTL = int(os.getenv('CACHE_USER_TTL', 300))
+    CACHE_QUESTION_TTL = int(os.getenv('CACHE_QUESTION_TTL', 30))
+    CACHE_BADGE_COUNTS_TTL = int(os.getenv('CACHE_BADGE_COUNTS_TTL', 300))
+
+    # Flask-Login user loader: seconds the projected user document is reused across
+    # requests, and how often expired community bans are lifted in the background
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 30))
+    BAN_EXPIRY_INTERVAL = int(os.getenv('BAN_EXPIRY_INTERVAL', 300))
+
+    # Avatars: thumbnail edge lengths in pixels (the first is the default size served),
+    # WebP quality and the largest upload, in pixels, that is decoded at all
+    AVATAR_SIZES = tuple(int(size) for size in os.getenv('AVATAR_SIZES', '256,64').split(','))
+    AVATAR_QUALITY = int(os.getenv('AVATAR_QUALITY', 85))
+    AVATAR_MAX_PIXELS = int(os.getenv('AVATAR_MAX_PIXELS', 25000000))
+    # Thumbnails kept in memory by each process, in their own LRU so they never evict
+    # the JSON responses of app/cache.py, and for how many seconds
+    AVATAR_CACHE_MAX_ENTRIES = int(os.getenv('AVATAR_CACHE_MAX_ENTRIES', 500))
+    AVATAR_CACHE_TTL = int(os.getenv('AVATAR_CACHE_TTL', 3600))
+
+    # Strike and ban escalation rules applied by the moderation engine (app/moderation.py)
+    MODERATION_RULES_PATH = os.getenv('MODERATION_RULES_PATH', os.path.join(os.path.dirname(__file__), 'moderation_rules.json'))
+
+    # Publish-then-moderate: when enabled, posts by members above their community's
+    # trust threshold (moderation_rules.json) are stored at once and checked by a
+    # background job every MODERATION_QUEUE_INTERVAL seconds, BATCH posts at a time
+    MODERATION_ASYNC = os.getenv('MODERATION_ASYNC', 'false').lower() == 'true'
+    MODERATION_QUEUE_INTERVAL = int(os.getenv('MODERATION_QUEUE_INTERVAL', 5))
+    MODERATION_QUEUE_BATCH = int(os.getenv('MODERATION_QUEUE_BATCH', 32))
+    MODERATION_QUEUE_LEASE = int(os.getenv('MODERATION_QUEUE_LEASE', 120))
+
+    # Long posts are scored as overlapping windows of words (app/segmentation.py):
+    # window length, overlap, the most windows scored per post, and whether a post's
+    # relevance is the mean or the max over its windows
+    SEGMENT_WINDOW_WORDS = int(os.getenv('SEGMENT_WINDOW_WORDS', 180))
+    SEGMENT_OVERLAP_WORDS = int(os.getenv('SEGMENT_OVERLAP_WORDS', 30))
+    SEGMENT_MAX_WINDOWS = int(os.getenv('SEGMENT_MAX_WINDOWS', 8))
+    RELEVANCE_AGGREGATE = os.getenv('RELEVANCE_AGGREGATE', 'mean')
+
+    # Staged startup (app/startup.py): how long to keep retrying Mongo before the
+    # process reports itself failed, whether to run a warm-up batch through the models
+    # and how long that first (slow) pass may take
+    STARTUP_MONGO_TIMEOUT = int(os.getenv('STARTUP_MONGO_TIMEOUT', 60))
+    STARTUP_WARMUP = os.getenv('STARTUP_WARMUP', 'true').lower() == 'true'
+    STARTUP_WARMUP_TIMEOUT = float(os.getenv('STARTUP_WARMUP_TIMEOUT', 300))
+
+    # Password hashing (app/passwords.py): bcrypt cost for new hashes (older ones are
+    # re-hashed at login), the threads dedicated to hashing, how many hashes may wait
+    # for them before requests get 429, and how long a request waits before a 503
+    BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+    PASSWORD_HASH_QUEUE = int(os.getenv('PASSWORD_HASH_QUEUE', 32))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 5))
+
+    # Background workers (app/background.py): most tasks waiting on the fast lane
+    # (flushes, small writes) and on the heavy lane (feeds, moderation, index
+    # updates, rollups); tasks submitted past these are dropped
+    BACKGROUND_QUEUE_SIZE = int(os.getenv('BACKGROUND_QUEUE_SIZE', 10000))
+    BACKGROUND_HEAVY_QUEUE_SIZE = int(os.getenv('BACKGROUND_HEAVY_QUEUE_SIZE', 5000))
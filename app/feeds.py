@@ -0,0 +1,217 @@
+import math
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+from bson import ObjectId
+from pymongo import ReturnDocument
+from app import background, moderation
+from app.config import Config
+from app.models import get_community_validator
+
+logger = logging.getLogger(__name__)
+
+# recommended_feeds holds one precomputed feed per member:
+#   {"_id": memberId, "questions": [{"questionId", "title", "dateCreated", "memberId", "user", "rank"}],
+#    "builtAt", "stale", "lastReadAt", "leaseUntil"}
+
+# Relative weight of each signal; the sum is then decayed by question age
+FEED_WEIGHTS = {
+    "score": 1.0,
+    "answers": 0.5,
+    "similarity": 2.0
+}
+
+CANDIDATE_PROJECTION = {"title": 1, "memberId": 1, "dateCreated": 1, "score": 1, "answers": 1, "communityId": 1}
+
+
+def _profile_vector(db, member_id):
+    """Mean embedding of the member's recent questions, or None if they have not asked any."""
+    own = [str(q["_id"]) for q in db.questions.find({"memberId": member_id}, {"_id": 1}).sort("dateCreated", -1).limit(20)]
+    if not own:
+        return None
+    _, matrix = get_community_validator(db).question_index.vectors(own)
+    if matrix is None:
+        return None
+    profile = matrix.mean(axis=0)
+    norm = np.linalg.norm(profile)
+    return profile / norm if norm else None
+
+
+def rank_candidates(candidates, similarities, now):
+    """Rank = (1 + weighted score, answer and similarity signals) * 0.5 ** (age / half-life)."""
+    ranked = []
+    for question, similarity in zip(candidates, similarities):
+        age_hours = max(0.0, (now - question["dateCreated"]).total_seconds() / 3600)
+        signal = (
+            1.0
+            + FEED_WEIGHTS["score"] * math.log1p(max(question.get("score", 0), 0))
+            + FEED_WEIGHTS["answers"] * math.log1p(max(question.get("answers", 0), 0))
+            + FEED_WEIGHTS["similarity"] * max(float(similarity), 0.0)
+        )
+        ranked.append((signal * 0.5 ** (age_hours / Config.FEED_HALF_LIFE_HOURS), question))
+    ranked.sort(key=lambda pair: pair[0], reverse=True)
+    return ranked
+
+
+def build_feed(db, member_id, now=None):
+    """Rank candidate questions from the member's communities and store the top FEED_SIZE."""
+    now = now or datetime.utcnow()
+    member_id = ObjectId(member_id)
+    community_ids = [mc["communityId"] for mc in db.member_communities.find({"memberId": member_id}, {"communityId": 1})]
+
+    questions = []
+    if community_ids:
+        # Recent questions plus the best ever, so quiet communities still fill the feed
+        query = dict(moderation.RECOMMENDABLE, communityId={"$in": community_ids}, memberId={"$ne": member_id})
+        recent = db.questions.find(
+            dict(query, dateCreated={"$gte": now - timedelta(days=Config.FEED_CANDIDATE_DAYS)}), CANDIDATE_PROJECTION
+        ).sort("dateCreated", -1).limit(Config.FEED_CANDIDATES)
+        best = db.questions.find(query, CANDIDATE_PROJECTION).sort("score", -1).limit(Config.FEED_SIZE)
+        candidates = list({q["_id"]: q for q in list(recent) + list(best)}.values())
+
+        similarities = np.zeros(len(candidates), dtype=np.float32)
+        profile = _profile_vector(db, member_id)
+        if profile is not None and candidates:
+            found, matrix = get_community_validator(db).question_index.vectors([q["_id"] for q in candidates])
+            if matrix is not None:
+                found_scores = dict(zip(found, matrix @ profile))
+                similarities = [found_scores.get(str(q["_id"]), 0.0) for q in candidates]
+
+        top = rank_candidates(candidates, similarities, now)[:Config.FEED_SIZE]
+        usernames = {
+            u["_id"]: u["username"]
+            for u in db.users.find({"_id": {"$in": list({q["memberId"] for _, q in top})}}, {"username": 1})
+        }
+        questions = [{
+            "questionId": q["_id"],
+            "title": q["title"],
+            "dateCreated": q["dateCreated"],
+            "memberId": q["memberId"],
+            "user": usernames.get(q["memberId"], "Unknown"),
+            "rank": round(rank, 6)
+        } for rank, q in top]
+
+    feed = {"questions": questions, "builtAt": now, "stale": False}
+    db.recommended_feeds.update_one({"_id": member_id}, {"$set": feed, "$unset": {"leaseUntil": ""}}, upsert=True)
+    _cache_drop(member_id)
+    return feed
+
+
+# Per-process cache of feed documents: member_id -> (expires_at, feed)
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _cache_get(member_id):
+    with _cache_lock:
+        entry = _cache.get(member_id)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        _cache.pop(member_id, None)
+        return None
+
+
+def _cache_put(member_id, feed):
+    with _cache_lock:
+        if len(_cache) >= Config.FEED_CACHE_MAX_USERS:
+            _cache.pop(next(iter(_cache)))
+        _cache[member_id] = (time.monotonic() + Config.FEED_CACHE_TTL, feed)
+
+
+def _cache_drop(member_id):
+    with _cache_lock:
+        _cache.pop(member_id, None)
+
+
+def _fallback_feed(db, member_id):
+    """Top questions by score from the member's communities, used until their feed has been built."""
+    community_ids = [mc["communityId"] for mc in db.member_communities.find({"memberId": member_id}, {"communityId": 1})]
+    if not community_ids:
+        return []
+    query = dict(moderation.RECOMMENDABLE, communityId={"$in": community_ids})
+    questions = list(db.questions.find(query, CANDIDATE_PROJECTION)
+                     .sort([("score", -1), ("dateCreated", -1)]).limit(Config.FEED_SIZE))
+    usernames = {
+        u["_id"]: u["username"]
+        for u in db.users.find({"_id": {"$in": list({q["memberId"] for q in questions})}}, {"username": 1})
+    }
+    return [{
+        "questionId": q["_id"],
+        "title": q["title"],
+        "dateCreated": q["dateCreated"],
+        "memberId": q["memberId"],
+        "user": usernames.get(q["memberId"], "Unknown")
+    } for q in questions]
+
+
+def get_feed(db, member_id, limit):
+    """
+    The member's precomputed feed. Served from the per-process cache when fresh;
+    a missing or stale feed is rebuilt in the background while the caller gets
+    the fallback ranking or the previous feed.
+    """
+    member_id = ObjectId(member_id)
+    feed = _cache_get(member_id)
+    if feed is None:
+        feed = db.recommended_feeds.find_one_and_update(
+            {"_id": member_id},
+            {"$set": {"lastReadAt": datetime.utcnow()}},
+            projection={"questions": 1, "stale": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if feed is None or feed.get("stale"):
+            background.submit_heavy(build_feed, db, member_id)
+        if feed is None:
+            return _fallback_feed(db, member_id)[:limit]
+        _cache_put(member_id, feed)
+    return feed["questions"][:limit]
+
+
+def invalidate(db, member_id):
+    """Called after the member's own activity changes what their feed should contain."""
+    member_id = ObjectId(member_id)
+    _cache_drop(member_id)
+    background.submit_heavy(build_feed, db, member_id)
+
+
+def remove_question(db, question_id):
+    """Drop a deleted question from every stored feed."""
+    question_id = ObjectId(question_id)
+    db.recommended_feeds.update_many({"questions.questionId": question_id}, {"$pull": {"questions": {"questionId": question_id}}})
+    with _cache_lock:
+        _cache.clear()
+
+
+def refresh_feeds(db):
+    """
+    Periodic job: rebuild stale or old feeds of members who read theirs recently.
+    Each feed is leased before it is rebuilt, so several workers running this job
+    do not build the same feed twice.
+    """
+    now = datetime.utcnow()
+    query = {
+        "lastReadAt": {"$gte": now - timedelta(days=Config.FEED_INACTIVE_DAYS)},
+        "$or": [{"stale": True}, {"builtAt": {"$lt": now - timedelta(seconds=Config.FEED_REFRESH_INTERVAL)}}],
+        "leaseUntil": {"$not": {"$gt": now}}
+    }
+    built = 0
+    for _ in range(Config.FEED_REFRESH_BATCH):
+        feed = db.recommended_feeds.find_one_and_update(
+            query,
+            {"$set": {"leaseUntil": now + timedelta(minutes=5)}},
+            projection={"_id": 1},
+            sort=[("builtAt", 1)]
+        )
+        if feed is None:
+            break
+        build_feed(db, feed["_id"], now)
+        built += 1
+    if built:
+        logger.info(f"Rebuilt {built} recommended feeds")
+    return built
+
+
+def schedule(db):
+    background.every(Config.FEED_REFRESH_INTERVAL, lambda: refresh_feeds(db), 'refresh_feeds', heavy=True)
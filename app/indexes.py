@@ -0,0 +1,137 @@
+import logging
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Every index the routes rely on. ensure_indexes() creates them at startup and
+# `python manage.py indexes report` compares them with what the server has.
+INDEXES = [
+    {"collection": "users", "name": "username_unique", "keys": [("username", ASCENDING)], "options": {"unique": True}},
+    {"collection": "users", "name": "email_unique", "keys": [("email", ASCENDING)], "options": {"unique": True}},
+    # Members with a running ban, by when the earliest one expires (user_loader.expire_bans)
+    {"collection": "users", "name": "banExpiresAt", "keys": [("banExpiresAt", ASCENDING)],
+     "options": {"partialFilterExpression": {"banExpiresAt": {"$type": "date"}}}},
+
+    {"collection": "questions", "name": "community_dateCreated", "keys": [("communityId", ASCENDING), ("dateCreated", DESCENDING), ("_id", DESCENDING)]},
+    {"collection": "questions", "name": "dateCreated", "keys": [("dateCreated", DESCENDING), ("_id", DESCENDING)]},
+    {"collection": "questions", "name": "score", "keys": [("score", DESCENDING), ("_id", DESCENDING)]},
+    {"collection": "questions", "name": "views", "keys": [("views", DESCENDING), ("_id", DESCENDING)]},
+    {"collection": "questions", "name": "member_dateCreated", "keys": [("memberId", ASCENDING), ("dateCreated", DESCENDING)]},
+    # Questions upserted into the vector index since a given version (QuestionIndex.sync)
+    {"collection": "questions", "name": "indexVersion", "keys": [("indexVersion", ASCENDING)],
+     "options": {"partialFilterExpression": {"indexVersion": {"$exists": True}}}},
+    {"collection": "questions", "name": "tags_dateCreated", "keys": [("tags", ASCENDING), ("dateCreated", DESCENDING), ("_id", DESCENDING)]},
+
+    # The publish-then-moderate queue: only pending posts are indexed
+    {"collection": "questions", "name": "moderation_pending", "keys": [("moderation", ASCENDING), ("dateCreated", ASCENDING)],
+     "options": {"partialFilterExpression": {"moderation": "pending"}}},
+
+    {"collection": "answers", "name": "questionId", "keys": [("questionId", ASCENDING)]},
+    {"collection": "answers", "name": "member_dateCreated", "keys": [("memberId", ASCENDING), ("dateCreated", DESCENDING)]},
+    {"collection": "answers", "name": "moderation_pending", "keys": [("moderation", ASCENDING), ("dateCreated", ASCENDING)],
+     "options": {"partialFilterExpression": {"moderation": "pending"}}},
+
+    # One vote per member and target; the vote engine relies on these to make upserts race-free.
+    # Run `python manage.py votes reconcile` first if older data has duplicates.
+    {"collection": "votes", "name": "member_question_unique", "keys": [("memberId", ASCENDING), ("questionId", ASCENDING)],
+     "options": {"unique": True, "partialFilterExpression": {"questionId": {"$exists": True}}}},
+    {"collection": "votes", "name": "member_answer_unique", "keys": [("memberId", ASCENDING), ("answerId", ASCENDING)],
+     "options": {"unique": True, "partialFilterExpression": {"answerId": {"$exists": True}}}},
+    {"collection": "votes", "name": "member_date", "keys": [("memberId", ASCENDING), ("date", DESCENDING)]},
+    {"collection": "votes", "name": "questionId", "keys": [("questionId", ASCENDING)]},
+    {"collection": "votes", "name": "answerId", "keys": [("answerId", ASCENDING)]},
+
+    {"collection": "member_communities", "name": "member_community_unique", "keys": [("memberId", ASCENDING), ("communityId", ASCENDING)], "options": {"unique": True}},
+    {"collection": "member_communities", "name": "community_dateJoined", "keys": [("communityId", ASCENDING), ("dateJoined", DESCENDING)]},
+
+    {"collection": "notifications", "name": "member_createdAt", "keys": [("memberId", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)]},
+    {"collection": "notifications", "name": "member_read", "keys": [("memberId", ASCENDING), ("read", ASCENDING)]},
+    # At most one unread collapsed notification ("X and 4 others upvoted ...") per member and key
+    {"collection": "notifications", "name": "member_collapseKey_unread", "keys": [("memberId", ASCENDING), ("collapseKey", ASCENDING)],
+     "options": {"unique": True, "partialFilterExpression": {"collapseKey": {"$exists": True}, "read": False}}},
+
+    {"collection": "recommended_feeds", "name": "questions_questionId", "keys": [("questions.questionId", ASCENDING)]},
+    {"collection": "recommended_feeds", "name": "lastReadAt_builtAt", "keys": [("lastReadAt", ASCENDING), ("builtAt", ASCENDING)]},
+
+    {"collection": "inappropriate_content", "name": "member_community", "keys": [("memberId", ASCENDING), ("communityId", ASCENDING)]},
+
+    # GridFS's own indexes on the avatar bucket, under the names the driver gives them
+    {"collection": "avatars.files", "name": "filename_1_uploadDate_1", "keys": [("filename", ASCENDING), ("uploadDate", ASCENDING)]},
+    {"collection": "avatars.chunks", "name": "files_id_1_n_1", "keys": [("files_id", ASCENDING), ("n", ASCENDING)], "options": {"unique": True}},
+
+    {"collection": "chat_interactions", "name": "timestamp_ttl", "keys": [("timestamp", ASCENDING)], "options": {"expireAfterSeconds": Config.CHAT_INTERACTIONS_TTL_DAYS * 24 * 3600}},
+]
+
+# Indexes earlier versions created and nothing reads any more; ensure_indexes drops
+# them so writes stop paying for their upkeep. (collection, name)
+RETIRED_INDEXES = [
+    # Superseded by the unique member_question_unique and member_answer_unique
+    ("votes", "member_question"),
+    ("votes", "member_answer"),
+]
+
+# Error code for dropping an index that does not exist
+INDEX_NOT_FOUND = 27
+
+
+def drop_retired_indexes(db):
+    """Drop the RETIRED_INDEXES still present. Returns the names dropped."""
+    dropped = []
+    for collection, name in RETIRED_INDEXES:
+        try:
+            db[collection].drop_index(name)
+            dropped.append(f"{collection}.{name}")
+        except OperationFailure as e:
+            if e.code != INDEX_NOT_FOUND and "not found" not in str(e):
+                logger.warning(f"Could not drop retired index {collection}.{name}: {str(e)}")
+    if dropped:
+        logger.info(f"Dropped retired indexes: {', '.join(dropped)}")
+    return dropped
+
+
+def ensure_indexes(db):
+    """
+    Create every declared index and drop the retired ones. Safe to run on every
+    startup: existing identical indexes are a no-op, and a conflicting or failing
+    index is logged and skipped.
+
+    Returns:
+        List of index names that could not be created
+    """
+    drop_retired_indexes(db)
+    failed = []
+    for spec in INDEXES:
+        try:
+            db[spec["collection"]].create_index(spec["keys"], name=spec["name"], **spec.get("options", {}))
+        except OperationFailure as e:
+            logger.warning(f"Could not create index {spec['collection']}.{spec['name']}: {str(e)}")
+            failed.append(f"{spec['collection']}.{spec['name']}")
+    return failed
+
+
+def report(db):
+    """
+    Compare declared indexes with the server's, using $indexStats for usage.
+
+    Returns:
+        Dict with missing (declared but absent), unused (no accesses since the
+        server started tracking) and undeclared (present but not in INDEXES) index names
+    """
+    result = {"missing": [], "unused": [], "undeclared": []}
+    declared = {}
+    for spec in INDEXES:
+        declared.setdefault(spec["collection"], set()).add(spec["name"])
+
+    for collection, names in declared.items():
+        existing = set(db[collection].index_information())
+        result["missing"].extend(f"{collection}.{name}" for name in sorted(names - existing))
+        result["undeclared"].extend(f"{collection}.{name}" for name in sorted(existing - names - {"_id_"}))
+        try:
+            for stats in db[collection].aggregate([{"$indexStats": {}}]):
+                if stats["name"] != "_id_" and stats["accesses"]["ops"] == 0:
+                    result["unused"].append(f"{collection}.{stats['name']} (since {stats['accesses']['since'].isoformat()})")
+        except OperationFailure as e:
+            logger.warning(f"$indexStats unavailable for {collection}: {str(e)}")
+    return result
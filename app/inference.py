@@ -0,0 +1,162 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import numpy as np
+from app import metrics, model_registry
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceUnavailable(Exception):
+    pass
+
+
+def run_blocking(fn, *args):
+    """
+    Call fn directly, or in gevent's native thread pool when gevent has patched
+    threading (gunicorn gevent workers), so a forward pass does not stall every
+    other greenlet in the worker while it runs.
+    """
+    try:
+        from gevent import monkey, get_hub
+    except ImportError:
+        return fn(*args)
+    if not monkey.is_module_patched('threading'):
+        return fn(*args)
+    return get_hub().threadpool.apply(fn, args)
+
+
+class MicroBatcher:
+    """
+    Collects single-item requests for a few milliseconds and runs them as one batch.
+
+    A dedicated worker thread owns the model calls, so request threads only wait
+    on futures. PyTorch releases the GIL inside its kernels, which leaves the
+    server threads free while a batch runs.
+
+    Args:
+        name: Name used in logs and metrics
+        run_batch: Callable taking a list of items and returning one result per item
+        max_batch_size: Upper bound on items per forward pass
+        max_wait_ms: How long the worker waits for more items after the first one arrives
+    """
+
+    def __init__(self, name, run_batch, max_batch_size, max_wait_ms):
+        self.name = name
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.batches = 0
+        self.items = 0
+        self.failures = 0
+
+    def _ensure_started(self):
+        # Threads do not survive fork, so start (again) in whichever process submits
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name=f"inference-{self.name}", daemon=True)
+                self._thread.start()
+
+    def submit(self, item):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # Requests whose caller already gave up are dropped before the forward pass
+        return [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                continue
+            try:
+                results = run_blocking(self.run_batch, [item for item, _ in batch])
+            except Exception as e:
+                logger.exception(f"Inference batch {self.name} failed")
+                self.failures += 1
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def map(self, items, timeout=None):
+        """Submit every item and wait for all results, raising InferenceUnavailable on timeout."""
+        futures = [self.submit(item) for item in items]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            return [
+                future.result(timeout=None if deadline is None else max(0, deadline - time.monotonic()))
+                for future in futures
+            ]
+        except FutureTimeoutError:
+            for future in futures:
+                future.cancel()
+            raise InferenceUnavailable(f"{self.name} inference timed out after {timeout}s")
+
+    def stats(self):
+        return {
+            "queueDepth": self._queue.qsize(),
+            "batches": self.batches,
+            "items": self.items,
+            "failures": self.failures,
+            "avgBatchSize": round(self.items / self.batches, 2) if self.batches else 0
+        }
+
+
+def _predict_toxicity(texts):
+    results = model_registry.get_detoxify().predict(texts)
+    return [{label: float(scores[i]) for label, scores in results.items()} for i in range(len(texts))]
+
+
+def _encode(texts):
+    return list(model_registry.get_sentence_model().encode(texts, convert_to_numpy=True, normalize_embeddings=True))
+
+
+toxicity_batcher = MicroBatcher('toxicity', _predict_toxicity, Config.INFERENCE_MAX_BATCH, Config.INFERENCE_BATCH_WINDOW_MS)
+embedding_batcher = MicroBatcher('embedding', _encode, Config.INFERENCE_MAX_BATCH, Config.INFERENCE_BATCH_WINDOW_MS)
+
+
+def score_toxicity(texts, timeout=Config.INFERENCE_TIMEOUT):
+    """Return one {label: score} dict per text."""
+    return toxicity_batcher.map(texts, timeout)
+
+
+def embed(texts, timeout=Config.INFERENCE_TIMEOUT):
+    """Return normalized embeddings as an (n, dim) array."""
+    return np.vstack(embedding_batcher.map(texts, timeout))
+
+
+metrics.register('inference', lambda: {
+    "failOpen": Config.INFERENCE_FAIL_OPEN,
+    "toxicity": toxicity_batcher.stats(),
+    "embedding": embedding_batcher.stats()
+})
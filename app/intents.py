@@ -0,0 +1,126 @@
+import re
+import json
+import logging
+import threading
+import numpy as np
+from app.config import Config
+from app.inference import InferenceUnavailable
+
+logger = logging.getLogger(__name__)
+
+
+class IntentEngine:
+    """
+    Rule-based intent matcher for the support chatbot, built from intents.json.
+
+    Each intent fires when a word or phrase from its `first` list is followed,
+    anywhere later in the query, by one from its `then` list; intents are tried
+    in file order. All terms are compiled into one regex, so the query is scanned
+    once and the intents are then checked from the term positions found.
+
+    When no rule fires and an `embed` callable is given, the query is compared
+    with each intent's `examples` and the closest intent above `threshold` wins.
+
+    Args:
+        intents: List of dicts with name, first, then, response and optional examples
+        fallback: Response when nothing matches
+        embed: Optional callable returning normalized embeddings for a list of texts
+        threshold: Minimum cosine similarity for an embedding match
+    """
+
+    def __init__(self, intents, fallback, embed=None, threshold=0.6):
+        self.intents = intents
+        self.fallback = fallback
+        self.embed = embed
+        self.threshold = threshold
+        self._responses = {intent["name"]: intent["response"] for intent in intents}
+        # term -> [(intent index, is_first)]; phrases are keyed with single spaces ("look at")
+        self._roles = {}
+        for index, intent in enumerate(intents):
+            for terms, is_first in ((intent["first"], True), (intent["then"], False)):
+                for term in terms:
+                    self._roles.setdefault(" ".join(term.lower().split()), []).append((index, is_first))
+        # Every term of every intent in one alternation, longest first so phrases win
+        alternatives = sorted(self._roles, key=len, reverse=True)
+        self._matcher = re.compile(r'\b(?:' + '|'.join(r'\s+'.join(map(re.escape, t.split())) for t in alternatives) + r')\b')
+        self._lock = threading.Lock()
+        self._examples = None
+
+    @classmethod
+    def from_file(cls, path, embed=None, threshold=0.6):
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+        return cls(config["intents"], config["fallback"], embed, threshold)
+
+    def match_rules(self, query):
+        # Earliest end of a `first` term and latest start of a `then` term, per intent
+        first_end = {}
+        then_start = {}
+        for match in self._matcher.finditer(query.lower()):
+            for index, is_first in self._roles[" ".join(match.group().split())]:
+                if is_first:
+                    if index not in first_end:
+                        first_end[index] = match.end()
+                else:
+                    then_start[index] = match.start()
+        for index in sorted(first_end):
+            if then_start.get(index, -1) >= first_end[index]:
+                return self.intents[index]["name"]
+        return None
+
+    def _example_matrix(self):
+        with self._lock:
+            if self._examples is None:
+                owners = [intent["name"] for intent in self.intents for _ in intent.get("examples", [])]
+                texts = [text for intent in self.intents for text in intent.get("examples", [])]
+                matrix = np.asarray(self.embed(texts), dtype=np.float32) if texts else None
+                self._examples = (owners, matrix)
+            return self._examples
+
+    def match_embedding(self, query):
+        owners, matrix = self._example_matrix()
+        if matrix is None:
+            return None, 0.0
+        scores = matrix @ np.asarray(self.embed([query]), dtype=np.float32)[0]
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None, float(scores[best])
+        return owners[best], float(scores[best])
+
+    def match(self, query):
+        """
+        Returns:
+            (intent name or None, response, matchedBy) where matchedBy is
+            'rules', 'embedding' or None
+        """
+        name = self.match_rules(query)
+        if name:
+            return name, self._responses[name], 'rules'
+        if self.embed is not None:
+            try:
+                name, score = self.match_embedding(query)
+            except InferenceUnavailable as e:
+                logger.warning(f"Chat embedding fallback unavailable: {str(e)}")
+                name = None
+            if name:
+                logger.debug(f"Embedding fallback matched '{name}' ({score:.2f})")
+                return name, self._responses[name], 'embedding'
+        return None, self.fallback, None
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                embed = None
+                if Config.CHAT_EMBEDDING_FALLBACK:
+                    # Shares the MiniLM model and micro-batcher with the relevance checks
+                    from app import inference
+                    embed = inference.embed
+                _engine = IntentEngine.from_file(Config.CHAT_INTENTS_PATH, embed, Config.CHAT_EMBEDDING_THRESHOLD)
+    return _engine
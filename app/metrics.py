@@ -0,0 +1,27 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+_sources = {}
+
+
+def register(name, source):
+    """
+    Register a callable whose return value is reported under `name` by /admin/metrics.
+
+    Args:
+        name: Key of the section in the metrics snapshot
+        source: Zero-argument callable returning a JSON-serializable dict
+    """
+    _sources[name] = source
+
+
+def snapshot():
+    report = {}
+    for name, source in _sources.items():
+        try:
+            report[name] = source()
+        except Exception as e:
+            logger.warning(f"Metrics source {name} failed: {str(e)}")
+            report[name] = {"error": str(e)}
+    return report
@@ -0,0 +1,108 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+from app import metrics
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+MINILM_SNAPSHOT_PATH = '/root/.cache/huggingface/hub/models--sentence-transformers--all-MiniLM-L6-v2/snapshots/c9745ed1d9f207416be6d2e6f8de32d1f16199bf'
+
+_loaders = {}
+_versions = {}
+_locks = {}
+_models = {}
+_stats = {}
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+            # Peak RSS in KB on Linux; the best available approximation elsewhere
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except ImportError:
+            return 0
+
+
+def register(name, loader, version):
+    _loaders[name] = loader
+    _versions[name] = version
+    _locks[name] = threading.Lock()
+
+
+def get(name):
+    """Return the shared instance of a model, loading it on first use."""
+    model = _models.get(name)
+    if model is not None:
+        return model
+    with _locks[name]:
+        if name not in _models:
+            rss_before = _rss_bytes()
+            start = time.perf_counter()
+            _models[name] = _loaders[name]()
+            load_seconds = time.perf_counter() - start
+            _stats[name] = {
+                "loadSeconds": round(load_seconds, 3),
+                "rssDeltaMB": round((_rss_bytes() - rss_before) / (1024 * 1024), 1),
+                "loadedAt": datetime.utcnow().isoformat(),
+                "pid": os.getpid()
+            }
+            logger.info(f"Loaded model {name} in {load_seconds:.2f}s")
+    return _models[name]
+
+
+def version(name):
+    """Identifier of the weights behind a model, used to key cached scores."""
+    return _versions[name]
+
+
+def preload(names=None):
+    """Load models eagerly, e.g. in the gunicorn master so forked workers share the pages."""
+    for name in names or list(_loaders):
+        get(name)
+
+
+def stats():
+    return {
+        "backend": Config.INFERENCE_BACKEND,
+        "rssMB": round(_rss_bytes() / (1024 * 1024), 1),
+        "models": {
+            name: _stats.get(name, {"loaded": False}) for name in _loaders
+        }
+    }
+
+
+def _load_detoxify():
+    from app.models import load_toxicity_model
+    # Determine checkpoint path based on environment
+    base_path = os.path.join(os.path.dirname(__file__), '..', 'model_cache', 'torch', 'checkpoints')
+    if os.name == 'nt':  # Windows
+        base_path = os.path.normpath(base_path)
+    else:  # Linux/container
+        base_path = '/root/.cache/torch/hub/checkpoints'
+    checkpoint_path = os.path.join(base_path, 'toxic_original-c1212f89.ckpt')
+    return load_toxicity_model(Config.INFERENCE_BACKEND, checkpoint_path)
+
+
+def _load_minilm():
+    from app.models import load_sentence_model
+    return load_sentence_model(Config.INFERENCE_BACKEND, MINILM_SNAPSHOT_PATH, 'all-MiniLM-L6-v2', '/root/.cache/huggingface/hub')
+
+
+def get_detoxify():
+    return get('detoxify')
+
+
+def get_sentence_model():
+    return get('minilm')
+
+
+register('detoxify', _load_detoxify, f"detoxify-original-c1212f89-{Config.INFERENCE_BACKEND}")
+register('minilm', _load_minilm, f"all-MiniLM-L6-v2-c9745ed1-{Config.INFERENCE_BACKEND}")
+metrics.register('models', stats)
@@ -1,16 +1,45 @@
 from flask_login import UserMixin
 from datetime import datetime, timedelta
 from bson import ObjectId
-from detoxify import Detoxify
-from sentence_transformers import SentenceTransformer, util
 import os
+import json
+import logging
+import threading
+import numpy as np
+from app.config import Config
+from app import background, inference, notifications, moderation, segmentation
+from app.cache import cache
+from pymongo import ReturnDocument
+from app.inference import InferenceUnavailable
+from app.vector_index import QuestionIndex
+
+logger = logging.getLogger(__name__)
+
+_communities = None
+
+def load_communities(db):
+    """
+    All communities keyed by _id. They are seeded by init_db and never change at
+    runtime, so each process reads the collection once and serves it from memory.
+    """
+    global _communities
+    if _communities is None:
+        _communities = {c["_id"]: c for c in db.communities.find().sort("_id", 1)}
+    return _communities
+
+def community_name(db, community_id):
+    community = load_communities(db).get(int(community_id))
+    return community["name"] if community else ""
+
+# 1x1 transparent PNG shown until a user uploads an avatar
+DEFAULT_AVATAR = "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
 
 class User:
     def __init__(self, id, username, password, avatar=None):
         self.id = id
         self.username = username
         self.password = password
-        self.avatar = avatar if avatar else "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
+        self.avatar = avatar if avatar else DEFAULT_AVATAR
 
 class Notification:
     def __init__(self, id, memberId, message, type, relatedId=None, read=False, createdAt=None, communityId=None):
@@ -34,7 +63,7 @@ class Member(UserMixin):
         self.status = status
         self.restrictionLevel = restrictionLevel
         self.badges = badges if badges else []
-        self.avatar = avatar if avatar else "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
+        self.avatar = avatar if avatar else DEFAULT_AVATAR
         self.community_interactions = community_interactions if community_interactions else {}
         self.community_bans = community_bans if community_bans else {}
 
@@ -84,12 +113,16 @@ class Member(UserMixin):
         return self.reputation
 
     def awardBadge(self, badge, db):
-        if badge not in self.badges:
-            self.badges.append(badge)
-            db.users.update_one(
-                {"_id": ObjectId(self.id)},
-                {"$set": {"badges": self.badges}}
-            )
+        if badge in self.badges:
+            return
+        self.badges.append(badge)
+        # $addToSet so two requests racing to award the same badge only notify once
+        result = db.users.update_one(
+            {"_id": ObjectId(self.id)},
+            {"$addToSet": {"badges": badge}}
+        )
+        if result.modified_count:
+            cache.invalidate("badges", f"user:{self.id}")
             self.createNotification(
                 message=f"You earned a new badge: {badge}!",
                 type="badge",
@@ -98,32 +131,28 @@ class Member(UserMixin):
             )
 
     def trackInteraction(self, communityId, interaction_type, db):
-        if str(communityId) not in self.community_interactions:
-            self.community_interactions[str(communityId)] = {
-                "questions": 0,
-                "answers": 0,
-                "votes": 0,
-                "total": 0
-            }
-
-        self.community_interactions[str(communityId)][interaction_type] += 1
-        self.community_interactions[str(communityId)]["total"] += 1
-
-        db.users.update_one(
+        key = f"community_interactions.{str(communityId)}"
+        # Atomic $inc instead of read-modify-write, returning the new counters
+        user = db.users.find_one_and_update(
             {"_id": ObjectId(self.id)},
-            {"$set": {f"community_interactions.{str(communityId)}": self.community_interactions[str(communityId)]}}
+            {"$inc": {f"{key}.{interaction_type}": 1, f"{key}.total": 1}},
+            projection={key: 1},
+            return_document=ReturnDocument.AFTER
         )
+        if not user:
+            return
+        counts = user.get("community_interactions", {}).get(str(communityId), {})
+        self.community_interactions[str(communityId)] = counts
 
-        community_name = db.communities.find_one({"_id": int(communityId)})["name"]
-        badge_prefix = self.getBadgePrefix(community_name)
+        badge_prefix = self.getBadgePrefix(community_name(db, communityId))
 
-        if self.community_interactions[str(communityId)]["total"] >= 10:
+        if counts.get("total", 0) >= 10:
             self.awardBadge(f"{badge_prefix} Top Contributor", db)
 
-        if self.community_interactions[str(communityId)]["questions"] >= 5:
+        if counts.get("questions", 0) >= 5:
             self.awardBadge(f"{badge_prefix} Asker", db)
 
-        if self.community_interactions[str(communityId)]["answers"] >= 5:
+        if counts.get("answers", 0) >= 5:
             self.awardBadge(f"{badge_prefix} Questioner", db)
 
     def getBadgePrefix(self, community_name):
@@ -138,25 +167,8 @@ class Member(UserMixin):
         return badge_mapping.get(community_name, "Member")
 
     def createNotification(self, message, type, relatedId, db, communityId=None):
-        notification = Notification(
-            id=None,
-            memberId=ObjectId(self.id),
-            message=message,
-            type=type,
-            relatedId=relatedId,
-            read=False,
-            createdAt=datetime.utcnow(),
-            communityId=communityId
-        )
-        db.notifications.insert_one({
-            "memberId": notification.memberId,
-            "message": notification.message,
-            "type": notification.type,
-            "relatedId": relatedId,
-            "read": notification.read,
-            "createdAt": notification.createdAt,
-            "communityId": notification.communityId
-        })
+        # Queued; the notification dispatcher writes it in the next batch
+        notifications.notify(db, self.id, message, type, relatedId, communityId)
 
 class Community:
     def __init__(self, id, name, description):
@@ -224,83 +236,115 @@ class Member_Community:
             "communityId": communityId
         })
 
+INFERENCE_BACKENDS = ('eager', 'quantized', 'onnx')
+
+def _onnx_session(model_dir):
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        raise RuntimeError("INFERENCE_BACKEND=onnx requires the onnxruntime package")
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(os.path.join(model_dir, 'model.onnx'), options, providers=['CPUExecutionProvider'])
+
+def _onnx_feeds(session, inputs):
+    names = {i.name for i in session.get_inputs()}
+    return {name: value.astype(np.int64) for name, value in inputs.items() if name in names}
+
+class OnnxToxicityModel:
+    """Detoxify classifier exported by export_onnx.py, with the same predict() output as Detoxify."""
+
+    def __init__(self, model_dir):
+        from transformers import AutoTokenizer
+        with open(os.path.join(model_dir, 'asksphere.json')) as f:
+            self.class_names = json.load(f)['class_names']
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = _onnx_session(model_dir)
+
+    def predict(self, text):
+        texts = [text] if isinstance(text, str) else list(text)
+        inputs = self.tokenizer(texts, return_tensors='np', truncation=True, padding=True)
+        logits = self.session.run(None, _onnx_feeds(self.session, inputs))[0]
+        scores = 1 / (1 + np.exp(-logits))
+        if isinstance(text, str):
+            return {name: float(scores[0][i]) for i, name in enumerate(self.class_names)}
+        return {name: scores[:, i].tolist() for i, name in enumerate(self.class_names)}
+
+class OnnxSentenceEncoder:
+    """MiniLM transformer exported by export_onnx.py plus mean pooling, mirroring SentenceTransformer.encode()."""
+
+    def __init__(self, model_dir):
+        from transformers import AutoTokenizer
+        with open(os.path.join(model_dir, 'asksphere.json')) as f:
+            config = json.load(f)
+        self.max_seq_length = config['max_seq_length']
+        self.normalize = config['normalize']
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = _onnx_session(model_dir)
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, convert_to_tensor=False, normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            inputs = self.tokenizer(texts[start:start + batch_size], return_tensors='np', truncation=True, padding=True, max_length=self.max_seq_length)
+            token_embeddings = self.session.run(None, _onnx_feeds(self.session, inputs))[0]
+            mask = inputs['attention_mask'][..., None].astype(np.float32)
+            batches.append((token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None))
+        embeddings = np.vstack(batches).astype(np.float32) if batches else np.zeros((0, 384), dtype=np.float32)
+        if normalize_embeddings or self.normalize:
+            embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        if convert_to_tensor:
+            import torch
+            embeddings = torch.from_numpy(embeddings)
+        return embeddings[0] if single else embeddings
+
+def _quantize(module):
+    import torch
+    return torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+
+def load_toxicity_model(backend, checkpoint_path):
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend}, expected one of {', '.join(INFERENCE_BACKENDS)}")
+    if backend == 'onnx':
+        return OnnxToxicityModel(os.path.join(Config.ONNX_MODEL_DIR, 'detoxify'))
+    from detoxify import Detoxify
+    model = Detoxify('original', checkpoint=checkpoint_path)
+    if backend == 'quantized':
+        model.model = _quantize(model.model)
+    return model
+
+def load_sentence_model(backend, model_path, fallback_name, cache_folder):
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend}, expected one of {', '.join(INFERENCE_BACKENDS)}")
+    if backend == 'onnx':
+        return OnnxSentenceEncoder(os.path.join(Config.ONNX_MODEL_DIR, 'minilm'))
+    from sentence_transformers import SentenceTransformer
+    try:
+        model = SentenceTransformer(model_path)
+    except Exception as e:
+        logger.warning(f"Failed to load cached model at {model_path}: {str(e)}")
+        logger.warning(f"Falling back to downloading {fallback_name}")
+        model = SentenceTransformer(fallback_name, cache_folder=cache_folder)
+    if backend == 'quantized':
+        model = _quantize(model)
+    return model
+
 class AIContentFilter:
     def __init__(self, modelVersion="1.0"):
-        # Determine checkpoint path based on environment
-        base_path = os.path.join(os.path.dirname(__file__), '..', 'model_cache', 'torch', 'checkpoints')
-        if os.name == 'nt':  # Windows
-            base_path = os.path.normpath(base_path)
-        else:  # Linux/container
-            base_path = '/root/.cache/torch/hub/checkpoints'
-        checkpoint_path = os.path.join(base_path, 'toxic_original-c1212f89.ckpt')
-        self.model = Detoxify('original', checkpoint=checkpoint_path)
-        
-    def filterContent(self, content, memberId, questionId, answerId, communityId, db):
-        print(f"Filtering content: {content}")
-        print(f"MemberId: {memberId}, QuestionId: {questionId}, AnswerId: {answerId}, CommunityId: {communityId}")
-        try:
-            results = self.model.predict(content)
-            print(f"Detoxify results: {results}")
-            toxicity_score = results['toxicity']
-            
-            if toxicity_score > 0.5:
-                keys = [key for key, value in results.items() if value > 0.5 and key != 'toxicity']
-                print(f"Inappropriate content detected. Keys: {keys}")
-                db.inappropriate_content.insert_one({
-                    "content": content,
-                    "memberId": memberId,
-                    "communityId": communityId,
-                    "questionId": questionId,
-                    "answerId": answerId,
-                    "timestamp": datetime.utcnow(),
-                    "keys": keys or ["toxicity"],
-                    "isProcessed": False
-                })
-                user = db.users.find_one({"_id": memberId})
-                restriction_level = (user.get('restrictionLevel', 0) or 0) + 1
-                db.users.update_one(
-                    {"_id": memberId},
-                    {"$set": {"restrictionLevel": restriction_level}}
-                )
-                attempts_left = 5 - restriction_level
-                feedback = f"You have {attempts_left} attempts left before a ban in community {communityId}."
-                if attempts_left <= 2 and attempts_left > 0:
-                    feedback = f"Warning: You will be banned from this community if you reach 5 inappropriate attempts ({attempts_left} attempts left)."
-                elif attempts_left <= 0:
-                    ban_duration_days = 1
-                    ban_expires = datetime.utcnow() + timedelta(days=ban_duration_days)
-                    db.community_bans.insert_one({
-                        "memberId": memberId,
-                        "communityId": communityId,
-                        "startDate": datetime.utcnow(),
-                        "expiresAt": ban_expires,
-                        "reason": "Exceeded inappropriate content attempts"
-                    })
-                    db.inappropriate_content.delete_many({
-                        "memberId": memberId,
-                        "communityId": communityId
-                    })
-                    feedback = f"You have been banned from this community for {ban_duration_days} day(s). Ban expires on {ban_expires.isoformat()}."
-                    db.users.update_one(
-                        {"_id": memberId},
-                        {"$set": {"restrictionLevel": 0}}
-                    )
-                
-                db.notifications.insert_one({
-                    "memberId": memberId,
-                    "type": "inappropriate",
-                    "message": feedback,
-                    "isRead": False,
-                    "createdAt": datetime.utcnow(),
-                    "communityId": communityId
-                })
-                return content, feedback
+        self.modelVersion = modelVersion
 
+    def filterContent(self, content, memberId, questionId, answerId, communityId, db):
+        """
+        Returns (content, feedback); feedback is None unless the content was
+        flagged, in which case the strike has been applied by the moderation engine.
+        """
+        keys = moderation.check(content)
+        if keys is None:
             return content, None
-
-        except Exception as e:
-            print(f"Error in filterContent: {str(e)}")
-            raise e
+        logger.info(f"Inappropriate content detected. Keys: {keys}")
+        outcome = moderation.record_flag(db, moderation.flag(memberId, communityId, content, keys, questionId, answerId))
+        return content, outcome["feedback"] if outcome else "Content flagged as inappropriate"
 
     def reportUser(self, memberId, reason, db):
         db.moderation_logs.insert_one({
@@ -314,86 +358,175 @@ class AIContentFilter:
             {"_id": memberId},
             {"$set": {"restrictionLevel": days}}
         )
+        cache.invalidate(f"user:{memberId}")
 
     def banMember(self, memberId, db):
         db.users.update_one(
             {"_id": memberId},
             {"$set": {"status": "banned"}}
         )
+        cache.invalidate(f"user:{memberId}")
+
+_community_validator = None
+_community_validator_lock = None
+# Only guards creating the lock above; never held across I/O
+_lock_guard = threading.Lock()
+
+def _validator_lock():
+    # Created on first use rather than at import, so that under gevent (which may
+    # patch threading after a preloaded import) it is a lock greenlets can wait on
+    # while the holder blocks on Mongo or the encoder
+    global _community_validator_lock
+    with _lock_guard:
+        if _community_validator_lock is None:
+            _community_validator_lock = threading.Lock()
+    return _community_validator_lock
+
+def get_community_validator(db):
+    """The process-wide CommunityValidator, so every caller shares one question index."""
+    global _community_validator
+    if _community_validator is None:
+        with _validator_lock():
+            if _community_validator is None:
+                _community_validator = CommunityValidator(db)
+                # Picks up questions other worker processes indexed
+                background.every(Config.VECTOR_INDEX_SYNC_INTERVAL, _community_validator.question_index.sync, 'sync_question_index', heavy=True)
+    return _community_validator
 
 class CommunityValidator:
     def __init__(self, db):
-        model_path = '/root/.cache/huggingface/hub/models--sentence-transformers--all-MiniLM-L6-v2/snapshots/c9745ed1d9f207416be6d2e6f8de32d1f16199bf'
-        try:
-            self.model = SentenceTransformer(model_path)
-        except Exception as e:
-            print(f"Failed to load cached model at {model_path}: {str(e)}")
-            print("Falling back to downloading all-MiniLM-L6-v2")
-            self.model = SentenceTransformer('all-MiniLM-L6-v2', cache_folder='/root/.cache/huggingface/hub')
         self.db = db
-        self.description_embeddings = {}
+        self.question_index = QuestionIndex(
+            db, self._encode, Config.VECTOR_INDEX_PATH, Config.VECTOR_INDEX_FLUSH_EVERY, query=moderation.RECOMMENDABLE
+        )
         self.community_info = {}
-        communities = self.db.communities.find()
-        for community in communities:
+        self.community_ids = []
+        descriptions = []
+        for community in self.db.communities.find():
             community_id = str(community['_id'])
-            description = community['description']
-            self.description_embeddings[community_id] = self.model.encode(description, convert_to_tensor=True)
+            self.community_ids.append(community_id)
+            descriptions.append(community['description'])
             self.community_info[community_id] = {
                 "name": community['name'],
-                "description": description
+                "description": community['description']
             }
+        self.community_rows = {community_id: row for row, community_id in enumerate(self.community_ids)}
+        # Normalized (communities x dim) matrix: scoring against every community is a single matmul
+        self.description_matrix = self._encode(descriptions) if descriptions else None
+
+    def _encode(self, texts):
+        # Through the embedding batcher, so under gevent the forward pass runs off the hub;
+        # no timeout, since an index rebuild encodes every question
+        return inference.embed(texts, timeout=None)
 
     def validate_content(self, content, community_id):
-        content_embedding = self.model.encode(content, convert_to_tensor=True)
-        community_id_str = str(community_id)
-        if community_id_str not in self.description_embeddings:
-            return None
-
-        description_embedding = self.description_embeddings[community_id_str]
-        similarity_score = util.cos_sim(content_embedding, description_embedding)[0][0].item()
-        threshold = 0.10
-        is_relevant = similarity_score >= threshold
-
-        print(f"Content: {content}")
-        print(f"Target Community ID: {community_id_str}, Name: {self.community_info[community_id_str]['name']}, Description: {self.community_info[community_id_str]['description']}")
-        print(f"Similarity Score: {similarity_score}, Threshold: {threshold}, Is Relevant: {is_relevant}")
-
-        best_community = None
-        best_score = similarity_score
-        for comm_id, desc_embedding in self.description_embeddings.items():
-            score = util.cos_sim(content_embedding, desc_embedding)[0][0].item()
-            print(f"Community ID: {comm_id}, Name: {self.community_info[comm_id]['name']}, Score: {score}")
-            if score > best_score:
-                best_score = score
-                best_community = comm_id
-
-        suggested_community = None
-        if not is_relevant and best_community and best_community != community_id_str:
-            suggested_community = {
-                "id": int(best_community),
-                "name": self.community_info[best_community]["name"],
-                "similarity_score": best_score
+        return self.validate_many([content], [community_id])[0]
+
+    def validate_many(self, contents, community_ids, threshold=0.10):
+        """
+        Score a batch of texts against their target communities in one forward pass.
+
+        Args:
+            contents: List of texts to validate
+            community_ids: Target community ID for each text
+            threshold: Minimum similarity for a text to be relevant to its community
+
+        Returns:
+            One result dict per text, or None where the community does not exist
+        """
+        if self.description_matrix is None or not contents:
+            return [None] * len(contents)
+
+        # Long texts are embedded as overlapping windows, all in one forward pass
+        windows, slices = segmentation.segment_many(list(contents))
+        try:
+            window_embeddings = inference.embed(windows)
+        except InferenceUnavailable:
+            if not Config.INFERENCE_FAIL_OPEN:
+                raise
+            logger.warning("Relevance check timed out, letting content through unchecked")
+            return [self._unchecked_result() if str(community_id) in self.community_rows else None for community_id in community_ids]
+
+        window_scores = window_embeddings @ self.description_matrix.T
+        aggregate = np.max if Config.RELEVANCE_AGGREGATE == 'max' else np.mean
+        scores = np.vstack([aggregate(window_scores[part], axis=0) for part in slices])
+        content_embeddings = [segmentation.mean_embedding(window_embeddings[part]) for part in slices]
+        best_rows = scores.argmax(axis=1)
+        ranked_rows = np.argsort(-scores, axis=1)
+
+        results = []
+        searches = []
+        for i, community_id in enumerate(community_ids):
+            community_id_str = str(community_id)
+            row = self.community_rows.get(community_id_str)
+            if row is None:
+                results.append(None)
+                continue
+
+            similarity_score = float(scores[i, row])
+            is_relevant = similarity_score >= threshold
+            logger.debug(f"Target Community ID: {community_id_str}, Name: {self.community_info[community_id_str]['name']}, Similarity Score: {similarity_score}, Threshold: {threshold}, Is Relevant: {is_relevant}")
+
+            best_community = self.community_ids[best_rows[i]]
+            suggested_community = None
+            if not is_relevant and best_community != community_id_str:
+                suggested_community = {
+                    "id": int(best_community),
+                    "name": self.community_info[best_community]["name"],
+                    "similarity_score": float(scores[i, best_rows[i]])
+                }
+
+            community_ranking = [
+                {
+                    "id": int(self.community_ids[r]),
+                    "name": self.community_info[self.community_ids[r]]["name"],
+                    "similarity_score": float(scores[i, r])
+                }
+                for r in ranked_rows[i].tolist()
+            ]
+
+            result = {
+                "is_relevant": is_relevant,
+                "similarity_score": similarity_score,
+                "suggested_community": suggested_community,
+                "community_ranking": community_ranking,
+                "similar_questions": []
             }
+            if is_relevant:
+                matches = self.question_index.search(community_id, content_embeddings[i], top_k=3, threshold=0.3)
+                searches.append((result, matches))
+            results.append(result)
 
-        similar_questions = []
-        if is_relevant:
-            questions = self.db.questions.find({"communityId": int(community_id)})
-            for question in questions:
-                question_text = question["title"] + " " + question["content"]
-                question_embedding = self.model.encode(question_text, convert_to_tensor=True)
-                question_score = util.cos_sim(content_embedding, question_embedding)[0][0].item()
-                if question_score >= 0.3:
-                    similar_questions.append({
-                        "id": str(question["_id"]),
+        self._attach_similar_questions(searches)
+        return results
+
+    def _unchecked_result(self):
+        return {
+            "is_relevant": True,
+            "similarity_score": None,
+            "suggested_community": None,
+            "community_ranking": [],
+            "similar_questions": []
+        }
+
+    def _attach_similar_questions(self, searches):
+        question_ids = {qid for _, matches in searches for qid, _ in matches}
+        if not question_ids:
+            return
+        questions = {
+            str(q["_id"]): q
+            for q in self.db.questions.find(
+                {"_id": {"$in": [ObjectId(qid) for qid in question_ids]}},
+                {"title": 1, "content": 1}
+            )
+        }
+        for result, matches in searches:
+            for qid, question_score in matches:
+                question = questions.get(qid)
+                if question:
+                    result["similar_questions"].append({
+                        "id": qid,
                         "title": question["title"],
                         "content": question["content"],
                         "similarity_score": question_score
                     })
-            similar_questions = sorted(similar_questions, key=lambda x: x["similarity_score"], reverse=True)[:3]
-
-        return {
-            "is_relevant": is_relevant,
-            "similarity_score": similarity_score,
-            "suggested_community": suggested_community,
-            "similar_questions": similar_questions
-        }
\ No newline at end of file
@@ -0,0 +1,268 @@
+import json
+import logging
+import threading
+from datetime import datetime
+from pymongo import InsertOne, ReturnDocument, UpdateOne
+from app import notifications, score_cache
+from app.cache import cache
+from app.config import Config
+from app.inference import InferenceUnavailable
+
+logger = logging.getLogger(__name__)
+
+# Strikes and bans are kept per community on the user document:
+#   users.community_bans.<communityId> = {"strikes", "status", "ban_count", "duration_days", "expiration"}
+# restrictionLevel is the member's total of outstanding strikes. Every flagged post
+# is also recorded in inappropriate_content with the action it triggered.
+# users.banExpiresAt is the earliest expiration of the member's running bans (null
+# when none); it is indexed so the expiry job only reads members with a ban to lift.
+
+# Moderation state of a post published before it was checked (app/moderation_queue.py):
+#   "pending"   stored and shown, not checked yet
+#   "approved"  nothing wrong with it
+#   "flagged"   off-topic for its community; stays visible, the author is told where it fits
+#   "hidden"    toxic; the author gets a strike and read endpoints skip it
+# Posts checked before they were stored have no moderation field.
+PENDING = "pending"
+APPROVED = "approved"
+FLAGGED = "flagged"
+HIDDEN = "hidden"
+
+VISIBLE = {"moderation": {"$ne": HIDDEN}}
+# Recommendations (question index, feeds) wait until a post has been checked
+RECOMMENDABLE = {"moderation": {"$nin": [PENDING, HIDDEN]}}
+
+_rules = None
+_rules_lock = threading.Lock()
+
+
+def load_rules(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def get_rules():
+    global _rules
+    if _rules is None:
+        with _rules_lock:
+            if _rules is None:
+                _rules = load_rules(Config.MODERATION_RULES_PATH)
+    return _rules
+
+
+def check(content, rules=None):
+    """
+    Score content with Detoxify.
+
+    Returns:
+        The flagged categories, or None when the content passes (or could not be
+        scored and INFERENCE_FAIL_OPEN is set)
+    """
+    rules = rules or get_rules()
+    try:
+        results = score_cache.toxicity_scores(content)
+    except InferenceUnavailable:
+        if not Config.INFERENCE_FAIL_OPEN:
+            raise
+        logger.warning("Toxicity check timed out, letting content through unchecked")
+        return None
+    if results['toxicity'] <= rules["toxicityThreshold"]:
+        return None
+    return [key for key, value in results.items() if value > rules["categoryThreshold"] and key != 'toxicity'] or ["toxicity"]
+
+
+def flag(member_id, community_id, content, keys, question_id=None, answer_id=None):
+    return {
+        "memberId": member_id,
+        "communityId": community_id,
+        "content": content,
+        "keys": keys,
+        "questionId": question_id,
+        "answerId": answer_id
+    }
+
+
+def ban_expires_at():
+    """Aggregation expression for banExpiresAt: the earliest running ban's expiration, or null."""
+    return {"$min": {"$map": {
+        "input": {"$filter": {
+            "input": {"$objectToArray": {"$ifNull": ["$community_bans", {}]}},
+            "as": "ban",
+            "cond": {"$and": [
+                {"$eq": ["$$ban.v.status", "banned"]},
+                {"$eq": [{"$type": "$$ban.v.expiration"}, "date"]}
+            ]}
+        }},
+        "as": "ban",
+        "in": "$$ban.v.expiration"
+    }}}
+
+
+def backfill_ban_expiry(db):
+    """Set banExpiresAt on users banned before the field existed. Returns the number updated."""
+    result = db.users.update_many(
+        {"community_bans": {"$exists": True}, "banExpiresAt": {"$exists": False}},
+        [{"$set": {"banExpiresAt": ban_expires_at()}}]
+    )
+    return result.modified_count
+
+
+def _strike_pipeline(community_id, rules, now):
+    """
+    One strike in the community, escalated to a ban in the same update once the
+    member reaches strikesBeforeBan. The nth ban lasts banDays[n - 1] days (the
+    last entry once the list runs out) and resets the community's strikes.
+    """
+    key = f"community_bans.{community_id}"
+    days = rules["banDays"]
+    level = {"$add": [{"$ifNull": ["$restrictionLevel", 0]}, 1]}
+    return [
+        {"$set": {
+            "_strikes": {"$add": [{"$ifNull": [f"${key}.strikes", 0]}, 1]},
+            "_bans": {"$ifNull": [f"${key}.ban_count", 0]}
+        }},
+        {"$set": {
+            "_banned": {"$gte": ["$_strikes", rules["strikesBeforeBan"]]},
+            "_days": {"$arrayElemAt": [{"$literal": days}, {"$min": ["$_bans", len(days) - 1]}]}
+        }},
+        {"$set": {
+            key: {"$cond": [
+                "$_banned",
+                {
+                    "status": "banned",
+                    "strikes": 0,
+                    "ban_count": {"$add": ["$_bans", 1]},
+                    "duration_days": "$_days",
+                    "expiration": {"$add": [now, {"$multiply": ["$_days", 24 * 3600 * 1000]}]}
+                },
+                {"$mergeObjects": [{"$ifNull": [f"${key}", {}]}, {"strikes": "$_strikes"}]}
+            ]},
+            "restrictionLevel": {"$cond": ["$_banned", {"$max": [0, {"$subtract": [level, "$_strikes"]}]}, level]}
+        }},
+        {"$set": {"banExpiresAt": ban_expires_at()}},
+        {"$unset": ["_strikes", "_bans", "_banned", "_days"]}
+    ]
+
+
+def feedback(outcome, community_id, rules):
+    if outcome["action"] == "ban":
+        return (f"You have been banned from this community for {outcome['banDays']} day(s). "
+                f"Ban expires on {outcome['expiresAt'].isoformat()}.")
+    if outcome["action"] == "warning":
+        return (f"Warning: You will be banned from this community if you reach {rules['strikesBeforeBan']} "
+                f"inappropriate attempts ({outcome['strikesLeft']} attempts left).")
+    return f"You have {outcome['strikesLeft']} attempts left before a ban in community {community_id}."
+
+
+def apply(db, events, rules=None, now=None):
+    """
+    Apply flagged posts: one find_one_and_update per flag counts the strike and
+    escalates to a ban, then one bulk_write stores every flag's record. The
+    member is notified through the batched dispatcher.
+
+    Returns:
+        One outcome per event, in order: {action, strikes, strikesLeft, banDays,
+        expiresAt, feedback}, or None for a member that no longer exists
+    """
+    rules = rules or get_rules()
+    now = now or datetime.utcnow()
+    outcomes = []
+    records = []
+    for event in events:
+        key = str(event["communityId"])
+        user = db.users.find_one_and_update(
+            {"_id": event["memberId"]},
+            _strike_pipeline(key, rules, now),
+            projection={f"community_bans.{key}": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if user is None:
+            outcomes.append(None)
+            continue
+        state = user.get("community_bans", {}).get(key, {})
+        strikes_left = rules["strikesBeforeBan"] - state.get("strikes", 0)
+        if state.get("strikes") == 0 and state.get("status") == "banned":
+            outcome = {"action": "ban", "strikes": rules["strikesBeforeBan"], "strikesLeft": 0,
+                       "banDays": state["duration_days"], "expiresAt": state["expiration"]}
+        else:
+            outcome = {"action": "warning" if strikes_left <= rules["warnAtStrikesLeft"] else "strike",
+                       "strikes": state.get("strikes", 0), "strikesLeft": strikes_left, "banDays": None, "expiresAt": None}
+        outcome["feedback"] = feedback(outcome, event["communityId"], rules)
+        outcomes.append(outcome)
+
+        records.append(InsertOne(dict(
+            event,
+            action=outcome["action"],
+            strikes=outcome["strikes"],
+            banDays=outcome["banDays"],
+            expiresAt=outcome["expiresAt"],
+            timestamp=now,
+            isProcessed=False
+        )))
+        cache.invalidate(f"user:{event['memberId']}")
+        notifications.notify(db, event["memberId"], outcome["feedback"], "inappropriate", community_id=event["communityId"])
+
+    if records:
+        db.inappropriate_content.bulk_write(records, ordered=False)
+    return outcomes
+
+
+def record_flag(db, event):
+    return apply(db, [event])[0]
+
+
+def active_ban(member, community_id, now=None):
+    """Expiration of the member's ban in the community, or None when they may post there."""
+    ban_info = member.community_bans.get(str(community_id), {})
+    if isinstance(ban_info, dict) and ban_info.get('status') == "banned":
+        expiration = ban_info.get('expiration')
+        if expiration and (now or datetime.utcnow()) < expiration:
+            return expiration
+    return None
+
+
+def migrate_legacy_bans(db, now=None):
+    """
+    Copy bans from the community_bans collection, where the routes kept them
+    before bans moved onto the user document, into users.community_bans, then
+    drop the collection. Bans still running are carried over; every legacy ban
+    counts towards ban_count so the next one escalates.
+
+    Returns:
+        Number of users updated
+    """
+    now = now or datetime.utcnow()
+    if "community_bans" not in db.list_collection_names():
+        return 0
+    groups = db.community_bans.aggregate([{"$group": {
+        "_id": {"memberId": "$memberId", "communityId": "$communityId"},
+        "bans": {"$sum": 1},
+        "startDate": {"$max": "$startDate"},
+        "expiresAt": {"$max": "$expiresAt"}
+    }}])
+    updates = []
+    members = []
+    for group in groups:
+        member_id, community_id = group["_id"]["memberId"], str(group["_id"]["communityId"])
+        user = db.users.find_one({"_id": member_id}, {f"community_bans.{community_id}": 1})
+        if user is None:
+            continue
+        state = user.get("community_bans", {}).get(community_id)
+        state = dict(state) if isinstance(state, dict) else {}
+        state["ban_count"] = max(state.get("ban_count", 0), group["bans"])
+        expires_at = group["expiresAt"]
+        if expires_at and expires_at > now and expires_at > (state.get("expiration") or now):
+            state.update(status="banned", expiration=expires_at)
+            if group["startDate"]:
+                state["duration_days"] = max(1, round((expires_at - group["startDate"]).total_seconds() / 86400))
+        updates.append(UpdateOne({"_id": member_id}, {"$set": {f"community_bans.{community_id}": state}}))
+        members.append(member_id)
+    if updates:
+        db.users.bulk_write(updates, ordered=False)
+        db.users.update_many(
+            {"_id": {"$in": members}},
+            [{"$set": {"banExpiresAt": ban_expires_at()}}]
+        )
+    db.community_bans.drop()
+    logger.info(f"Migrated legacy community bans of {len(updates)} users")
+    return len(updates)
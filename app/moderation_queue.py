@@ -0,0 +1,204 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import UpdateOne
+from app import background, feeds, metrics, moderation, notifications, rollups, score_cache
+from app.cache import cache
+from app.config import Config
+from app.inference import InferenceUnavailable
+from app.models import AIContentFilter, get_community_validator
+from app.moderation import PENDING, APPROVED, FLAGGED, HIDDEN, VISIBLE
+
+logger = logging.getLogger(__name__)
+
+# Publish-then-moderate: posts by trusted members are stored with
+# moderation: "pending" and shown at once. drain() later moves each to approved,
+# flagged or hidden (see app/moderation.py); questions enter the question index,
+# and so recommendations and feeds, only once they are approved or flagged. A
+# pending answer counts towards its question's answers at once (walked back if it
+# is hidden), but is only counted in the rollups and notified to the question's
+# owner once it passes.
+
+_filter = None
+_filter_lock = threading.Lock()
+_stats = {"processed": 0, "approved": 0, "flagged": 0, "hidden": 0, "lastRunAt": None}
+_stats_lock = threading.Lock()
+
+
+def _content_filter():
+    global _filter
+    if _filter is None:
+        with _filter_lock:
+            if _filter is None:
+                _filter = AIContentFilter(modelVersion="1.0")
+    return _filter
+
+
+def min_reputation(community_id, rules=None):
+    """Reputation above which a member's posts in the community skip the synchronous checks, or None."""
+    trust = (rules or moderation.get_rules()).get("trust", {})
+    community = trust.get("communities", {}).get(str(community_id), {})
+    return community.get("minReputation", trust.get("default", {}).get("minReputation"))
+
+
+def trusted(member, community_id, rules=None):
+    """Whether the member may publish before moderation: enough reputation and no outstanding strikes."""
+    if not Config.MODERATION_ASYNC:
+        return False
+    threshold = min_reputation(community_id, rules)
+    if threshold is None or (member.reputation or 0) < threshold or member.restrictionLevel:
+        return False
+    state = member.community_bans.get(str(community_id), {})
+    return not (isinstance(state, dict) and state.get("strikes"))
+
+
+def _claim(db, collection, limit, now):
+    """Lease up to `limit` of the oldest pending posts, so concurrent workers split the queue."""
+    free = {"moderation": PENDING, "moderationLease": {"$not": {"$gt": now}}}
+    ids = [doc["_id"] for doc in db[collection].find(free, {"_id": 1}).sort("dateCreated", 1).limit(limit)]
+    if not ids:
+        return []
+    token = ObjectId()
+    db[collection].update_many(
+        dict(free, _id={"$in": ids}),
+        {"$set": {"moderationLease": now + timedelta(seconds=Config.MODERATION_QUEUE_LEASE), "moderationToken": token}}
+    )
+    return list(db[collection].find({"moderationToken": token}))
+
+
+def _hide(db, collection, post):
+    if collection == "questions":
+        get_community_validator(db).question_index.remove(post["_id"])
+        feeds.remove_question(db, post["_id"])
+        cache.invalidate(f"question:{post['_id']}")
+    else:
+        db.questions.update_one({"_id": post["questionId"]}, {"$inc": {"answers": -1}})
+        cache.invalidate(f"question:{post['questionId']}")
+
+
+def _publish_answer(db, answer, question, authors):
+    """Effects of an answer held back until it passed moderation: rollups and the owner's notification."""
+    community_id = question["communityId"]
+    rollups.record(db, rollups.user(answer["memberId"], "answers", 1, answer.get("dateCreated")),
+                   rollups.community(community_id, "answers", 1, answer.get("dateCreated")))
+    if question["memberId"] != answer["memberId"]:
+        notifications.notify(
+            db, question["memberId"],
+            f"{authors.get(answer['memberId'], 'Someone')} answered your question: {question['title']}",
+            "answer", str(answer["_id"])
+        )
+
+
+def _moderate(db, collection, posts):
+    updates = []
+    if collection == "questions":
+        community_ids = [post["communityId"] for post in posts]
+    else:
+        questions = {q["_id"]: q for q in db.questions.find(
+            {"_id": {"$in": list({post["questionId"] for post in posts})}}, {"communityId": 1, "memberId": 1, "title": 1})}
+        # Answers to a question deleted meanwhile have no community to be checked against
+        orphans = [post for post in posts if post["questionId"] not in questions]
+        for post in orphans:
+            updates.append(UpdateOne({"_id": post["_id"]}, {
+                "$set": {"moderation": HIDDEN, "moderatedAt": datetime.utcnow()},
+                "$unset": {"moderationLease": "", "moderationToken": ""}
+            }))
+        with _stats_lock:
+            _stats["processed"] += len(orphans)
+            _stats[HIDDEN] += len(orphans)
+        posts = [post for post in posts if post["questionId"] in questions]
+        community_ids = [questions[post["questionId"]]["communityId"] for post in posts]
+        authors = {u["_id"]: u["username"] for u in db.users.find(
+            {"_id": {"$in": list({post["memberId"] for post in posts})}}, {"username": 1})}
+    if not posts:
+        if updates:
+            db[collection].bulk_write(updates, ordered=False)
+        return
+
+    # One forward pass per model for the whole batch; filterContent then reads the cached scores
+    contents = [post["content"] for post in posts]
+    score_cache.toxicity_scores_many(contents)
+    relevance = get_community_validator(db).validate_many(contents, community_ids)
+
+    for post, community_id, result in zip(posts, community_ids, relevance):
+        changes = {}
+        if collection == "questions":
+            question_id, answer_id = post["_id"], None
+        else:
+            question_id, answer_id = post["questionId"], post["_id"]
+        _, feedback = _content_filter().filterContent(post["content"], post["memberId"], question_id, answer_id, community_id, db)
+        if feedback:
+            status = HIDDEN
+            _hide(db, collection, post)
+        elif result is not None and not result["is_relevant"]:
+            status = FLAGGED
+            changes["suggestedCommunity"] = result["suggested_community"]
+            notifications.notify(
+                db, post["memberId"],
+                f"Your post may not fit this community; it looks like a better match for {result['suggested_community']}.",
+                "moderation", str(post["_id"]), community_id
+            )
+        else:
+            status = APPROVED
+        if status != HIDDEN and collection == "questions":
+            get_community_validator(db).question_index.upsert(post["_id"], post.get("title"), post["content"], post["communityId"])
+        elif status != HIDDEN:
+            _publish_answer(db, post, questions[post["questionId"]], authors)
+        changes.update(moderation=status, moderatedAt=datetime.utcnow())
+        updates.append(UpdateOne({"_id": post["_id"]}, {"$set": changes, "$unset": {"moderationLease": "", "moderationToken": ""}}))
+        with _stats_lock:
+            _stats["processed"] += 1
+            _stats[status] += 1
+    if updates:
+        db[collection].bulk_write(updates, ordered=False)
+
+
+def drain(db, batch_size=None):
+    """
+    Periodic job: moderate one batch of pending questions and one of answers.
+    A batch the models cannot score stays pending and is retried once its lease expires.
+
+    Returns:
+        Number of posts moderated
+    """
+    batch_size = batch_size or Config.MODERATION_QUEUE_BATCH
+    now = datetime.utcnow()
+    done = 0
+    for collection in ("questions", "answers"):
+        posts = _claim(db, collection, batch_size, now)
+        if not posts:
+            continue
+        try:
+            _moderate(db, collection, posts)
+            done += len(posts)
+        except InferenceUnavailable as e:
+            logger.warning(f"Deferring moderation of {len(posts)} {collection}: {str(e)}")
+    with _stats_lock:
+        _stats["lastRunAt"] = now.isoformat()
+    return done
+
+
+def queue_stats(db):
+    """Pending posts and the age of the oldest one, which is how far moderation lags behind publishing."""
+    now = datetime.utcnow()
+    pending = {}
+    oldest = None
+    for collection in ("questions", "answers"):
+        pending[collection] = db[collection].count_documents({"moderation": PENDING})
+        first = db[collection].find_one({"moderation": PENDING}, {"dateCreated": 1}, sort=[("dateCreated", 1)])
+        if first and (oldest is None or first["dateCreated"] < oldest):
+            oldest = first["dateCreated"]
+    with _stats_lock:
+        stats = dict(_stats)
+    stats.update(
+        enabled=Config.MODERATION_ASYNC,
+        pending=pending,
+        lagSeconds=round((now - oldest).total_seconds(), 1) if oldest else 0.0
+    )
+    return stats
+
+
+def schedule(db):
+    background.every(Config.MODERATION_QUEUE_INTERVAL, lambda: drain(db), 'moderation_queue', heavy=True)
+    metrics.register('moderationQueue', lambda: queue_stats(db))
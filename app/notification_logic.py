@@ -1,10 +1,84 @@
+from bson import ObjectId
+from bson.errors import InvalidId
+
 def prioritize_notification(notification_type):
+    # Keyed by the types notify() is called with
     priority_map = {
-        'ban': 'high',
+        'inappropriate': 'high',
         'answer': 'high',
-        'badge_awarded': 'medium',
-        'vote': 'low',
-        'restriction_warning': 'medium',
-        'chatbot_response': 'medium'
+        'badge': 'medium',
+        'moderation': 'medium',
+        'vote': 'low'
     }
-    return priority_map.get(notification_type, 'medium')
\ No newline at end of file
+    return priority_map.get(notification_type, 'medium')
+
+def _object_id(value):
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return None
+
+
+def resolve_notifications(db, notifications):
+    """
+    Attach questionId to answer/vote notifications with one $in query per collection.
+
+    Args:
+        db: MongoDB database (mongo.db)
+        notifications: Notification documents, in display order
+
+    Returns:
+        (resolved, dangling_ids): serialized notifications whose target still
+        exists, and the _ids of those pointing at deleted questions or answers
+    """
+    related_ids = {
+        _object_id(n.get("relatedId"))
+        for n in notifications
+        if n.get("type") in ("answer", "vote") and n.get("relatedId")
+    }
+    related_ids.discard(None)
+
+    answers = {}
+    questions = set()
+    if related_ids:
+        answers = {
+            str(a["_id"]): a["questionId"]
+            for a in db.answers.find({"_id": {"$in": list(related_ids)}}, {"questionId": 1})
+        }
+        # Vote notifications may point straight at a question; answer notifications need their parent question
+        question_ids = related_ids | set(answers.values())
+        questions = {str(q["_id"]) for q in db.questions.find({"_id": {"$in": list(question_ids)}}, {"_id": 1})}
+
+    resolved = []
+    dangling_ids = []
+    for notification in notifications:
+        created = notification.get("createdAt", notification.get("dateCreated"))
+        notification_data = {
+            "_id": str(notification["_id"]),
+            "message": notification.get("message"),
+            "type": notification.get("type"),
+            "relatedId": str(notification["relatedId"]) if notification.get("relatedId") else None,
+            "read": notification.get("read", notification.get("isRead", False)),
+            "dateCreated": created.isoformat() if created else None
+        }
+        if notification.get("type") in ("answer", "vote"):
+            related_id = notification_data["relatedId"]
+            question_id = None
+            if notification["type"] == "answer":
+                if related_id in answers and str(answers[related_id]) in questions:
+                    question_id = str(answers[related_id])
+            elif related_id in questions:
+                question_id = related_id
+            elif related_id in answers:
+                question_id = str(answers[related_id])
+            if question_id is None:
+                dangling_ids.append(notification["_id"])
+                continue
+            notification_data["questionId"] = question_id
+        resolved.append(notification_data)
+    return resolved, dangling_ids
+
+
+def delete_notifications(db, notification_ids):
+    if notification_ids:
+        db.notifications.delete_many({"_id": {"$in": list(notification_ids)}})
@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from pymongo.errors import OperationFailure, PyMongoError
+from app import metrics, notifications
+from app.config import Config
+from app.notification_logic import resolve_notifications
+
+logger = logging.getLogger(__name__)
+
+# Returned by servers that are not replica sets, where change streams do not exist
+CHANGE_STREAMS_UNSUPPORTED = {40573, 40324}
+
+
+class TooManyConnections(Exception):
+    pass
+
+
+def format_event(event, data, event_id=None):
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class NotificationBroker:
+    """
+    Fans new notifications out to the server-sent event streams open in this process.
+
+    Notifications are picked up from a MongoDB change stream, so writes made by
+    any worker reach every connected user. On a server without change streams
+    (a standalone mongod) the broker falls back to listening to this process's
+    notification dispatcher, which only sees notifications written here.
+
+    Args:
+        db: MongoDB database (mongo.db)
+        max_per_user: Streams one user may hold open in this process
+        max_total: Streams this process accepts in total
+    """
+
+    def __init__(self, db, max_per_user=3, max_total=1000):
+        self.db = db
+        self.max_per_user = max_per_user
+        self.max_total = max_total
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._total = 0
+        self._thread = None
+        self._pid = None
+        self.mode = None
+        self.published = 0
+        self.rejected = 0
+
+    def _check(self, member_id):
+        # Called with self._lock held
+        if len(self._subscribers.get(member_id, ())) >= self.max_per_user or self._total >= self.max_total:
+            self.rejected += 1
+            raise TooManyConnections(f"At most {self.max_per_user} notification streams per user")
+
+    def check(self, member_id):
+        """Raise TooManyConnections if subscribe() would, without taking a slot."""
+        with self._lock:
+            self._check(str(member_id))
+
+    def subscribe(self, member_id):
+        self._ensure_watching()
+        member_id = str(member_id)
+        with self._lock:
+            self._check(member_id)
+            subscription = queue.Queue(maxsize=100)
+            self._subscribers.setdefault(member_id, set()).add(subscription)
+            self._total += 1
+        return subscription
+
+    def unsubscribe(self, member_id, subscription):
+        member_id = str(member_id)
+        with self._lock:
+            streams = self._subscribers.get(member_id)
+            if streams and subscription in streams:
+                streams.discard(subscription)
+                self._total -= 1
+                if not streams:
+                    del self._subscribers[member_id]
+
+    def _listening(self, member_id):
+        with self._lock:
+            return str(member_id) in self._subscribers
+
+    def unread_count(self, member_id):
+        return self.db.notifications.count_documents({"memberId": member_id, "read": {"$ne": True}})
+
+    def publish(self, doc):
+        """Push one notification document to its recipient's open streams."""
+        member_id = doc.get("memberId")
+        if member_id is None or not self._listening(member_id):
+            return
+        unread = self.unread_count(member_id)
+        if doc.get("read"):
+            message = format_event("unread", {"unreadCount": unread})
+        else:
+            resolved, _ = resolve_notifications(self.db, [doc])
+            if not resolved:
+                return
+            message = format_event("notification", {"notification": resolved[0], "unreadCount": unread}, resolved[0]["_id"])
+        with self._lock:
+            streams = list(self._subscribers.get(str(member_id), ()))
+        for subscription in streams:
+            try:
+                subscription.put_nowait(message)
+            except queue.Full:
+                # A client that stopped reading loses events rather than holding memory
+                pass
+        self.published += 1
+
+    def _ensure_watching(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._watch, name="notification-stream", daemon=True)
+                self._thread.start()
+
+    def _on_written(self, events):
+        for event in events:
+            try:
+                if event.get("collapse"):
+                    # Collapsed events are merged into a document the event does not describe
+                    doc = self.db.notifications.find_one({"memberId": event["memberId"], "collapseKey": event["collapse"]["key"], "read": False})
+                else:
+                    doc = event
+                if doc:
+                    self.publish(doc)
+            except PyMongoError as e:
+                logger.warning(f"Failed to publish notification: {str(e)}")
+
+    def _watch(self):
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+        resume_token = None
+        while True:
+            try:
+                with self.db.notifications.watch(pipeline, full_document='updateLookup', resume_after=resume_token) as stream:
+                    self.mode = 'changeStream'
+                    for change in stream:
+                        resume_token = stream.resume_token
+                        doc = change.get("fullDocument")
+                        if doc:
+                            self.publish(doc)
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                    logger.info("Change streams unavailable, streaming notifications written by this process only")
+                    self.mode = 'inProcess'
+                    notifications.add_listener(self._on_written)
+                    return
+                logger.warning(f"Notification change stream failed, reopening: {str(e)}")
+                resume_token = None
+                time.sleep(1)
+            except PyMongoError as e:
+                logger.warning(f"Notification change stream interrupted, resuming: {str(e)}")
+                time.sleep(1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "connections": self._total,
+                "users": len(self._subscribers),
+                "published": self.published,
+                "rejected": self.rejected
+            }
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker(db):
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = NotificationBroker(db, Config.SSE_MAX_CONNECTIONS_PER_USER, Config.SSE_MAX_CONNECTIONS)
+                metrics.register('notificationStream', _broker.stats)
+    return _broker
+
+
+def stream(db, member_id, heartbeat=None):
+    """
+    Generator of server-sent events for one user: the unread count first, then
+    each new notification, with a comment line as heartbeat while idle.
+    Raises TooManyConnections before yielding anything if the user is at the limit.
+
+    The slot is only taken once the response starts being read, inside the
+    generator's try, so a client that disconnects before the first chunk never
+    holds one.
+    """
+    heartbeat = heartbeat or Config.SSE_HEARTBEAT_SECONDS
+    broker = get_broker(db)
+    broker.check(member_id)
+
+    def events():
+        subscription = None
+        try:
+            yield f"retry: {int(Config.SSE_RETRY_MS)}\n\n"
+            try:
+                subscription = broker.subscribe(member_id)
+            except TooManyConnections as e:
+                # Lost the last slot to another stream since check(); the browser retries later
+                yield format_event("error", {"message": str(e)})
+                return
+            yield format_event("unread", {"unreadCount": broker.unread_count(member_id)})
+            while True:
+                try:
+                    yield subscription.get(timeout=heartbeat)
+                except queue.Empty:
+                    # Keeps proxies from closing the idle connection and detects dead clients
+                    yield ": heartbeat\n\n"
+        finally:
+            if subscription is not None:
+                broker.unsubscribe(member_id, subscription)
+
+    return events()
@@ -0,0 +1,263 @@
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from app import background, metrics
+from app.config import Config
+from app.notification_logic import prioritize_notification
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_ORDER = {'high': 0, 'medium': 1, 'low': 2}
+
+# Error code MongoDB returns for a duplicate key; a redelivered event is already stored
+DUPLICATE_KEY = 11000
+
+# Event ids remembered on a collapsed notification to skip redelivered events
+COLLAPSE_EVENT_IDS = 500
+
+_listeners = []
+
+
+def add_listener(fn):
+    """Call fn(events) after each batch of events this process writes."""
+    if fn not in _listeners:
+        _listeners.append(fn)
+
+
+def _written(events):
+    for listener in list(_listeners):
+        try:
+            listener(events)
+        except Exception:
+            logger.exception("Notification listener failed")
+
+
+def _event(member_id, message, type, related_id=None, community_id=None, collapse=None):
+    """
+    Build a notification event. `collapse` is an optional (key, actor, action)
+    triple: unread events with the same key for the same member are merged into
+    one notification reading "<actor> and N others <action>".
+    """
+    event = {
+        "_id": ObjectId(),
+        "memberId": ObjectId(member_id),
+        "message": message,
+        "type": type,
+        "relatedId": related_id,
+        "read": False,
+        "createdAt": datetime.utcnow(),
+        "communityId": community_id,
+        "priority": prioritize_notification(type)
+    }
+    if collapse:
+        event["collapse"] = {"key": collapse[0], "actor": collapse[1], "action": collapse[2]}
+    return event
+
+
+def _collapsed_update(member_id, collapse, events):
+    """
+    Upsert the member's unread notification for this collapse key, adding one
+    actor per event. The ids of applied events are kept on the document (the
+    last COLLAPSE_EVENT_IDS), so a redelivered outbox batch is not counted twice.
+    """
+    latest = events[-1]
+    others = {"$subtract": ["$count", 1]}
+    applied = {"$ifNull": ["$eventIds", []]}
+    return UpdateOne(
+        {"memberId": member_id, "collapseKey": collapse["key"], "read": False},
+        [
+            {"$set": {"_new": {"$setDifference": [{"$literal": [event["_id"] for event in events]}, applied]}}},
+            {"$set": {
+                "count": {"$add": [{"$ifNull": ["$count", 0]}, {"$size": "$_new"}]},
+                "eventIds": {"$slice": [{"$concatArrays": [applied, "$_new"]}, -COLLAPSE_EVENT_IDS]},
+                "type": latest["type"],
+                "relatedId": latest["relatedId"],
+                "communityId": latest["communityId"],
+                "priority": latest["priority"],
+                "createdAt": latest["createdAt"]
+            }},
+            {"$set": {"message": {"$cond": [
+                {"$gt": ["$count", 1]},
+                {"$concat": [
+                    {"$literal": collapse["actor"]}, " and ", {"$toString": others},
+                    {"$cond": [{"$eq": [others, 1]}, " other ", " others "]},
+                    {"$literal": collapse["action"]}
+                ]},
+                {"$literal": f"{collapse['actor']} {collapse['action']}"}
+            ]}}},
+            {"$unset": "_new"}
+        ],
+        upsert=True
+    )
+
+
+def write_events(db, events):
+    """
+    Store a batch of events: plain ones with one insert_many, collapsible ones as
+    one upsert per (member, collapse key). Highest priority first. Event _ids are
+    reused as notification _ids, so writing the same event twice is harmless.
+
+    Returns:
+        Number of notification documents written or updated
+    """
+    events = sorted(events, key=lambda e: PRIORITY_ORDER.get(e.get("priority"), 1))
+    plain = []
+    groups = {}
+    for event in events:
+        collapse = event.get("collapse")
+        if collapse:
+            groups.setdefault((event["memberId"], collapse["key"]), (collapse, []))[1].append(event)
+        else:
+            plain.append(event)
+
+    written = 0
+    if plain:
+        try:
+            written += len(db.notifications.insert_many(plain, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY for error in errors):
+                raise
+            written += e.details.get("nInserted", 0)
+
+    if groups:
+        requests = [_collapsed_update(member_id, collapse, group) for (member_id, _), (collapse, group) in groups.items()]
+        try:
+            db.notifications.bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            # Two workers upserted the same collapsed notification at once; the retry finds it
+            failed = [requests[error["index"]] for error in e.details.get("writeErrors", []) if error.get("code") == DUPLICATE_KEY]
+            if len(failed) != len(e.details.get("writeErrors", [])):
+                raise
+            db.notifications.bulk_write(failed, ordered=False)
+        written += len(groups)
+    return written
+
+
+class NotificationDispatcher:
+    """
+    Takes notification events off the request path.
+
+    Requests enqueue events in memory; the background worker writes them in
+    batches every flush interval, and at once when a high priority event arrives
+    or a full batch is waiting. Events that cannot be written, or do not fit in
+    the queue, go to the notification_outbox collection and are retried from there.
+
+    Args:
+        db: MongoDB database (mongo.db)
+        batch_size: Most events written per batch
+        max_queued: Events held in memory before enqueue falls back to the outbox
+    """
+
+    def __init__(self, db, batch_size=200, max_queued=5000):
+        self.db = db
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._flush_lock = threading.Lock()
+        self._flush_queued = threading.Event()
+        self.enqueued = 0
+        self.written = 0
+        self.outboxed = 0
+        self.failed_flushes = 0
+        self.last_flush_seconds = 0.0
+
+    def enqueue(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # Memory is the limit, not durability: park the event in the outbox instead
+            self._to_outbox([event])
+            return
+        self.enqueued += 1
+        if (event["priority"] == 'high' or self._queue.qsize() >= self.batch_size) and not self._flush_queued.is_set():
+            self._flush_queued.set()
+            background.submit(self.flush)
+
+    def _drain(self):
+        events = []
+        while len(events) < self.batch_size:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def _to_outbox(self, events):
+        try:
+            self.db.notification_outbox.insert_many(events, ordered=False)
+            self.outboxed += len(events)
+        except BulkWriteError as e:
+            self.outboxed += e.details.get("nInserted", 0)
+        except Exception as e:
+            logger.error(f"Lost {len(events)} notifications, outbox unavailable: {str(e)}")
+
+    def flush(self):
+        with self._flush_lock:
+            self._flush_queued.clear()
+            total = 0
+            while True:
+                events = self._drain()
+                if not events:
+                    return total
+                start = time.perf_counter()
+                try:
+                    total += write_events(self.db, events)
+                except Exception as e:
+                    self.failed_flushes += 1
+                    logger.warning(f"Failed to write {len(events)} notifications, moving them to the outbox: {str(e)}")
+                    self._to_outbox(events)
+                    continue
+                self.last_flush_seconds = time.perf_counter() - start
+                self.written += len(events)
+                _written(events)
+
+    def drain_outbox(self):
+        """Write events parked in the outbox, then delete them."""
+        while True:
+            events = list(self.db.notification_outbox.find({}).sort("_id", 1).limit(self.batch_size))
+            if not events:
+                return
+            write_events(self.db, events)
+            _written(events)
+            self.db.notification_outbox.delete_many({"_id": {"$in": [e["_id"] for e in events]}})
+            if len(events) < self.batch_size:
+                return
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "outboxed": self.outboxed,
+            "failedFlushes": self.failed_flushes,
+            "lastFlushMs": round(self.last_flush_seconds * 1000, 2)
+        }
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher(db):
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = NotificationDispatcher(db, Config.NOTIFICATION_BATCH_SIZE, Config.NOTIFICATION_MAX_QUEUED)
+                background.every(Config.NOTIFICATION_FLUSH_INTERVAL, _dispatcher.flush, 'flush_notifications')
+                background.every(Config.NOTIFICATION_OUTBOX_INTERVAL, _dispatcher.drain_outbox, 'drain_notification_outbox')
+                # Whatever is still queued at exit is written, or parked in the outbox
+                atexit.register(_dispatcher.flush)
+                metrics.register('notifications', _dispatcher.stats)
+    return _dispatcher
+
+
+def notify(db, member_id, message, type, related_id=None, community_id=None, collapse=None):
+    """Queue a notification for member_id. See _event for `collapse`."""
+    get_dispatcher(db).enqueue(_event(member_id, message, type, related_id, community_id, collapse))
@@ -0,0 +1,72 @@
+import base64
+from bson import json_util
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    """Opaque cursor for the sort-key values of the last item on a page."""
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, expected_length):
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except Exception as e:
+        raise InvalidCursor(f"Malformed cursor: {str(e)}")
+    if not isinstance(values, list) or len(values) != expected_length:
+        raise InvalidCursor("Cursor does not match the requested sort")
+    return values
+
+
+def keyset_filter(sort, values):
+    """
+    Mongo filter selecting documents strictly after `values` in the order given by `sort`.
+
+    Args:
+        sort: List of (field, direction) pairs ending with a unique field such as _id
+        values: Sort-key values of the last document already returned
+
+    Returns:
+        An $or filter: (f1 after v1) or (f1 == v1 and f2 after v2) or ...
+
+    Missing and null values sort before every other value, i.e. last in a
+    descending sort, and $lt/$gt never match them, so "after" is spelled out for
+    them: older questions without score or views stay reachable past page one.
+    """
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        # {field: None} matches both null and a missing field
+        clause = {prev_field: values[j] for j, (prev_field, _) in enumerate(sort[:i])}
+        value = values[i]
+        if value is None:
+            if direction < 0:
+                # Nothing sorts after null in a descending sort
+                continue
+            clause[field] = {"$ne": None}
+        elif direction < 0:
+            clause["$or"] = [{field: {"$lt": value}}, {field: None}]
+        else:
+            clause[field] = {"$gt": value}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+def paginate(collection, query, sort, limit, cursor=None, projection=None):
+    """
+    Fetch one page with keyset pagination in a single query.
+
+    Returns:
+        (documents, next_cursor) where next_cursor is None on the last page
+    """
+    if cursor:
+        query = {"$and": [query, keyset_filter(sort, decode_cursor(cursor, len(sort)))]}
+    documents = list(collection.find(query, projection).sort(sort).limit(limit + 1))
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        last = documents[-1]
+        next_cursor = encode_cursor([last.get(field) for field, _ in sort])
+    return documents, next_cursor
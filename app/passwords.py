@@ -0,0 +1,147 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import bcrypt
+from app import background, metrics
+from app.config import Config
+
+# bcrypt is slow on purpose (about 250ms at cost 12), so hashing on the request
+# thread lets a burst of logins tie up every server thread. Hashes run on a small
+# dedicated pool instead; callers wait on a future, and once PASSWORD_HASH_QUEUE
+# hashes are waiting new ones are refused rather than queued behind the burst.
+
+
+class HashingBusy(Exception):
+    """The hashing queue is full; the client should retry shortly (429)."""
+
+
+class HashingTimeout(Exception):
+    """A queued hash did not finish within PASSWORD_HASH_TIMEOUT (503)."""
+
+
+_executor = None
+_pid = None
+_lock = threading.Lock()
+_in_flight = 0
+_stats = {"hashed": 0, "verified": 0, "rehashed": 0, "rejected": 0, "timeouts": 0}
+
+
+def _pool():
+    # Threads do not survive fork, so each gunicorn worker builds its own pool
+    global _executor, _pid
+    if _executor is not None and _pid == os.getpid():
+        return _executor
+    with _lock:
+        if _executor is None or _pid != os.getpid():
+            executor_class = ThreadPoolExecutor
+            try:
+                from gevent import monkey
+                if monkey.is_module_patched('threading'):
+                    # Patched threads are greenlets; bcrypt needs native threads to leave the hub free
+                    from gevent.threadpool import ThreadPoolExecutor as executor_class
+            except ImportError:
+                pass
+            _executor = executor_class(max_workers=Config.PASSWORD_HASH_WORKERS, thread_name_prefix='passwords')
+            _pid = os.getpid()
+    return _executor
+
+
+def _release(_future):
+    global _in_flight
+    with _lock:
+        _in_flight -= 1
+
+
+def _run(fn, *args):
+    """Run fn on the hashing pool and wait for it, refusing work past the queue limit."""
+    global _in_flight
+    pool = _pool()
+    with _lock:
+        if _in_flight >= Config.PASSWORD_HASH_WORKERS + Config.PASSWORD_HASH_QUEUE:
+            _stats["rejected"] += 1
+            raise HashingBusy("Too many password checks in progress, please retry shortly")
+        _in_flight += 1
+    future = pool.submit(fn, *args)
+    future.add_done_callback(_release)
+    try:
+        return future.result(timeout=Config.PASSWORD_HASH_TIMEOUT)
+    except FutureTimeoutError:
+        # Frees the slot if the hash has not started yet
+        future.cancel()
+        with _lock:
+            _stats["timeouts"] += 1
+        raise HashingTimeout(f"Password hashing timed out after {Config.PASSWORD_HASH_TIMEOUT}s")
+
+
+def rounds_of(password_hash):
+    """Cost factor of a "$2b$12$..." hash, or None when it is not a bcrypt hash."""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def needs_rehash(password_hash):
+    return rounds_of(password_hash) != Config.BCRYPT_ROUNDS
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(password_hash, password):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    except ValueError:
+        # Malformed stored hash
+        return False
+
+
+def hash_password(password, rounds=None):
+    """bcrypt hash of a password at BCRYPT_ROUNDS (or `rounds`), as stored in users.password."""
+    result = _run(_hash, password, rounds or Config.BCRYPT_ROUNDS)
+    with _lock:
+        _stats["hashed"] += 1
+    return result
+
+
+def check_password(password_hash, password):
+    if not password_hash:
+        return False
+    result = _run(_check, password_hash, password)
+    with _lock:
+        _stats["verified"] += 1
+    return result
+
+
+def _rehash(db, user_id, old_hash, password):
+    new_hash = hash_password(password)
+    # Matching on the old hash skips users who changed their password meanwhile
+    result = db.users.update_one({"_id": user_id, "password": old_hash}, {"$set": {"password": new_hash}})
+    if result.modified_count:
+        with _lock:
+            _stats["rehashed"] += 1
+
+
+def rehash_if_needed(db, user, password):
+    """
+    After a successful login, re-hash the password in the background when it was
+    stored at another cost than BCRYPT_ROUNDS, so changing the setting upgrades
+    hashes as members sign in.
+    """
+    if needs_rehash(user["password"]):
+        background.submit_heavy(_rehash, db, user["_id"], user["password"], password)
+
+
+def stats():
+    with _lock:
+        return dict(
+            _stats,
+            rounds=Config.BCRYPT_ROUNDS,
+            workers=Config.PASSWORD_HASH_WORKERS,
+            queueLimit=Config.PASSWORD_HASH_QUEUE,
+            inFlight=_in_flight
+        )
+
+
+metrics.register('passwords', stats)
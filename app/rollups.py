@@ -0,0 +1,145 @@
+import logging
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from app import background
+
+logger = logging.getLogger(__name__)
+
+# activity_rollups holds one document per (scope, key, month) with per-day and
+# per-month counters, plus one all-time document per (scope, key):
+#   {"_id": "user:<id>:2025-06", "totals": {"questions": 4}, "days": {"17": {"questions": 1}}}
+#   {"_id": "user:<id>:all", "totals": {"questions": 42}}
+
+
+def _month(when):
+    return when.strftime('%Y-%m')
+
+
+def _updates(scope, key, counter, delta, when):
+    month = _month(when)
+    return [
+        UpdateOne(
+            {"_id": f"{scope}:{key}:{month}"},
+            {"$inc": {f"totals.{counter}": delta, f"days.{when.strftime('%d')}.{counter}": delta},
+             "$setOnInsert": {"scope": scope, "key": key, "month": month}},
+            upsert=True
+        ),
+        UpdateOne(
+            {"_id": f"{scope}:{key}:all"},
+            {"$inc": {f"totals.{counter}": delta},
+             "$setOnInsert": {"scope": scope, "key": key, "month": "all"}},
+            upsert=True
+        )
+    ]
+
+
+def user(member_id, counter, delta=1, when=None):
+    return ("user", str(member_id), counter, delta, when)
+
+
+def community(community_id, counter, delta=1, when=None):
+    return ("community", str(community_id), counter, delta, when)
+
+
+def apply(db, changes, collection="activity_rollups"):
+    """Apply rollup changes, as built by user() and community(), in one bulk_write."""
+    now = datetime.utcnow()
+    requests = []
+    for scope, key, counter, delta, when in changes:
+        requests.extend(_updates(scope, key, counter, delta, when or now))
+    if requests:
+        db[collection].bulk_write(requests, ordered=False)
+
+
+def record(db, *changes):
+    """Queue rollup changes so the write happens off the request path."""
+    # Resolve the timestamp now rather than when the background worker gets to it
+    now = datetime.utcnow()
+    background.submit_heavy(apply, db, [(scope, key, counter, delta, when or now) for scope, key, counter, delta, when in changes])
+
+
+def load(db, scope, key, now):
+    """Fetch the all-time document and the last 13 monthly documents in one query."""
+    months = {_month(now)}
+    cursor = now.replace(day=1)
+    for _ in range(12):
+        cursor = (cursor - timedelta(days=1)).replace(day=1)
+        months.add(_month(cursor))
+    ids = [f"{scope}:{key}:{month}" for month in months] + [f"{scope}:{key}:all"]
+    return {doc["month"]: doc for doc in db.activity_rollups.find({"_id": {"$in": ids}})}
+
+
+def monthly(docs, counter, now):
+    """12 counters indexed by calendar month (0 = January) covering the last year."""
+    values = [0] * 12
+    cursor = now.replace(day=1)
+    for _ in range(12):
+        doc = docs.get(_month(cursor))
+        if doc:
+            values[cursor.month - 1] = doc.get("totals", {}).get(counter, 0)
+        cursor = (cursor - timedelta(days=1)).replace(day=1)
+    return values
+
+
+def daily(docs, counters, day):
+    doc = docs.get(_month(day))
+    if not doc:
+        return 0
+    counts = doc.get("days", {}).get(day.strftime('%d'), {})
+    return sum(counts.get(counter, 0) for counter in counters)
+
+
+def total(docs, counter):
+    return docs.get("all", {}).get("totals", {}).get(counter, 0)
+
+
+def backfill(db):
+    """
+    Rebuild activity_rollups from the questions, answers, votes and member_communities
+    history. The rollups are built in a scratch collection that then replaces
+    activity_rollups in one rename, so readers never see a half-built collection and
+    live increments keep landing on the old one meanwhile; only the changes made
+    while the history is being read are lost, so run it when activity is low.
+    """
+    scratch = "activity_rollups_backfill"
+    db[scratch].drop()
+
+    def when(field):
+        # Documents without a usable date fall back to the ObjectId creation time
+        return {"$cond": [{"$eq": [{"$type": field}, "date"]}, field, {"$toDate": "$_id"}]}
+
+    def day_group(date, extra):
+        group_id = {"day": {"$dateToString": {"format": "%Y-%m-%d", "date": when(date)}}}
+        group_id.update(extra)
+        return {"$group": {"_id": group_id, "count": {"$sum": 1}}}
+
+    def parse(row):
+        return datetime.strptime(row["_id"]["day"], '%Y-%m-%d')
+
+    changes = []
+    for row in db.questions.aggregate([day_group("$dateCreated", {"member": "$memberId", "community": "$communityId"})]):
+        changes.append(user(row["_id"]["member"], "questions", row["count"], parse(row)))
+        changes.append(community(row["_id"]["community"], "questions", row["count"], parse(row)))
+
+    for row in db.answers.aggregate([
+        {"$lookup": {"from": "questions", "localField": "questionId", "foreignField": "_id", "as": "question"}},
+        {"$unwind": "$question"},
+        day_group("$dateCreated", {"member": "$memberId", "community": "$question.communityId"})
+    ]):
+        changes.append(user(row["_id"]["member"], "answers", row["count"], parse(row)))
+        changes.append(community(row["_id"]["community"], "answers", row["count"], parse(row)))
+
+    for row in db.votes.aggregate([day_group("$date", {"member": "$memberId"})]):
+        changes.append(user(row["_id"]["member"], "votes", row["count"], parse(row)))
+
+    for row in db.member_communities.aggregate([day_group("$dateJoined", {"community": "$communityId"})]):
+        changes.append(community(row["_id"]["community"], "members", row["count"], parse(row)))
+
+    for start in range(0, len(changes), 500):
+        apply(db, changes[start:start + 500], collection=scratch)
+    if changes:
+        db[scratch].rename("activity_rollups", dropTarget=True)
+    else:
+        db.activity_rollups.drop()
+    logger.info(f"Rebuilt activity rollups from {len(changes)} day groups")
+    return len(changes)
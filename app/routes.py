@@ -1,50 +1,46 @@
-import base64
-from app import app, mongo, bcrypt, login_manager
-from flask import Blueprint, json, request, jsonify
+from app import app, mongo, login_manager
+from flask import Blueprint, json, request, jsonify, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
-from app.models import User, Member, Community, Question, Answer, Vote, Member_Community, AIContentFilter, CommunityValidator
+from app.models import User, Member, Community, Question, Answer, Vote, Member_Community, AIContentFilter, get_community_validator, load_communities
 from datetime import datetime, timedelta
 from bson import ObjectId
-from app import ai_content_filter
+from bson.errors import InvalidId
+from gridfs import NoFile
+from pymongo.errors import DuplicateKeyError
+from app.inference import InferenceUnavailable
+from app.pagination import paginate, InvalidCursor
+from app.notification_logic import resolve_notifications, delete_notifications
+from app import background, rollups, vote_engine, view_counter, notifications, notification_stream, feeds, user_loader, avatars, moderation, moderation_queue, passwords
+from app.notification_stream import TooManyConnections
+from app.passwords import HashingBusy, HashingTimeout
+from app.cache import cache, cached, invalidate
+from app.vote_engine import VoteConflict
+from app.config import Config
 from . import mongo
 routes = Blueprint('routes', __name__)
 
 ai_filter = AIContentFilter(modelVersion="1.0")
-community_validator = CommunityValidator(mongo.db)
+feeds.schedule(mongo.db)
+user_loader.schedule(mongo.db)
+moderation_queue.schedule(mongo.db)
+
+@app.errorhandler(InferenceUnavailable)
+def inference_unavailable(e):
+    print(f"Inference unavailable: {str(e)}")
+    return jsonify({'message': 'Content checks are temporarily unavailable, please try again', 'error': str(e)}), 503
+
+@app.errorhandler(HashingBusy)
+def hashing_busy(e):
+    return jsonify({'message': str(e)}), 429, {'Retry-After': '1'}
+
+@app.errorhandler(HashingTimeout)
+def hashing_timeout(e):
+    print(f"Password hashing unavailable: {str(e)}")
+    return jsonify({'message': 'Sign-in is busy, please try again', 'error': str(e)}), 503, {'Retry-After': '5'}
 
 @login_manager.user_loader
 def load_user(user_id):
-    user_data = mongo.db.users.find_one({"_id": ObjectId(user_id)})
-    if user_data:
-        community_bans = user_data.get('community_bans', {})
-        updated_bans = community_bans.copy()
-        for community_id, ban_info in community_bans.items():
-            if isinstance(ban_info, dict) and ban_info.get('status') == "banned":
-                expiration = ban_info.get('expiration')
-                if expiration and datetime.utcnow() > expiration:
-                    updated_bans[community_id] = {}
-        if updated_bans != community_bans:
-            mongo.db.users.update_one(
-                {"_id": ObjectId(user_id)},
-                {"$set": {"community_bans": updated_bans}}
-            )
-            user_data['community_bans'] = updated_bans
-
-        return Member(
-            str(user_data['_id']),
-            user_data['username'],
-            user_data['email'],
-            user_data['password'],
-            user_data.get('dateJoined'),
-            user_data.get('reputation', 0),
-            user_data.get('status', 'active'),
-            user_data.get('restrictionLevel', 0),
-            user_data.get('badges', []),
-            user_data.get('avatar'),
-            user_data.get('community_interactions', {}),
-            user_data.get('community_bans', {})
-        )
-    return None
+    return user_loader.load_user(mongo.db, user_id)
 
 # Define available badges with their criteria
 BADGES = [
@@ -102,7 +98,7 @@ def register():
     if mongo.db.users.find_one({'email': data['email']}):
         return jsonify({'message': 'Email already exists'}), 400
 
-    hashed_password = bcrypt.generate_password_hash(data['password']).decode('utf-8')
+    hashed_password = passwords.hash_password(data['password'])
     user = {
         "username": data['username'],
         "email": data['email'],
@@ -112,7 +108,6 @@ def register():
         "status": "active",
         "restrictionLevel": 0,
         "badges": [],
-        "avatar": "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII=",
         "community_interactions": {},
         "community_bans": {}
     }
@@ -135,7 +130,8 @@ def login():
             return jsonify({'message': f'Missing required field: {field}'}), 400
 
     user_data = mongo.db.users.find_one({'username': data['username']})
-    if user_data and bcrypt.check_password_hash(user_data['password'], data['password']):
+    if user_data and passwords.check_password(user_data['password'], data['password']):
+        passwords.rehash_if_needed(mongo.db, user_data, data['password'])
         user = Member(
             str(user_data['_id']),
             user_data['username'],
@@ -146,7 +142,7 @@ def login():
             user_data.get('status', 'active'),
             user_data.get('restrictionLevel', 0),
             user_data.get('badges', []),
-            user_data.get('avatar'),
+            avatars.url(user_data),
             user_data.get('community_interactions', {}),
             user_data.get('community_bans', {})
         )
@@ -156,7 +152,7 @@ def login():
             'user': {
                 'id': str(user_data['_id']),
                 'username': user_data['username'],
-                'avatar': user_data.get('avatar')
+                'avatar': avatars.url(user_data)
             }
         }), 200
     return jsonify({'message': 'Invalid credentials'}), 401
@@ -178,7 +174,10 @@ def protected():
 @login_required
 def get_current_user():
     print("get_current_user route called")
-    user = mongo.db.users.find_one({"_id": ObjectId(current_user.id)})
+    user = mongo.db.users.find_one(
+        {"_id": ObjectId(current_user.id)},
+        {"username": 1, "email": 1, "avatarHash": 1, "avatar": 1, "dateJoined": 1, "reputation": 1, "status": 1, "restrictionLevel": 1}
+    )
     if not user:
         return jsonify({'message': 'User not found'}), 404
 
@@ -186,7 +185,7 @@ def get_current_user():
         "_id": str(user["_id"]),
         "username": user["username"],
         "email": user["email"],
-        "avatar": user.get("avatar"),
+        "avatar": avatars.url(user),
         "dateJoined": user.get("dateJoined").isoformat(),
         "reputation": user.get("reputation", 0),
         "status": user.get("status", "active"),
@@ -194,15 +193,16 @@ def get_current_user():
     }), 200
 
 @app.route('/api/users/<user_id>', methods=['GET'])
+@cached('user', Config.CACHE_USER_TTL, tags=lambda user_id: [f"user:{user_id}"])
 def get_user(user_id):
     print("get_user route called")
     try:
-        user = mongo.db.users.find_one({"_id": ObjectId(user_id)})
+        user = mongo.db.users.find_one({"_id": ObjectId(user_id)}, {"username": 1, "avatarHash": 1, "avatar": 1})
         if not user:
             return jsonify({'message': 'User not found'}), 404
         return jsonify({
             'username': user['username'],
-            'avatar': user.get('avatar')
+            'avatar': avatars.url(user)
         }), 200
     except Exception as e:
         return jsonify({'message': 'Invalid user ID', 'error': str(e)}), 400
@@ -229,22 +229,45 @@ def update_avatar():
             return jsonify({'message': 'File size exceeds 2MB limit'}), 400
         avatar_file.seek(0)
 
-        avatar_data = avatar_file.read()
-        avatar_base64 = f"data:{avatar_file.content_type};base64,{base64.b64encode(avatar_data).decode('utf-8')}"
+        try:
+            avatar_hash = avatars.store(mongo.db, avatar_file.read())
+        except avatars.InvalidImage as e:
+            return jsonify({'message': 'Invalid image file', 'error': str(e)}), 400
 
         mongo.db.users.update_one(
             {"_id": ObjectId(current_user.get_id())},
-            {"$set": {"avatar": avatar_base64}}
+            {"$set": {"avatarHash": avatar_hash}, "$unset": {"avatar": ""}}
         )
-        current_user.avatar = avatar_base64
-        return jsonify({'message': 'Avatar updated successfully', 'avatar': avatar_base64}), 200
+        avatar_url = avatars.url({"avatarHash": avatar_hash})
+        current_user.avatar = avatar_url
+        invalidate(f"user:{current_user.get_id()}")
+        return jsonify({'message': 'Avatar updated successfully', 'avatar': avatar_url}), 200
     except Exception as e:
         return jsonify({'message': 'Error updating avatar', 'error': str(e)}), 500
 
+@app.route('/avatars/<avatar_hash>', methods=['GET'])
+def get_avatar(avatar_hash):
+    size = request.args.get('size', Config.AVATAR_SIZES[0], type=int)
+    if not avatars.HASH_PATTERN.match(avatar_hash) or size not in Config.AVATAR_SIZES:
+        return jsonify({'message': 'Avatar not found'}), 404
+
+    # The URL names the content, so browsers and proxies may keep it forever
+    etag = f"{avatar_hash}-{size}"
+    headers = {'Cache-Control': 'public, max-age=31536000, immutable'}
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=headers)
+    else:
+        try:
+            response = Response(avatars.load(mongo.db, avatar_hash, size), mimetype=avatars.MIMETYPE, headers=headers)
+        except NoFile:
+            return jsonify({'message': 'Avatar not found'}), 404
+    response.set_etag(etag)
+    return response
+
 @app.route('/communities', methods=['GET'])
 def get_communities():
     print("get_communities route called")
-    communities = mongo.db.communities.find()
+    communities = load_communities(mongo.db).values()
     return jsonify([{
         "idCommunity": c["_id"],
         "name": c["name"],
@@ -259,7 +282,7 @@ def join_community():
     community_id = int(data['communityId'])
     member_id = ObjectId(current_user.get_id())
 
-    community = mongo.db.communities.find_one({"_id": community_id})
+    community = load_communities(mongo.db).get(community_id)
     if not community:
         return jsonify({'message': 'Community not found'}), 404
 
@@ -267,7 +290,13 @@ def join_community():
         return jsonify({'message': 'Already a member of this community'}), 400
 
     member_community = Member_Community(member_id, community_id, datetime.utcnow())
-    member_community.joinCommunity(member_id, community_id, mongo.db)
+    try:
+        member_community.joinCommunity(member_id, community_id, mongo.db)
+    except DuplicateKeyError:
+        # A concurrent join (double click) won the unique member_community index
+        return jsonify({'message': 'Already a member of this community'}), 400
+    rollups.record(mongo.db, rollups.community(community_id, "members"))
+    feeds.invalidate(mongo.db, member_id)
 
     badge_prefix = current_user.getBadgePrefix(community["name"])
     current_user.awardBadge(badge_prefix, mongo.db)
@@ -282,11 +311,14 @@ def leave_community():
     community_id = int(data['communityId'])
     member_id = ObjectId(current_user.get_id())
 
-    if not mongo.db.member_communities.find_one({"memberId": member_id, "communityId": community_id}):
+    membership = mongo.db.member_communities.find_one({"memberId": member_id, "communityId": community_id})
+    if not membership:
         return jsonify({'message': 'Not a member of this community'}), 400
 
     member_community = Member_Community(member_id, community_id, None)
     member_community.leaveCommunity(member_id, community_id, mongo.db)
+    rollups.record(mongo.db, rollups.community(community_id, "members", -1, membership.get("dateJoined") or membership["_id"].generation_time.replace(tzinfo=None)))
+    feeds.invalidate(mongo.db, member_id)
     return jsonify({'message': 'Left community successfully'}), 200
 
 @app.route('/member_communities', methods=['GET'])
@@ -308,7 +340,7 @@ def validate_content():
     if not content or not community_id:
         return jsonify({'message': 'Missing content or communityId'}), 400
 
-    validation_result = community_validator.validate_content(content, community_id)
+    validation_result = get_community_validator(mongo.db).validate_content(content, community_id)
     if validation_result is None:
         return jsonify({'message': 'Community not found'}), 404
 
@@ -319,6 +351,34 @@ def validate_content():
         'similar_questions': validation_result['similar_questions']
     }), 200
 
+@app.route('/validate-content/batch', methods=['POST'])
+@login_required
+def validate_content_batch():
+    print("validate_content_batch route called")
+    data = request.get_json()
+    items = data.get('items', []) if data else []
+    if not items:
+        return jsonify({'message': 'items is required'}), 400
+    if len(items) > Config.VALIDATE_BATCH_MAX:
+        return jsonify({'message': f'At most {Config.VALIDATE_BATCH_MAX} items per request'}), 413
+
+    try:
+        contents = [item['content'] for item in items]
+        community_ids = [int(item['communityId']) for item in items]
+    except (KeyError, ValueError, TypeError) as e:
+        return jsonify({'message': 'Each item needs content and a valid communityId', 'error': str(e)}), 400
+
+    results = get_community_validator(mongo.db).validate_many(contents, community_ids)
+    return jsonify([
+        {'message': 'Community not found'} if result is None else {
+            'is_relevant': result['is_relevant'],
+            'similarity_score': result['similarity_score'],
+            'suggested_community': result['suggested_community'],
+            'similar_questions': result['similar_questions']
+        }
+        for result in results
+    ]), 200
+
 @app.route('/questions', methods=['POST'])
 @login_required
 def post_question():
@@ -349,97 +409,49 @@ def post_question():
             return jsonify({'message': 'Must be a member of the community to ask a question'}), 403
 
         print(f"Checking for ban in community ID: {community_id}")
-        ban = mongo.db.community_bans.find_one({
-            "memberId": ObjectId(current_user.id),
-            "communityId": community_id
-        })
-        if ban and ban['expiresAt'] > datetime.utcnow():
-            print(f"User is banned until {ban['expiresAt']}")
+        ban_expires = moderation.active_ban(current_user, community_id)
+        if ban_expires:
+            print(f"User is banned until {ban_expires}")
             return jsonify({
-                'message': f"User is banned from this community until {ban['expiresAt'].isoformat()}"
+                'message': f"User is banned from this community until {ban_expires.isoformat()}"
             }), 403
 
-        print(f"Validating content relevance for community ID: {community_id}")
-        validation_result = community_validator.validate_content(content, community_id)
-        if validation_result is None:
-            print("Community not found")
-            return jsonify({'message': 'Community not found'}), 404
-
-        if not validation_result['is_relevant']:
-            suggested_community = validation_result['suggested_community']
-            print(f"Content not relevant. Suggested community: {suggested_community}")
-            return jsonify({
-                'message': 'Content is not relevant to this community',
-                'suggested_community': suggested_community
-            }), 400
-
-        print("Checking for inappropriate content")
-        filtered_content, warning = ai_filter.filterContent(
-            content=content,
-            memberId=ObjectId(current_user.id),
-            questionId=None,
-            answerId=None,
-            communityId=community_id,
-            db=mongo.db
-        )
-        if warning:
-            print(f"Inappropriate content detected: {warning}")
-            # Update inappropriate_content collection
-            mongo.db.inappropriate_content.insert_one({
-                "content": content,
-                "memberId": ObjectId(current_user.id),
-                "communityId": community_id,
-                "questionId": None,
-                "answerId": None,
-                "timestamp": datetime.utcnow(),
-                "keys": ["toxicity"],
-                "isProcessed": False
-            })
-            # Increment restrictionLevel
-            user = mongo.db.users.find_one({"_id": ObjectId(current_user.id)})
-            restriction_level = (user.get('restrictionLevel', 0) or 0) + 1
-            mongo.db.users.update_one(
-                {"_id": ObjectId(current_user.id)},
-                {"$set": {"restrictionLevel": restriction_level}}
+        # Trusted members publish at once; the moderation queue checks the post afterwards
+        trusted = moderation_queue.trusted(current_user, community_id)
+        if trusted:
+            if community_id not in load_communities(mongo.db):
+                return jsonify({'message': 'Community not found'}), 404
+            filtered_content = content
+        else:
+            print(f"Validating content relevance for community ID: {community_id}")
+            validation_result = get_community_validator(mongo.db).validate_content(content, community_id)
+            if validation_result is None:
+                print("Community not found")
+                return jsonify({'message': 'Community not found'}), 404
+
+            if not validation_result['is_relevant']:
+                suggested_community = validation_result['suggested_community']
+                print(f"Content not relevant. Suggested community: {suggested_community}")
+                return jsonify({
+                    'message': 'Content is not relevant to this community',
+                    'suggested_community': suggested_community
+                }), 400
+
+            print("Checking for inappropriate content")
+            filtered_content, warning = ai_filter.filterContent(
+                content=content,
+                memberId=ObjectId(current_user.id),
+                questionId=None,
+                answerId=None,
+                communityId=community_id,
+                db=mongo.db
             )
-            # Create notification
-            attempts_left = 5 - restriction_level
-            feedback = f"You have {attempts_left} attempts left before a ban in community {community_id}."
-            if attempts_left <= 2 and attempts_left > 0:
-                feedback = f"Warning: You will be banned from this community if you reach 5 inappropriate attempts ({attempts_left} attempts left)."
-            elif attempts_left <= 0:
-                ban_duration_days = 1
-                ban_expires = datetime.utcnow() + timedelta(days=ban_duration_days)
-                mongo.db.community_bans.insert_one({
-                    "memberId": ObjectId(current_user.id),
-                    "communityId": community_id,
-                    "startDate": datetime.utcnow(),
-                    "expiresAt": ban_expires,
-                    "reason": "Exceeded inappropriate content attempts"
-                })
-                # Clear inappropriate_content for this user and community
-                mongo.db.inappropriate_content.delete_many({
-                    "memberId": ObjectId(current_user.id),
-                    "communityId": community_id
-                })
-                feedback = f"You have been banned from this community for {ban_duration_days} day(s). Ban expires on {ban_expires.isoformat()}."
-                mongo.db.users.update_one(
-                    {"_id": ObjectId(current_user.id)},
-                    {"$set": {"restrictionLevel": 0}}
-                )
-
-            mongo.db.notifications.insert_one({
-                "memberId": ObjectId(current_user.id),
-                "type": "inappropriate",
-                "message": feedback,
-                "isRead": False,
-                "createdAt": datetime.utcnow(),
-                "communityId": community_id
-            })
-            return jsonify({
-                'message': 'Content flagged as inappropriate',
-                'feedback': feedback
-            }), 400
+            if warning:
+                print(f"Inappropriate content detected: {warning}")
+                return jsonify({
+                    'message': 'Content flagged as inappropriate',
+                    'feedback': warning
+                }), 400
 
         question = {
             "title": title,
@@ -452,37 +464,93 @@ def post_question():
             "views": 0,
             "answers": 0
         }
+        if trusted:
+            question["moderation"] = moderation_queue.PENDING
         result = mongo.db.questions.insert_one(question)
+        # A pending question is indexed by the moderation queue once it has been checked
+        if not trusted:
+            background.submit_heavy(get_community_validator(mongo.db).question_index.upsert, result.inserted_id, title, filtered_content, community_id)
+        rollups.record(mongo.db, rollups.user(current_user.id, "questions"), rollups.community(community_id, "questions"))
+        # The member's own questions shape their feed
+        feeds.invalidate(mongo.db, current_user.id)
         return jsonify({
             'message': 'Question posted successfully',
             'questionId': str(result.inserted_id)
         }), 201
 
+    except InferenceUnavailable:
+        raise
     except Exception as e:
         print(f"Error posting question: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'message': 'Error posting question', 'error': str(e)}), 500
 
+QUESTION_LIST_PROJECTION = {
+    "title": 1, "content": 1, "dateCreated": 1, "communityId": 1, "memberId": 1,
+    "tags": 1, "score": 1, "views": 1, "answers": 1
+}
+
+QUESTION_SORTS = {
+    "newest": [("dateCreated", -1), ("_id", -1)],
+    "score": [("score", -1), ("_id", -1)],
+    "views": [("views", -1), ("_id", -1)]
+}
+
+def serialize_question_summary(question):
+    return {
+        "_id": str(question["_id"]),
+        "title": question["title"],
+        "content": question["content"],
+        "dateCreated": question["dateCreated"].isoformat(),
+        "communityId": question["communityId"],
+        "memberId": str(question["memberId"]),
+        "tags": question.get("tags", []),
+        "score": question.get("score", 0),
+        "views": question.get("views", 0),
+        "answers": question.get("answers", 0)
+    }
+
 @app.route('/questions', methods=['GET'])
 def get_questions():
     print("get_questions route called")
-    questions = mongo.db.questions.find()
-    response = []
-    for question in questions:
-        answers_count = mongo.db.answers.count_documents({"questionId": question["_id"]})
-        response.append({
-            "_id": str(question["_id"]),
-            "title": question["title"],
-            "content": question["content"],
-            "dateCreated": question["dateCreated"].isoformat(),
-            "communityId": question["communityId"],
-            "memberId": str(question["memberId"]),
-            "score": question.get("score", 0),
-            "views": question.get("views", 0),
-            "answers": answers_count
-        })
-    return jsonify(response), 200
+    # The answers counter is maintained by answer_question/delete_answer, so this is a single query
+    questions = mongo.db.questions.find(moderation_queue.VISIBLE, QUESTION_LIST_PROJECTION)
+    return jsonify([serialize_question_summary(question) for question in questions]), 200
+
+@app.route('/api/questions', methods=['GET'])
+def list_questions():
+    print("list_questions route called")
+    try:
+        sort_name = request.args.get('sort', 'newest')
+        if sort_name not in QUESTION_SORTS:
+            return jsonify({'message': f"sort must be one of: {', '.join(QUESTION_SORTS)}"}), 400
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+
+        query = dict(moderation_queue.VISIBLE)
+        if request.args.get('community'):
+            query["communityId"] = int(request.args['community'])
+        if request.args.get('tag'):
+            query["tags"] = request.args['tag']
+        if request.args.get('member'):
+            query["memberId"] = ObjectId(request.args['member'])
+
+        questions, next_cursor = paginate(
+            mongo.db.questions,
+            query,
+            QUESTION_SORTS[sort_name],
+            limit,
+            cursor=request.args.get('cursor'),
+            projection=QUESTION_LIST_PROJECTION
+        )
+        return jsonify({
+            "questions": [serialize_question_summary(question) for question in questions],
+            "nextCursor": next_cursor
+        }), 200
+    except InvalidCursor as e:
+        return jsonify({'message': 'Invalid cursor', 'error': str(e)}), 400
+    except (ValueError, InvalidId) as e:
+        return jsonify({'message': 'Invalid filter value', 'error': str(e)}), 400
 
 @app.route('/questions/<question_id>/answers', methods=['POST'])
 @login_required
@@ -499,71 +567,64 @@ def answer_question(question_id):
         return jsonify({'message': 'Question not found'}), 404
 
     community_id = question["communityId"]
-    ban_info = current_user.community_bans.get(str(community_id), {})
-    if isinstance(ban_info, dict) and ban_info.get('status') == "banned":
-        expiration = ban_info.get('expiration')
-        if expiration and datetime.utcnow() < expiration:
-            return jsonify({'message': f'User is banned from this community until {expiration}'}), 403
+    ban_expires = moderation.active_ban(current_user, community_id)
+    if ban_expires:
+        return jsonify({'message': f'User is banned from this community until {ban_expires}'}), 403
 
     if not mongo.db.member_communities.find_one({"memberId": ObjectId(current_user.get_id()), "communityId": community_id}):
         return jsonify({'message': 'Must be a member of the community to answer'}), 403
 
-    filtered_content, feedback_message = ai_filter.filterContent(content, ObjectId(current_user.get_id()), ObjectId(question_id), None, community_id, mongo.db)
-    if "inappropriate" in filtered_content.lower():
-        return jsonify({'message': 'Content flagged as inappropriate', 'feedback': feedback_message}), 400
+    # Trusted members publish at once; the moderation queue checks the answer afterwards
+    trusted = moderation_queue.trusted(current_user, community_id)
+    if not trusted:
+        filtered_content, feedback_message = ai_filter.filterContent(content, ObjectId(current_user.get_id()), ObjectId(question_id), None, community_id, mongo.db)
+        if feedback_message:
+            return jsonify({'message': 'Content flagged as inappropriate', 'feedback': feedback_message}), 400
 
-    validation_result = community_validator.validate_content(content, community_id)
-    if validation_result is None:
-        return jsonify({'message': 'Community not found'}), 404
+        validation_result = get_community_validator(mongo.db).validate_content(content, community_id)
+        if validation_result is None:
+            return jsonify({'message': 'Community not found'}), 404
 
-    print(f"Validation Result for Community {community_id}: {validation_result}")
+        print(f"Validation Result for Community {community_id}: {validation_result}")
 
-    if not validation_result['is_relevant']:
-        return jsonify({
-            'message': 'Content is not relevant to this community',
-            'suggested_community': validation_result['suggested_community']
-        }), 400
+        if not validation_result['is_relevant']:
+            return jsonify({
+                'message': 'Content is not relevant to this community',
+                'suggested_community': validation_result['suggested_community']
+            }), 400
 
     answer = current_user.answerQuestion(content, ObjectId(question_id))
-    result = mongo.db.answers.insert_one({
+    answer_doc = {
         "content": answer.content,
         "dateCreated": answer.dateCreated,
         "memberId": answer.memberId,
         "questionId": answer.questionId,
         "score": answer.score
-    })
+    }
+    if trusted:
+        answer_doc["moderation"] = moderation_queue.PENDING
+    result = mongo.db.answers.insert_one(answer_doc)
+    # A pending answer is counted and notified by the moderation queue once it passes
+    if not trusted:
+        rollups.record(mongo.db, rollups.user(current_user.id, "answers"), rollups.community(community_id, "answers"))
 
     # Update the question's answers count
     mongo.db.questions.update_one(
         {"_id": ObjectId(question_id)},
         {"$inc": {"answers": 1}}
     )
+    invalidate(f"question:{question_id}")
 
     # Notify the question owner (if the answerer is not the question owner)
     question_owner_id = question["memberId"]
-    if str(question_owner_id) != current_user.id:
-        question_owner = mongo.db.users.find_one({"_id": question_owner_id})
-        if question_owner:
-            question_owner_obj = Member(
-                str(question_owner['_id']),
-                question_owner['username'],
-                question_owner['email'],
-                question_owner['password'],
-                question_owner.get('dateJoined'),
-                question_owner.get('reputation', 0),
-                question_owner.get('status', 'active'),
-                question_owner.get('restrictionLevel', 0),
-                question_owner.get('badges', []),
-                question_owner.get('avatar'),
-                question_owner.get('community_interactions', {}),
-                question_owner.get('community_bans', {})
-            )
-            question_owner_obj.createNotification(
-                message=f"{current_user.username} answered your question: {question['title']}",
-                type="answer",
-                relatedId=str(result.inserted_id),
-                db=mongo.db
-            )
+    if not trusted and str(question_owner_id) != current_user.id:
+        notifications.notify(
+            mongo.db,
+            question_owner_id,
+            f"{current_user.username} answered your question: {question['title']}",
+            "answer",
+            str(result.inserted_id)
+        )
 
     current_user.trackInteraction(community_id, "answers", mongo.db)
 
@@ -573,7 +634,7 @@ def answer_question(question_id):
 def get_answers(question_id):
     print("get_answers route called")
     try:
-        answers = mongo.db.answers.find({"questionId": ObjectId(question_id)})
+        answers = mongo.db.answers.find(dict(moderation_queue.VISIBLE, questionId=ObjectId(question_id)))
         answers_list = []
         for answer in answers:
             answers_list.append({
@@ -588,186 +649,88 @@ def get_answers(question_id):
     except Exception as e:
         return jsonify({'message': 'Error fetching answers', 'error': str(e)}), 500
 
+@app.errorhandler(VoteConflict)
+def vote_conflict(e):
+    print(f"Vote conflict: {str(e)}")
+    return jsonify({'message': 'Vote is being changed by another request, please try again'}), 409
+
+VOTE_MESSAGES = {
+    "recorded": 'Vote recorded',
+    "updated": 'Vote updated',
+    "removed": 'Vote removed',
+    "unchanged": 'Vote unchanged'
+}
+
+def parse_vote(data):
+    """Return (kind, target ObjectId, value) for one vote payload, or raise ValueError/InvalidId."""
+    question_id = data.get('questionId')
+    answer_id = data.get('answerId')
+    if question_id:
+        return "question", ObjectId(question_id), data.get('value')
+    if answer_id:
+        return "answer", ObjectId(answer_id), data.get('value')
+    raise ValueError('Must provide questionId or answerId')
+
 @app.route('/vote', methods=['POST'])
 @login_required
 def vote():
     try:
         data = request.get_json()
-        question_id = data.get('questionId')
-        answer_id = data.get('answerId')
-        value = data.get('value')
+        try:
+            kind, target_id, value = parse_vote(data)
+        except (ValueError, InvalidId) as e:
+            return jsonify({'message': str(e)}), 400
 
         if value not in [1, -1]:
             return jsonify({'message': 'Invalid vote value'}), 400
 
-        if question_id:
-            question = mongo.db.questions.find_one({"_id": ObjectId(question_id)})
-            if not question:
-                return jsonify({'message': 'Question not found'}), 404
+        result = vote_engine.cast_vote(mongo.db, current_user, kind, target_id, value)
+        if result is None:
+            return jsonify({'message': f'{kind.capitalize()} not found'}), 404
+        return jsonify({'message': VOTE_MESSAGES[result["status"]], 'newVote': result["newVote"]}), 200
 
-            existing_vote = mongo.db.votes.find_one({
-                "memberId": ObjectId(current_user.id),
-                "questionId": ObjectId(question_id)
-            })
-
-            # Notify the question owner (if the voter is not the question owner)
-            question_owner_id = question["memberId"]
-            if str(question_owner_id) != current_user.id:
-                question_owner = mongo.db.users.find_one({"_id": question_owner_id})
-                if question_owner:
-                    question_owner_obj = Member(
-                        str(question_owner['_id']),
-                        question_owner['username'],
-                        question_owner['email'],
-                        question_owner['password'],
-                        question_owner.get('dateJoined'),
-                        question_owner.get('reputation', 0),
-                        question_owner.get('status', 'active'),
-                        question_owner.get('restrictionLevel', 0),
-                        question_owner.get('badges', []),
-                        question_owner.get('avatar'),
-                        question_owner.get('community_interactions', {}),
-                        question_owner.get('community_bans', {})
-                    )
-                    vote_action = "upvoted" if value == 1 else "downvoted"
-                    if not existing_vote:  # New vote
-                        question_owner_obj.createNotification(
-                            message=f"{current_user.username} {vote_action} your question: {question['title']}",
-                            type="vote",
-                            relatedId=str(question_id),
-                            db=mongo.db
-                        )
-                    elif existing_vote['value'] != value:  # Vote changed
-                        question_owner_obj.createNotification(
-                            message=f"{current_user.username} changed their vote to {vote_action} on your question: {question['title']}",
-                            type="vote",
-                            relatedId=str(question_id),
-                            db=mongo.db
-                        )
-
-            if existing_vote:
-                if existing_vote['value'] == value:
-                    mongo.db.votes.delete_one({
-                        "memberId": ObjectId(current_user.id),
-                        "questionId": ObjectId(question_id)
-                    })
-                    mongo.db.questions.update_one(
-                        {"_id": ObjectId(question_id)},
-                        {"$inc": {"score": -value}}
-                    )
-                    return jsonify({'message': 'Vote removed', 'newVote': 0}), 200
-                else:
-                    mongo.db.votes.update_one(
-                        {"memberId": ObjectId(current_user.id), "questionId": ObjectId(question_id)},
-                        {"$set": {"value": value}}
-                    )
-                    old_value = existing_vote['value']
-                    score_change = -old_value + value
-                    mongo.db.questions.update_one(
-                        {"_id": ObjectId(question_id)},
-                        {"$inc": {"score": score_change}}
-                    )
-                    return jsonify({'message': 'Vote updated', 'newVote': value}), 200
-            else:
-                mongo.db.votes.insert_one({
-                    "memberId": ObjectId(current_user.id),
-                    "questionId": ObjectId(question_id),
-                    "value": value,
-                    "date": datetime.utcnow()
-                })
-                mongo.db.questions.update_one(
-                    {"_id": ObjectId(question_id)},
-                    {"$inc": {"score": value}}
-                )
-                return jsonify({'message': 'Vote recorded', 'newVote': value}), 200
-
-        elif answer_id:
-            answer = mongo.db.answers.find_one({"_id": ObjectId(answer_id)})
-            if not answer:
-                return jsonify({'message': 'Answer not found'}), 404
-
-            existing_vote = mongo.db.votes.find_one({
-                "memberId": ObjectId(current_user.id),
-                "answerId": ObjectId(answer_id)
-            })
-
-            # Notify the answer owner (if the voter is not the answer owner)
-            answer_owner_id = answer["memberId"]
-            if str(answer_owner_id) != current_user.id:
-                answer_owner = mongo.db.users.find_one({"_id": answer_owner_id})
-                if answer_owner:
-                    answer_owner_obj = Member(
-                        str(answer_owner['_id']),
-                        answer_owner['username'],
-                        answer_owner['email'],
-                        answer_owner['password'],
-                        answer_owner.get('dateJoined'),
-                        answer_owner.get('reputation', 0),
-                        question_owner.get('status', 'active'),
-                        question_owner.get('restrictionLevel', 0),
-                        question_owner.get('badges', []),
-                        question_owner.get('avatar'),
-                        question_owner.get('community_interactions', {}),
-                        question_owner.get('community_bans', {})
-                    )
-                    vote_action = "upvoted" if value == 1 else "downvoted"
-                    if not existing_vote:  # New vote
-                        answer_owner_obj.createNotification(
-                            message=f"{current_user.username} {vote_action} your answer",
-                            type="vote",
-                            relatedId=str(answer_id),
-                            db=mongo.db
-                        )
-                    elif existing_vote['value'] != value:  # Vote changed
-                        answer_owner_obj.createNotification(
-                            message=f"{current_user.username} changed their vote to {vote_action} on your answer",
-                            type="vote",
-                            relatedId=str(answer_id),
-                            db=mongo.db
-                        )
-
-            if existing_vote:
-                if existing_vote['value'] == value:
-                    mongo.db.votes.delete_one({
-                        "memberId": ObjectId(current_user.id),
-                        "answerId": ObjectId(answer_id)
-                    })
-                    mongo.db.answers.update_one(
-                        {"_id": ObjectId(answer_id)},
-                        {"$inc": {"score": -value}}
-                    )
-                    return jsonify({'message': 'Vote removed', 'newVote': 0}), 200
-                else:
-                    mongo.db.votes.update_one(
-                        {"memberId": ObjectId(current_user.id), "answerId": ObjectId(answer_id)},
-                        {"$set": {"value": value}}
-                    )
-                    old_value = existing_vote['value']
-                    score_change = -old_value + value
-                    mongo.db.answers.update_one(
-                        {"_id": ObjectId(answer_id)},
-                        {"$inc": {"score": score_change}}
-                    )
-                    return jsonify({'message': 'Vote updated', 'newVote': value}), 200
-            else:
-                mongo.db.votes.insert_one({
-                    "memberId": ObjectId(current_user.id),
-                    "answerId": ObjectId(answer_id),
-                    "value": value,
-                    "date": datetime.utcnow()
-                })
-                mongo.db.answers.update_one(
-                    {"_id": ObjectId(answer_id)},
-                    {"$inc": {"score": value}}
-                )
-                return jsonify({'message': 'Vote recorded', 'newVote': value}), 200
+    except VoteConflict:
+        raise
+    except Exception as e:
+        return jsonify({'message': 'Error voting', 'error': str(e)}), 500
 
-        else:
-            return jsonify({'message': 'Must provide questionId or answerId'}), 400
+@app.route('/votes/bulk', methods=['POST'])
+@login_required
+def bulk_vote():
+    """
+    Sync many votes at once. Each entry sets the final vote (1, -1, or 0 to clear)
+    rather than toggling, so a client can safely resend a batch it is unsure about.
+    """
+    print("bulk_vote route called")
+    data = request.get_json() or {}
+    entries = data.get('votes')
+    if not isinstance(entries, list) or not entries:
+        return jsonify({'message': 'votes must be a non-empty list'}), 400
+    if len(entries) > Config.VOTE_BULK_MAX:
+        return jsonify({'message': f'At most {Config.VOTE_BULK_MAX} votes per request'}), 413
+
+    votes = []
+    for i, entry in enumerate(entries):
+        try:
+            kind, target_id, value = parse_vote(entry if isinstance(entry, dict) else {})
+        except (ValueError, InvalidId) as e:
+            return jsonify({'message': f'Invalid vote at index {i}: {str(e)}'}), 400
+        if value not in [1, -1, 0]:
+            return jsonify({'message': f'Invalid vote value at index {i}'}), 400
+        votes.append((kind, target_id, value))
 
+    try:
+        results = vote_engine.cast_votes(mongo.db, current_user, votes)
     except Exception as e:
         return jsonify({'message': 'Error voting', 'error': str(e)}), 500
 
+    return jsonify({
+        'results': [
+            {'questionId' if kind == "question" else 'answerId': str(target_id), **result}
+            for (kind, target_id, _), result in zip(votes, results)
+        ]
+    }), 200
+
 @app.route('/profile', methods=['PUT'])
 @login_required
 def edit_profile():
@@ -790,6 +753,7 @@ def edit_profile():
         {"_id": ObjectId(current_user.get_id())},
         {"$set": {"email": email, "username": username}}
     )
+    invalidate(f"user:{current_user.get_id()}")
     return jsonify({'message': 'Profile updated successfully', 'username': username}), 200
 
 @app.route('/password', methods=['PUT'])
@@ -814,19 +778,21 @@ def change_password():
         return jsonify({'message': 'Password must be at least 8 characters long'}), 400
 
     # Hash the new password and update
-    hashed_password = bcrypt.generate_password_hash(new_password).decode('utf-8')
+    hashed_password = passwords.hash_password(new_password)
     current_user.changePassword(hashed_password)
     mongo.db.users.update_one(
         {"_id": ObjectId(current_user.get_id())},
         {"$set": {"password": hashed_password}}
     )
+    invalidate(f"user:{current_user.get_id()}")
     return jsonify({'message': 'Password changed successfully'}), 200
 
 @app.route('/questions/<question_id>', methods=['GET'])
+@cached('question', Config.CACHE_QUESTION_TTL, tags=lambda question_id: [f"question:{question_id}"])
 def get_question(question_id):
     print("get_question route called")
     try:
-        question = mongo.db.questions.find_one({"_id": ObjectId(question_id)})
+        question = mongo.db.questions.find_one(dict(moderation_queue.VISIBLE, _id=ObjectId(question_id)))
         if not question:
             return jsonify({'message': 'Question not found'}), 404
 
@@ -838,7 +804,8 @@ def get_question(question_id):
             "communityId": question["communityId"],
             "memberId": str(question["memberId"]),
             "score": question.get("score", 0),
-            "views": question.get("views", 0),
+            # Include views still buffered in this worker so a viewer sees their own view
+            "views": question.get("views", 0) + view_counter.get_counter(mongo.db).pending(question["_id"]),
             "answers": question.get("answers", 0)
         }), 200
     except Exception as e:
@@ -857,7 +824,7 @@ def delete_question(question_id):
             return jsonify({'message': 'Unauthorized: You can only delete your own questions'}), 403
 
         # Delete answers associated with the question
-        answers = mongo.db.answers.find({"questionId": ObjectId(question_id)})
+        answers = list(mongo.db.answers.find({"questionId": ObjectId(question_id)}, {"memberId": 1, "dateCreated": 1, "moderation": 1}))
         answer_ids = [answer["_id"] for answer in answers]
 
         # Delete notifications related to the question (type="vote" or type="answer")
@@ -872,6 +839,23 @@ def delete_question(question_id):
         mongo.db.answers.delete_many({"questionId": ObjectId(question_id)})
         mongo.db.votes.delete_many({"questionId": ObjectId(question_id)})
         mongo.db.questions.delete_one({"_id": ObjectId(question_id)})
+        get_community_validator(mongo.db).question_index.remove(question_id)
+
+        # Take the question and its answers back out of the day they were counted on
+        community_id = question.get("communityId")
+        changes = [
+            rollups.user(question["memberId"], "questions", -1, question.get("dateCreated")),
+            rollups.community(community_id, "questions", -1, question.get("dateCreated"))
+        ]
+        # Pending and hidden answers were never counted
+        for answer in answers:
+            if answer.get("moderation") in (moderation_queue.PENDING, moderation_queue.HIDDEN):
+                continue
+            changes.append(rollups.user(answer["memberId"], "answers", -1, answer.get("dateCreated")))
+            changes.append(rollups.community(community_id, "answers", -1, answer.get("dateCreated")))
+        rollups.record(mongo.db, *changes)
+        background.submit_heavy(feeds.remove_question, mongo.db, question_id)
+        invalidate(f"question:{question_id}")
 
         return jsonify({'message': 'Question deleted successfully'}), 200
     except Exception as e:
@@ -897,12 +881,22 @@ def delete_answer(answer_id):
             ]
         })
 
-        # Delete the answer and update the question's answer count
+        # Delete the answer and update the question's answer count; a hidden answer was
+        # already taken out of it, and neither hidden nor pending ones are in the rollups
         mongo.db.answers.delete_one({"_id": ObjectId(answer_id)})
-        mongo.db.questions.update_one(
+        state = answer.get("moderation")
+        question = mongo.db.questions.find_one_and_update(
             {"_id": answer['questionId']},
-            {"$inc": {"answers": -1}}
+            {"$inc": {"answers": 0 if state == moderation_queue.HIDDEN else -1}},
+            projection={"communityId": 1}
         )
+        invalidate(f"question:{answer['questionId']}")
+        if question and state not in (moderation_queue.PENDING, moderation_queue.HIDDEN):
+            rollups.record(
+                mongo.db,
+                rollups.user(answer["memberId"], "answers", -1, answer.get("dateCreated")),
+                rollups.community(question.get("communityId"), "answers", -1, answer.get("dateCreated"))
+            )
 
         return jsonify({'message': 'Answer deleted successfully'}), 200
     except Exception as e:
@@ -939,18 +933,15 @@ def update_answer(answer_id):
 
         community_id = question['communityId']
         print(f"Checking for ban in community ID: {community_id}")
-        ban = mongo.db.community_bans.find_one({
-            "memberId": ObjectId(current_user.id),
-            "communityId": community_id
-        })
-        if ban and ban['expiresAt'] > datetime.utcnow():
-            print(f"User is banned until {ban['expiresAt']}")
+        ban_expires = moderation.active_ban(current_user, community_id)
+        if ban_expires:
+            print(f"User is banned until {ban_expires}")
             return jsonify({
-                'message': f"User is banned from this community until {ban['expiresAt'].isoformat()}"
+                'message': f"User is banned from this community until {ban_expires.isoformat()}"
             }), 403
 
         print(f"Validating content relevance for community ID: {community_id}")
-        validation_result = community_validator.validate_content(content, community_id)
+        validation_result = get_community_validator(mongo.db).validate_content(content, community_id)
         if validation_result is None:
             print("Community not found")
             return jsonify({'message': 'Community not found'}), 404
@@ -974,61 +965,9 @@ def update_answer(answer_id):
         )
         if warning:
             print(f"Inappropriate content detected: {warning}")
-            # Update inappropriate_content collection
-            mongo.db.inappropriate_content.insert_one({
-                "content": content,
-                "memberId": ObjectId(current_user.id),
-                "communityId": community_id,
-                "questionId": str(answer['questionId']),
-                "answerId": answer_id,
-                "timestamp": datetime.utcnow(),
-                "keys": ["toxicity"],  # Adjust based on AIContentFilter logic
-                "isProcessed": False
-            })
-            # Increment restrictionLevel
-            user = mongo.db.users.find_one({"_id": ObjectId(current_user.id)})
-            restriction_level = (user.get('restrictionLevel', 0) or 0) + 1
-            mongo.db.users.update_one(
-                {"_id": ObjectId(current_user.id)},
-                {"$set": {"restrictionLevel": restriction_level}}
-            )
-            # Create notification
-            attempts_left = 5 - restriction_level
-            feedback = f"You have {attempts_left} attempts left before a ban in community {community_id}."
-            if attempts_left <= 2 and attempts_left > 0:
-                feedback = f"Warning: You will be banned from this community if you reach 5 inappropriate attempts ({attempts_left} attempts left)."
-            elif attempts_left <= 0:
-                ban_duration_days = 1
-                ban_expires = datetime.utcnow() + timedelta(days=ban_duration_days)
-                mongo.db.community_bans.insert_one({
-                    "memberId": ObjectId(current_user.id),
-                    "communityId": community_id,
-                    "startDate": datetime.utcnow(),
-                    "expiresAt": ban_expires,
-                    "reason": "Exceeded inappropriate content attempts"
-                })
-                # Clear inappropriate_content for this user and community
-                mongo.db.inappropriate_content.delete_many({
-                    "memberId": ObjectId(current_user.id),
-                    "communityId": community_id
-                })
-                feedback = f"You have been banned from this community for {ban_duration_days} day(s). Ban expires on {ban_expires.isoformat()}."
-                mongo.db.users.update_one(
-                    {"_id": ObjectId(current_user.id)},
-                    {"$set": {"restrictionLevel": 0}}
-                )
-
-            mongo.db.notifications.insert_one({
-                "memberId": ObjectId(current_user.id),
-                "type": "inappropriate",
-                "message": feedback,
-                "isRead": False,
-                "createdAt": datetime.utcnow(),
-                "communityId": community_id
-            })
             return jsonify({
                 'message': 'Content flagged as inappropriate',
-                'feedback': feedback
+                'feedback': warning
             }), 400
 
         print("Updating answer in database")
@@ -1048,6 +987,8 @@ def update_answer(answer_id):
             'content': updated_answer_doc['content'],
             'dateUpdated': updated_answer_doc['dateUpdated'].isoformat()
         }), 200
+    except InferenceUnavailable:
+        raise
     except Exception as e:
         print(f"Error in update_answer: {str(e)}")
         return jsonify({'message': 'Error updating answer', 'error': str(e)}), 500
@@ -1081,6 +1022,18 @@ def get_user_votes():
     except Exception as e:
         return jsonify({'message': 'Error fetching user votes', 'error': str(e)}), 500
 
+def badge_counts():
+    names = [badge["name"] for badge in BADGES]
+    return {
+        row["_id"]: row["count"]
+        for row in mongo.db.users.aggregate([
+            {"$match": {"badges": {"$in": names}}},
+            {"$unwind": "$badges"},
+            {"$match": {"badges": {"$in": names}}},
+            {"$group": {"_id": "$badges", "count": {"$sum": 1}}}
+        ])
+    }
+
 @app.route('/badges', methods=['GET'])
 @login_required
 def get_badges():
@@ -1096,6 +1049,10 @@ def get_badges():
                 {"_id": ObjectId(current_user.get_id())},
                 {"$set": {"badges": current_user.badges}}
             )
+            invalidate("badges", f"user:{current_user.get_id()}")
+
+    # Number of users holding each badge: one aggregate, cached until a badge is awarded
+    counts = cache.get_or_set('badgeCounts', 'badge_counts', badge_counts, Config.CACHE_BADGE_COUNTS_TTL, tags=["badges"])
 
     # Prepare the response with all badges and their earned status
     badges_with_status = []
@@ -1105,7 +1062,7 @@ def get_badges():
             "description": badge["description"],
             "type": badge["type"],
             "earned": badge["name"] in current_user.badges,
-            "count": mongo.db.users.count_documents({"badges": badge["name"]})  # Number of users who have this badge
+            "count": counts.get(badge["name"], 0)
         })
 
     return jsonify({"badges": badges_with_status}), 200
@@ -1120,40 +1077,37 @@ def view_score():
 @login_required
 def get_recommended_questions():
     print("get_recommended_questions route called")
-    member_communities = mongo.db.member_communities.find({"memberId": ObjectId(current_user.get_id())})
-    community_ids = [mc["communityId"] for mc in member_communities]
-    
-    if not community_ids:
-        return jsonify([]), 200
-
-    questions = mongo.db.questions.find({
-        "communityId": {"$in": community_ids}
-    }).sort([
-        ("score", -1),
-        ("dateCreated", -1)
-    ]).limit(5)
-
-    response = []
-    for question in questions:
-        member = mongo.db.users.find_one({"_id": ObjectId(question["memberId"])})
-        username = member["username"] if member else "Unknown"
-        
-        response.append({
-            "_id": str(question["_id"]),
-            "title": question["title"],
-            "dateCreated": question["dateCreated"].isoformat(),
-            "user": username
-        })
-    return jsonify(response), 200
+    try:
+        limit = min(max(int(request.args.get('limit', 5)), 1), Config.FEED_SIZE)
+    except ValueError:
+        return jsonify({'message': 'Invalid limit'}), 400
+
+    # Ranked offline by app/feeds.py; the request only reads the stored list
+    feed = feeds.get_feed(mongo.db, current_user.get_id(), limit)
+    return jsonify([{
+        "_id": str(item["questionId"]),
+        "title": item["title"],
+        "dateCreated": item["dateCreated"].isoformat(),
+        "user": item["user"]
+    } for item in feed]), 200
 
 @app.route('/questions/<question_id>/view', methods=['POST'])
 def increment_question_views(question_id):
     print("increment_question_views route called")
     try:
-        mongo.db.questions.update_one(
-            {"_id": ObjectId(question_id)},
-            {"$inc": {"views": 1}}
-        )
+        try:
+            question_oid = ObjectId(question_id)
+        except InvalidId:
+            return jsonify({'message': 'Invalid question ID'}), 400
+
+        # Buffered and written in batches; repeat views by the same visitor are ignored for a while
+        if current_user.is_authenticated:
+            visitor = current_user.get_id()
+        else:
+            # Set from X-Forwarded-For by ProxyFix, trusting only the configured proxies
+            visitor = request.remote_addr
+        if not view_counter.get_counter(mongo.db).record(question_oid, visitor):
+            return jsonify({'message': 'View already counted'}), 200
         return jsonify({'message': 'View count incremented'}), 200
     except Exception as e:
         return jsonify({'message': 'Error incrementing views', 'error': str(e)}), 500
@@ -1171,69 +1125,66 @@ def get_user_communities():
     except Exception as e:
         return jsonify({'message': 'Error fetching communities', 'error': str(e)}), 500
 
+NOTIFICATION_SORT = [("createdAt", -1), ("_id", -1)]
+
 @app.route('/notifications', methods=['GET'])
 @login_required
 def get_notifications():
     print("get_notifications route called")
     try:
-        notifications = mongo.db.notifications.find({"memberId": ObjectId(current_user.id)}).sort("dateCreated", -1)
-        response = []
-        for notification in notifications:
-            # Skip notifications if the related question or answer is deleted
-            if notification["type"] in ["answer", "vote"]:
-                if notification["relatedId"]:
-                    if notification["type"] == "answer":
-                        # Check if the answer exists
-                        answer = mongo.db.answers.find_one({"_id": ObjectId(notification["relatedId"])})
-                        if not answer:
-                            continue  # Skip if answer is deleted
-                        # Check if the question exists
-                        question = mongo.db.questions.find_one({"_id": answer["questionId"]})
-                        if not question:
-                            continue  # Skip if question is deleted
-                        notification_data = {
-                            "_id": str(notification["_id"]),
-                            "message": notification["message"],
-                            "type": notification["type"],
-                            "relatedId": str(notification["relatedId"]),
-                            "read": notification["read"],
-                            "dateCreated": notification.get("createdAt", notification.get("dateCreated")).isoformat(),
-                            "questionId": str(answer["questionId"])
-                        }
-                    elif notification["type"] == "vote":
-                        # For vote notifications, relatedId can be a questionId or answerId
-                        related_id = notification["relatedId"]
-                        question = mongo.db.questions.find_one({"_id": ObjectId(related_id)})
-                        answer = mongo.db.answers.find_one({"_id": ObjectId(related_id)})
-                        if not question and not answer:
-                            continue  # Skip if neither question nor answer exists
-                        question_id = related_id if question else str(answer["questionId"])
-                        notification_data = {
-                            "_id": str(notification["_id"]),
-                            "message": notification["message"],
-                            "type": notification["type"],
-                            "relatedId": str(notification["relatedId"]),
-                            "read": notification["read"],
-                            "dateCreated": notification.get("createdAt", notification.get("dateCreated")).isoformat(),
-                            "questionId": question_id
-                        }
-                else:
-                    continue  # Skip if relatedId is missing
-            else:
-                # For other types (e.g., badge, ban, warning), no relatedId validation needed
-                notification_data = {
-                    "_id": str(notification["_id"]),
-                    "message": notification["message"],
-                    "type": notification["type"],
-                    "relatedId": str(notification["relatedId"]) if notification["relatedId"] else None,
-                    "read": notification["read"],
-                    "dateCreated": notification.get("createdAt", notification.get("dateCreated")).isoformat()
-                }
-            response.append(notification_data)
+        docs = list(mongo.db.notifications.find({"memberId": ObjectId(current_user.id)}).sort(NOTIFICATION_SORT))
+        response, dangling_ids = resolve_notifications(mongo.db, docs)
+        # Notifications about deleted posts are dropped from this response and removed off the request path
+        background.submit(delete_notifications, mongo.db, dangling_ids)
         return jsonify(response), 200
     except Exception as e:
         return jsonify({'message': 'Error fetching notifications', 'error': str(e)}), 500
 
+@app.route('/api/notifications', methods=['GET'])
+@login_required
+def get_notification_feed():
+    print("get_notification_feed route called")
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+        query = {"memberId": ObjectId(current_user.id)}
+        if request.args.get('unread', '').lower() in ('1', 'true'):
+            query["read"] = {"$ne": True}
+
+        notifications, next_cursor = paginate(
+            mongo.db.notifications,
+            query,
+            NOTIFICATION_SORT,
+            limit,
+            cursor=request.args.get('cursor')
+        )
+        response, dangling_ids = resolve_notifications(mongo.db, notifications)
+        background.submit(delete_notifications, mongo.db, dangling_ids)
+        return jsonify({
+            "notifications": response,
+            "nextCursor": next_cursor
+        }), 200
+    except InvalidCursor as e:
+        return jsonify({'message': 'Invalid cursor', 'error': str(e)}), 400
+    except ValueError as e:
+        return jsonify({'message': 'Invalid limit', 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'message': 'Error fetching notifications', 'error': str(e)}), 500
+
+@app.route('/notifications/stream', methods=['GET'])
+@login_required
+def stream_notifications():
+    """Server-sent events: the unread count on connect, then each new notification as it is written."""
+    print("stream_notifications route called")
+    try:
+        events = notification_stream.stream(mongo.db, ObjectId(current_user.id))
+    except TooManyConnections as e:
+        return jsonify({'message': str(e)}), 429
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/notifications/mark-read', methods=['POST'])
 @login_required
 def mark_notifications_read():
@@ -1244,7 +1195,7 @@ def mark_notifications_read():
         if not notification_ids:
             # Mark all notifications as read if no specific IDs are provided
             mongo.db.notifications.update_many(
-                {"memberId": ObjectId(current_user.id), "read": False},
+                {"memberId": ObjectId(current_user.id), "read": {"$ne": True}},
                 {"$set": {"read": True}}
             )
             return jsonify({'message': 'All notifications marked as read'}), 200
@@ -1282,7 +1233,10 @@ def get_user_profile(user_id):
     print("get_user_profile route called")
     try:
         # Fetch the user data
-        user = mongo.db.users.find_one({"_id": ObjectId(user_id)})
+        user = mongo.db.users.find_one(
+            {"_id": ObjectId(user_id)},
+            {"username": 1, "avatarHash": 1, "avatar": 1, "status": 1, "reputation": 1, "dateJoined": 1, "badges": 1}
+        )
         if not user:
             return jsonify({'message': 'User not found'}), 404
 
@@ -1295,7 +1249,7 @@ def get_user_profile(user_id):
         # Prepare the response
         profile_data = {
             "username": user["username"],
-            "avatar": user.get("avatar"),
+            "avatar": avatars.url(user),
             "questionsCount": questions_count,
             "answersCount": answers_count,
             "status": user.get("status", "active"),
@@ -1307,137 +1261,56 @@ def get_user_profile(user_id):
     except Exception as e:
         return jsonify({'message': 'Error fetching user profile', 'error': str(e)}), 400
 
+def calculate_trend(current, previous):
+    if previous == 0:
+        return 100 if current > 0 else 0
+    return round(((current - previous) / previous) * 100)
+
+def weekly_activity(docs, now):
+    # Questions + answers for each of the last 7 days, oldest first
+    return [rollups.daily(docs, ("questions", "answers"), now - timedelta(days=(6 - i))) for i in range(7)]
+
 @app.route('/api/users/me/stats', methods=['GET'])
 @login_required
 def get_user_stats():
     try:
         user_id = ObjectId(current_user.id)
-        
-        # Get current date and calculate time ranges
         now = datetime.utcnow()
-        one_year_ago = now - timedelta(days=365)
-        one_week_ago = now - timedelta(days=7)
         current_month = now.month - 1  # 0-based index
         prev_month = current_month - 1 if current_month > 0 else 11
-        
-        # Initialize monthly arrays with zeros
-        monthly_questions = [0] * 12
-        monthly_answers = [0] * 12
-        monthly_votes = [0] * 12
-        
-        # Get monthly questions
-        questions = mongo.db.questions.aggregate([
-            {"$match": {
-                "memberId": user_id,
-                "dateCreated": {"$gte": one_year_ago}
-            }},
-            {"$group": {
-                "_id": {"$month": "$dateCreated"},
-                "count": {"$sum": 1}
-            }}
-        ])
-        
-        for q in questions:
-            month_index = q['_id'] - 1
-            if 0 <= month_index < 12:
-                monthly_questions[month_index] = q['count']
-        
-        # Get monthly answers
-        answers = mongo.db.answers.aggregate([
-            {"$match": {
-                "memberId": user_id,
-                "dateCreated": {"$gte": one_year_ago}
-            }},
-            {"$group": {
-                "_id": {"$month": "$dateCreated"},
-                "count": {"$sum": 1}
-            }}
-        ])
-        
-        for a in answers:
-            month_index = a['_id'] - 1
-            if 0 <= month_index < 12:
-                monthly_answers[month_index] = a['count']
-        
-        # Get monthly votes
-        votes = mongo.db.votes.aggregate([
-            {"$match": {
-                "memberId": user_id,
-                "date": {"$gte": one_year_ago}
-            }},
-            {"$group": {
-                "_id": {"$month": "$date"},
-                "count": {"$sum": 1}
-            }}
-        ])
-        
-        for v in votes:
-            month_index = v['_id'] - 1
-            if 0 <= month_index < 12:
-                monthly_votes[month_index] = v['count']
-        
-        # Weekly activity (last 7 days)
-        weekly_activity = [0] * 7  # Sunday to Saturday
-        
-        # Get daily activity counts (questions + answers)
-        for i in range(7):
-            day_start = now - timedelta(days=(6-i))
-            day_end = day_start + timedelta(days=1)
-            
-            # Count questions
-            weekly_activity[i] += mongo.db.questions.count_documents({
-                "memberId": user_id,
-                "dateCreated": {"$gte": day_start, "$lt": day_end}
-            })
-            
-            # Count answers
-            weekly_activity[i] += mongo.db.answers.count_documents({
-                "memberId": user_id,
-                "dateCreated": {"$gte": day_start, "$lt": day_end}
-            })
-        
-        # Calculate trends
-        def calculate_trend(current, previous):
-            if previous == 0:
-                return 100 if current > 0 else 0
-            return round(((current - previous) / previous) * 100)
-        
-        question_trend = calculate_trend(monthly_questions[current_month], monthly_questions[prev_month])
-        answer_trend = calculate_trend(monthly_answers[current_month], monthly_answers[prev_month])
-        vote_trend = calculate_trend(monthly_votes[current_month], monthly_votes[prev_month])
-        
+
+        # Counters are maintained incrementally in activity_rollups; see app/rollups.py
+        docs = rollups.load(mongo.db, "user", user_id, now)
+        monthly_questions = rollups.monthly(docs, "questions", now)
+        monthly_answers = rollups.monthly(docs, "answers", now)
+        monthly_votes = rollups.monthly(docs, "votes", now)
+
         # For views trend, we need to implement monthly views tracking
         view_trend = 0  # Placeholder - implement similar to others
-        
-        # Total counts
-        total_questions = mongo.db.questions.count_documents({"memberId": user_id})
-        total_answers = mongo.db.answers.count_documents({"memberId": user_id})
-        total_votes = mongo.db.votes.count_documents({"memberId": user_id})
-        
+
         # Total views (sum of all question views)
         total_views_result = mongo.db.questions.aggregate([
             {"$match": {"memberId": user_id}},
             {"$group": {"_id": None, "total": {"$sum": "$views"}}}
         ])
-        
         total_views = next(total_views_result, {}).get('total', 0)
-        
+
         return jsonify({
             "monthlyQuestions": monthly_questions,
             "monthlyAnswers": monthly_answers,
             "monthlyVotes": monthly_votes,
-            "weeklyActivity": weekly_activity,
-            "totalQuestions": total_questions,
-            "totalAnswers": total_answers,
-            "totalVotes": total_votes,
+            "weeklyActivity": weekly_activity(docs, now),
+            "totalQuestions": rollups.total(docs, "questions"),
+            "totalAnswers": rollups.total(docs, "answers"),
+            "totalVotes": rollups.total(docs, "votes"),
             "totalViews": total_views,
-            "questionTrend": question_trend,
-            "answerTrend": answer_trend,
-            "voteTrend": vote_trend,
+            "questionTrend": calculate_trend(monthly_questions[current_month], monthly_questions[prev_month]),
+            "answerTrend": calculate_trend(monthly_answers[current_month], monthly_answers[prev_month]),
+            "voteTrend": calculate_trend(monthly_votes[current_month], monthly_votes[prev_month]),
             "viewTrend": view_trend,
             "success": True
         }), 200
-        
+
     except Exception as e:
         print(f"Error fetching user stats: {str(e)}")
         return jsonify({
@@ -1445,131 +1318,39 @@ def get_user_stats():
             "error": str(e),
             "success": False
         }), 500
-    
+
 @app.route('/api/communities/<int:community_id>/stats', methods=['GET'])
 @login_required
 def get_community_stats(community_id):
     try:
-        # Get current date and calculate time ranges
         now = datetime.utcnow()
-        one_year_ago = now - timedelta(days=365)
-        one_week_ago = now - timedelta(days=7)
         current_month = now.month - 1  # 0-based index
         prev_month = current_month - 1 if current_month > 0 else 11
-        
-        # Initialize monthly arrays with zeros
-        monthly_questions = [0] * 12
-        monthly_answers = [0] * 12
-        monthly_users = [0] * 12
-        
-        # Get monthly questions
-        questions = mongo.db.questions.aggregate([
-            {"$match": {
-                "communityId": community_id,
-                "dateCreated": {"$gte": one_year_ago}
-            }},
-            {"$group": {
-                "_id": {"$month": "$dateCreated"},
-                "count": {"$sum": 1}
-            }}
-        ])
-        
-        for q in questions:
-            month_index = q['_id'] - 1
-            if 0 <= month_index < 12:
-                monthly_questions[month_index] = q['count']
-        
-        # Get monthly answers
-        answers = mongo.db.answers.aggregate([
-            {"$match": {
-                "questionId": {"$in": [q["_id"] for q in mongo.db.questions.find({"communityId": community_id}, {"_id": 1})]},
-                "dateCreated": {"$gte": one_year_ago}
-            }},
-            {"$group": {
-                "_id": {"$month": "$dateCreated"},
-                "count": {"$sum": 1}
-            }}
-        ])
-        
-        for a in answers:
-            month_index = a['_id'] - 1
-            if 0 <= month_index < 12:
-                monthly_answers[month_index] = a['count']
-        
-        # Get monthly new users
-        users = mongo.db.member_communities.aggregate([
-            {"$match": {
-                "communityId": community_id,
-                "dateJoined": {"$gte": one_year_ago}
-            }},
-            {"$group": {
-                "_id": {"$month": "$dateJoined"},
-                "count": {"$sum": 1}
-            }}
-        ])
-        
-        for u in users:
-            month_index = u['_id'] - 1
-            if 0 <= month_index < 12:
-                monthly_users[month_index] = u['count']
-        
-        # Weekly activity (last 7 days)
-        weekly_activity = [0] * 7  # Sunday to Saturday
-        
-        # Get daily activity counts (questions + answers)
-        for i in range(7):
-            day_start = now - timedelta(days=(6-i))
-            day_end = day_start + timedelta(days=1)
-            
-            # Count questions
-            weekly_activity[i] += mongo.db.questions.count_documents({
-                "communityId": community_id,
-                "dateCreated": {"$gte": day_start, "$lt": day_end}
-            })
-            
-            # Count answers
-            weekly_activity[i] += mongo.db.answers.count_documents({
-                "questionId": {"$in": [q["_id"] for q in mongo.db.questions.find({"communityId": community_id}, {"_id": 1})]},
-                "dateCreated": {"$gte": day_start, "$lt": day_end}
-            })
-        
-        # Calculate trends
-        def calculate_trend(current, previous):
-            if previous == 0:
-                return 100 if current > 0 else 0
-            return round(((current - previous) / previous) * 100)
-        
-        question_trend = calculate_trend(monthly_questions[current_month], monthly_questions[prev_month])
-        answer_trend = calculate_trend(monthly_answers[current_month], monthly_answers[prev_month])
-        user_trend = calculate_trend(monthly_users[current_month], monthly_users[prev_month])
-        
-        # Total counts
-        total_questions = mongo.db.questions.count_documents({"communityId": community_id})
-        total_answers = mongo.db.answers.count_documents({
-            "questionId": {"$in": [q["_id"] for q in mongo.db.questions.find({"communityId": community_id}, {"_id": 1})]}
-        })
-        
-        # Active and banned users
-        active_users = mongo.db.member_communities.count_documents({"communityId": community_id})
+
+        docs = rollups.load(mongo.db, "community", community_id, now)
+        monthly_questions = rollups.monthly(docs, "questions", now)
+        monthly_answers = rollups.monthly(docs, "answers", now)
+        monthly_users = rollups.monthly(docs, "members", now)
+
         banned_users = mongo.db.users.count_documents({
             f"community_bans.{community_id}.status": "banned"
         })
-        
+
         return jsonify({
             "monthlyQuestions": monthly_questions,
             "monthlyAnswers": monthly_answers,
             "monthlyUsers": monthly_users,
-            "weeklyActivity": weekly_activity,
-            "totalQuestions": total_questions,
-            "totalAnswers": total_answers,
-            "activeUsers": active_users,
+            "weeklyActivity": weekly_activity(docs, now),
+            "totalQuestions": rollups.total(docs, "questions"),
+            "totalAnswers": rollups.total(docs, "answers"),
+            "activeUsers": rollups.total(docs, "members"),
             "bannedUsers": banned_users,
-            "questionTrend": question_trend,
-            "answerTrend": answer_trend,
-            "userTrend": user_trend,
+            "questionTrend": calculate_trend(monthly_questions[current_month], monthly_questions[prev_month]),
+            "answerTrend": calculate_trend(monthly_answers[current_month], monthly_answers[prev_month]),
+            "userTrend": calculate_trend(monthly_users[current_month], monthly_users[prev_month]),
             "success": True
         }), 200
-        
+
     except Exception as e:
         print(f"Error fetching community stats: {str(e)}")
         return jsonify({
@@ -1582,7 +1363,7 @@ def get_community_stats(community_id):
 @login_required
 def get_community(community_id):
     try:
-        community = mongo.db.communities.find_one({"_id": community_id})
+        community = load_communities(mongo.db).get(community_id)
         if not community:
             return jsonify({'message': 'Community not found'}), 404
         return jsonify({
@@ -1611,6 +1392,7 @@ def get_community_members(community_id):
             {"$project": {
                 "_id": "$user._id",
                 "username": "$user.username",
+                "avatarHash": "$user.avatarHash",
                 "avatar": "$user.avatar",
                 "reputation": "$user.reputation",
                 "dateJoined": {
@@ -1632,6 +1414,7 @@ def get_community_members(community_id):
             {"$project": {
                 "_id": 1,
                 "username": 1,
+                "avatarHash": 1,
                 "avatar": 1,
                 "reputation": 1,
                 "status": 1,
@@ -1641,6 +1424,10 @@ def get_community_members(community_id):
             {"$limit": per_page}
         ]))
         
+        for member in active_members + banned_members:
+            member["avatar"] = avatars.url(member)
+            member.pop("avatarHash", None)
+
         total_active = mongo.db.member_communities.count_documents({"communityId": community_id})
         total_banned = mongo.db.users.count_documents({f"community_bans.{community_id}.status": "banned"})
         
@@ -1703,13 +1490,15 @@ def reset_password():
         if not user:
             return jsonify({'message': 'User not found'}), 404
 
-        hashed_password = bcrypt.generate_password_hash(new_password).decode('utf-8')
+        hashed_password = passwords.hash_password(new_password)
         mongo.db.users.update_one(
             {'_id': ObjectId(user_id)},
             {'$set': {'password': hashed_password}}
         )
 
         return jsonify({'message': 'Password updated successfully'}), 200
+    except (HashingBusy, HashingTimeout):
+        raise
     except Exception as e:
         return jsonify({'message': 'Error resetting password', 'error': str(e)}), 500
     
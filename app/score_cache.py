@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from app import inference, metrics, model_registry, segmentation
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_content(content):
+    # Detoxify's tokenizer is uncased and ignores runs of whitespace, so these edits never change a score
+    return " ".join(content.split()).lower()
+
+
+class ScoreCache:
+    """
+    LRU + TTL cache of model score vectors keyed by content hash.
+
+    Entries live in an in-process LRU and in a SQLite file, so workers on the
+    same host share each other's results. Each process opens one connection to
+    the file, used under the cache lock (threading.local would be per greenlet
+    under gevent, i.e. a new connection for almost every request).
+
+    Args:
+        path: SQLite file backing the cache, or None for memory only
+        max_entries: Size of the in-process LRU
+        ttl: Seconds an entry stays valid
+    """
+
+    def __init__(self, path, max_entries, ttl):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if path:
+            self._create_schema()
+
+    @staticmethod
+    def key(content, model_version):
+        return hashlib.sha256(f"{model_version}\0{normalize_content(content)}".encode('utf-8')).hexdigest()
+
+    def _create_schema(self):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=1)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, scores TEXT NOT NULL, expires_at REAL NOT NULL)")
+            finally:
+                conn.close()
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Score cache unavailable at {self.path}: {str(e)}")
+
+    def _connection(self):
+        # Called with self._lock held. A connection opened before a fork is left to the parent
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=1, check_same_thread=False)
+            self._pid = os.getpid()
+        return self._conn
+
+    def _remember(self, key, scores, expires_at):
+        with self._lock:
+            self._memory[key] = (expires_at, scores)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._memory[key]
+
+        if self.path:
+            try:
+                with self._lock:
+                    row = self._connection().execute(
+                        "SELECT scores, expires_at FROM scores WHERE key = ? AND expires_at > ?", (key, now)
+                    ).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"Score cache read failed: {str(e)}")
+                row = None
+            if row is not None:
+                scores = json.loads(row[0])
+                self._remember(key, scores, row[1])
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                return scores
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, scores):
+        expires_at = time.time() + self.ttl
+        self._remember(key, scores, expires_at)
+        if not self.path:
+            return
+        try:
+            with self._lock:
+                conn = self._connection()
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO scores (key, scores, expires_at) VALUES (?, ?, ?)", (key, json.dumps(scores), expires_at))
+                    self._writes += 1
+                    if self._writes % 1000 == 0:
+                        conn.execute("DELETE FROM scores WHERE expires_at <= ?", (time.time(),))
+        except sqlite3.Error as e:
+            logger.warning(f"Score cache write failed: {str(e)}")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "diskHits": self.disk_hits,
+            "misses": self.misses,
+            "hitRatio": round(self.hits / lookups, 3) if lookups else 0,
+            "entries": len(self._memory)
+        }
+
+
+toxicity_cache = ScoreCache(Config.SCORE_CACHE_PATH, Config.SCORE_CACHE_MAX_ENTRIES, Config.SCORE_CACHE_TTL)
+
+
+def toxicity_scores(content):
+    """Detoxify scores for content, running inference only on a cache miss."""
+    return toxicity_scores_many([content])[0]
+
+
+def toxicity_scores_many(contents):
+    """
+    toxicity_scores for several texts. Long texts are scored as overlapping windows
+    and take their worst window's scores; every window of every cache miss goes
+    through the model in one batch.
+    """
+    version = f"{model_registry.version('detoxify')}/{segmentation.signature()}"
+    keys = [ScoreCache.key(content, version) for content in contents]
+    scores = [toxicity_cache.get(key) for key in keys]
+    misses = [i for i, found in enumerate(scores) if found is None]
+    if misses:
+        windows, slices = segmentation.segment_many([contents[i] for i in misses])
+        window_scores = inference.score_toxicity(windows)
+        for i, part in zip(misses, slices):
+            scores[i] = segmentation.max_scores(window_scores[part])
+            toxicity_cache.set(keys[i], scores[i])
+    return scores
+
+
+metrics.register('toxicityCache', toxicity_cache.stats)
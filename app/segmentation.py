@@ -0,0 +1,67 @@
+import math
+import numpy as np
+from app.config import Config
+
+# Detoxify and MiniLM silently truncate their input (MiniLM at 256 tokens), so long
+# posts are scored as overlapping windows of words instead. SEGMENT_WINDOW_WORDS
+# is kept under the token limit with room for words that split into several tokens.
+
+
+def signature():
+    """Identifies the segmentation settings, so cached scores change with them."""
+    return f"w{Config.SEGMENT_WINDOW_WORDS}-o{Config.SEGMENT_OVERLAP_WORDS}-b{Config.SEGMENT_MAX_WINDOWS}"
+
+
+def split_windows(text, size=None, overlap=None, budget=None):
+    """
+    Split text into windows of `size` words overlapping by `overlap` words.
+    Past `budget` windows they are spread evenly over the text instead, always
+    keeping the first and last, so cost stays bounded for very long posts.
+
+    Returns:
+        List of window texts; [text] unchanged when it fits in one window
+    """
+    size = size or Config.SEGMENT_WINDOW_WORDS
+    overlap = Config.SEGMENT_OVERLAP_WORDS if overlap is None else overlap
+    budget = budget or Config.SEGMENT_MAX_WINDOWS
+    words = text.split()
+    if len(words) <= size:
+        return [text]
+    last_start = len(words) - size
+    stride = max(1, size - overlap)
+    count = math.ceil(last_start / stride) + 1
+    if count <= budget:
+        starts = [min(i * stride, last_start) for i in range(count)]
+    elif budget == 1:
+        starts = [0]
+    else:
+        starts = [round(i * last_start / (budget - 1)) for i in range(budget)]
+    return [" ".join(words[start:start + size]) for start in starts]
+
+
+def segment_many(texts):
+    """
+    Windows of several texts flattened into one batch.
+
+    Returns:
+        (windows, slices) where windows[slices[i]] are the windows of texts[i]
+    """
+    windows = []
+    slices = []
+    for text in texts:
+        parts = split_windows(text)
+        slices.append(slice(len(windows), len(windows) + len(parts)))
+        windows.extend(parts)
+    return windows, slices
+
+
+def max_scores(window_scores):
+    """Per-label maximum of Detoxify score dicts: a post is as toxic as its worst window."""
+    return {label: max(scores[label] for scores in window_scores) for label in window_scores[0]}
+
+
+def mean_embedding(window_embeddings):
+    """Normalized mean of a text's window embeddings, used where one vector per text is needed."""
+    mean = np.asarray(window_embeddings, dtype=np.float32).mean(axis=0)
+    norm = np.linalg.norm(mean)
+    return mean / norm if norm else mean
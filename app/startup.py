@@ -0,0 +1,126 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+from app import metrics
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Staged startup: importing the app only builds the Flask objects, so the server
+# binds its port at once. Connecting to Mongo, seeding, loading the models and a
+# warm-up pass run in a background thread per process; /health reports
+# "starting" and /ready answers 503 until they are done.
+STARTING = "starting"
+READY = "ready"
+FAILED = "failed"
+
+# app/__init__ imports this module first, so this is (close to) when the import began
+IMPORT_STARTED = time.perf_counter()
+
+WARM_UP_TEXTS = [
+    "How do I read a file line by line in Python?",
+    "Which graphics card should I buy for 1440p gaming?"
+]
+
+_state = {"status": STARTING, "error": None, "pid": None, "startedAt": None, "readyAt": None}
+_phases = []
+_lock = threading.Lock()
+
+
+def record(name, seconds):
+    with _lock:
+        _phases.append({"phase": name, "seconds": round(seconds, 3), "pid": os.getpid()})
+    logger.info(f"Startup phase {name} took {seconds:.2f}s")
+
+
+def _timed(name, fn):
+    start = time.perf_counter()
+    result = fn()
+    record(name, time.perf_counter() - start)
+    return result
+
+
+def ready():
+    return _state["status"] == READY
+
+
+def status():
+    return _state["status"]
+
+
+def profile():
+    with _lock:
+        return dict(_state, phases=list(_phases), totalSeconds=round(sum(p["seconds"] for p in _phases), 3))
+
+
+def _connect(db):
+    """Ping Mongo until it answers or STARTUP_MONGO_TIMEOUT passes."""
+    deadline = time.monotonic() + Config.STARTUP_MONGO_TIMEOUT
+    while True:
+        try:
+            db.command("ping")
+            return
+        except Exception as e:
+            if time.monotonic() > deadline:
+                raise
+            logger.warning(f"Mongo not reachable yet, retrying: {str(e)}")
+            time.sleep(1)
+
+
+def _warm_up():
+    # The first forward pass of each model is much slower than the next ones
+    # (lazy allocations, kernel selection); pay it here rather than on a user's post.
+    # That slow pass is the point, so it gets its own, much longer timeout
+    from app import inference
+    inference.score_toxicity(WARM_UP_TEXTS, timeout=Config.STARTUP_WARMUP_TIMEOUT)
+    inference.embed(WARM_UP_TEXTS, timeout=Config.STARTUP_WARMUP_TIMEOUT)
+
+
+def _run(db, init_db):
+    from app import model_registry
+    from app.models import get_community_validator
+
+    try:
+        _timed("mongoConnect", lambda: _connect(db))
+        _timed("initDb", init_db)
+        _timed("modelLoad", model_registry.preload)
+    except Exception as e:
+        logger.exception("Startup failed")
+        with _lock:
+            _state.update(status=FAILED, error=str(e))
+        return
+    # Optional phases: on failure the first request that needs them pays instead
+    # (the question index retries its load on next use)
+    try:
+        # Encodes the community descriptions, then loads (or rebuilds) the question vector index
+        _timed("communityIndex", lambda: get_community_validator(db).question_index.load())
+    except Exception:
+        logger.exception("Loading the question index failed, it is loaded on first use")
+    if Config.STARTUP_WARMUP:
+        try:
+            _timed("warmUp", _warm_up)
+        except Exception:
+            logger.exception("Warm-up failed, serving without it")
+    with _lock:
+        _state.update(status=READY, readyAt=datetime.utcnow().isoformat())
+
+
+def begin(db, init_db):
+    """
+    Start the startup phases in the background, once per process. Safe to call
+    on every request: gunicorn workers forked from a preloading master start
+    their own run (threads do not survive fork).
+    """
+    pid = os.getpid()
+    if _state["pid"] == pid:
+        return
+    with _lock:
+        if _state["pid"] == pid:
+            return
+        _state.update(status=STARTING, error=None, pid=pid, startedAt=datetime.utcnow().isoformat(), readyAt=None)
+    threading.Thread(target=_run, args=(db, init_db), name='startup', daemon=True).start()
+
+
+metrics.register('startup', profile)
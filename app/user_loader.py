@@ -0,0 +1,159 @@
+import copy
+import logging
+from datetime import datetime
+from bson import ObjectId
+from bson.errors import InvalidId
+from app import background, avatars
+from app.cache import cache
+from app.config import Config
+from app.models import Member
+from app.moderation import ban_expires_at
+
+logger = logging.getLogger(__name__)
+
+# Fields Flask-Login needs on every request: identity, ban state and what the
+# routes read off current_user. The avatar, the password hash and the
+# community_interactions map are left out and loaded only if a route asks.
+AUTH_PROJECTION = {
+    "username": 1,
+    "email": 1,
+    "dateJoined": 1,
+    "reputation": 1,
+    "status": 1,
+    "restrictionLevel": 1,
+    "badges": 1,
+    "community_bans": 1
+}
+
+LAZY_FIELDS = ("password", "avatar", "community_interactions")
+
+
+# A lifted ban keeps ban_count (and duration_days), so the next ban escalates
+LIFTED_FIELDS = ("status", "expiration", "strikes")
+
+
+def lift(ban_info):
+    return {key: value for key, value in ban_info.items() if key not in LIFTED_FIELDS}
+
+
+def active_bans(community_bans, now=None):
+    """community_bans with expired bans shown as lifted, without writing them back."""
+    now = now or datetime.utcnow()
+    bans = {}
+    for community_id, ban_info in (community_bans or {}).items():
+        if isinstance(ban_info, dict) and ban_info.get('status') == "banned":
+            expiration = ban_info.get('expiration')
+            if expiration and now > expiration:
+                ban_info = lift(ban_info)
+        bans[community_id] = ban_info
+    return bans
+
+
+class SessionMember(Member):
+    """
+    Member built from the auth projection. The fields left out of it are read
+    from the users collection the first time they are accessed in a request.
+    """
+
+    def __init__(self, doc, db):
+        super().__init__(
+            str(doc['_id']),
+            doc['username'],
+            doc.get('email'),
+            None,
+            doc.get('dateJoined'),
+            doc.get('reputation', 0),
+            doc.get('status', 'active'),
+            doc.get('restrictionLevel', 0),
+            doc.get('badges', []),
+            community_bans=active_bans(doc.get('community_bans'))
+        )
+        for field in LAZY_FIELDS:
+            self.__dict__.pop(field, None)
+        self._db = db
+
+    def __getattr__(self, name):
+        # Only called for attributes not set yet, i.e. the lazy fields
+        if name not in LAZY_FIELDS:
+            raise AttributeError(name)
+        doc = self._db.users.find_one({"_id": ObjectId(self.id)}, {"password": 1, "avatarHash": 1, "avatar": 1, "community_interactions": 1}) or {}
+        # setdefault keeps values a route already assigned (current_user.avatar = ...)
+        self.__dict__.setdefault("password", doc.get("password"))
+        self.__dict__.setdefault("avatar", avatars.url(doc))
+        self.__dict__.setdefault("community_interactions", doc.get("community_interactions") or {})
+        return self.__dict__[name]
+
+
+def _session_key(user_id):
+    return f"session_user:{user_id}"
+
+
+def load_user(db, user_id):
+    """
+    Member for Flask-Login's user_loader. The projected user document is cached
+    per user for USER_CACHE_TTL seconds under the "user:<id>" tag, so the
+    invalidate(f"user:{id}") calls made after profile, avatar, password, badge
+    and ban changes drop it. Reputation may lag by up to the TTL.
+    """
+    try:
+        _id = ObjectId(user_id)
+    except (InvalidId, TypeError):
+        return None
+    doc = cache.get_or_set(
+        'sessionUser',
+        _session_key(user_id),
+        lambda: db.users.find_one({"_id": _id}, AUTH_PROJECTION),
+        Config.USER_CACHE_TTL,
+        tags=[f"user:{user_id}"]
+    )
+    if not doc:
+        return None
+    # Each request gets its own copy; routes mutate current_user.badges
+    return SessionMember(copy.deepcopy(doc), db)
+
+
+def expire_bans(db, now=None):
+    """
+    Periodic job: lift community_bans entries whose expiration has passed, the
+    cleanup load_user used to do inline on every request. Only LIFTED_FIELDS are
+    removed; ban_count stays so the moderation engine escalates the next ban.
+
+    Members are found through the indexed banExpiresAt field (the earliest running
+    ban), which is recomputed in the same update. Only this process's session cache
+    is invalidated; other workers may keep a cached document showing the ban for up
+    to USER_CACHE_TTL, which active_bans() already reads as lifted once it expired.
+    """
+    now = now or datetime.utcnow()
+    member_ids = [user["_id"] for user in db.users.find({"banExpiresAt": {"$lt": now}}, {"_id": 1})]
+    if not member_ids:
+        return 0
+    expired = {"$and": [
+        {"$eq": ["$$ban.v.status", "banned"]},
+        {"$eq": [{"$type": "$$ban.v.expiration"}, "date"]},
+        {"$lt": ["$$ban.v.expiration", now]}
+    ]}
+    bans = {"$objectToArray": {"$ifNull": ["$community_bans", {}]}}
+    lifted = {"$arrayToObject": {"$filter": {
+        "input": {"$objectToArray": "$$ban.v"},
+        "as": "field",
+        "cond": {"$not": [{"$in": ["$$field.k", list(LIFTED_FIELDS)]}]}
+    }}}
+    result = db.users.update_many(
+        {"_id": {"$in": member_ids}, "banExpiresAt": {"$lt": now}},
+        [
+            {"$set": {"community_bans": {"$arrayToObject": {"$map": {
+                "input": bans,
+                "as": "ban",
+                "in": {"k": "$$ban.k", "v": {"$cond": [expired, lifted, "$$ban.v"]}}
+            }}}}},
+            {"$set": {"banExpiresAt": ban_expires_at()}}
+        ]
+    )
+    cache.invalidate(*[f"user:{member_id}" for member_id in member_ids])
+    if result.modified_count:
+        logger.info(f"Lifted expired community bans of {result.modified_count} users")
+    return result.modified_count
+
+
+def schedule(db):
+    background.every(Config.BAN_EXPIRY_INTERVAL, lambda: expire_bans(db), 'expire_bans', heavy=True)
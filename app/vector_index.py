@@ -0,0 +1,316 @@
+import os
+import atexit
+import logging
+import threading
+import numpy as np
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+
+# Every process holding the index bumps this counter (index_versions collection)
+# on each write. A process whose copy is behind the counter has missed writes made
+# by another worker and catches up in sync(). Upserts also stamp the question with
+# the version they produced (indexVersion), so sync() re-embeds edited questions.
+VERSION_KEY = "question_index"
+
+
+def question_text(title, content):
+    return (title or '') + " " + (content or '')
+
+
+class QuestionIndex:
+    """
+    In-memory matrix of question embeddings, persisted to disk.
+
+    Rows are L2-normalized, so cosine similarity against every question of a
+    community is one matrix-vector product over that community's rows.
+
+    Each worker process holds its own copy. Writes bump a shared version
+    counter in MongoDB; sync() (run periodically) brings a copy that is behind
+    up to date by indexing only the questions it is missing or that were
+    upserted since (edits made through another process). The file on disk
+    is only written from a copy that is up to date, so one worker cannot save
+    over rows it never saw.
+
+    Args:
+        db: MongoDB database (mongo.db)
+        encoder: Callable taking a list of texts and returning normalized embeddings (n, dim)
+        path: File the index is persisted to
+        flush_every: Number of writes buffered before the index is saved again
+        query: Filter on the questions collection selecting the questions indexed
+    """
+
+    def __init__(self, db, encoder, path, flush_every=20, query=None):
+        self.db = db
+        self.query = query or {}
+        self.encoder = encoder
+        self.path = path
+        self.flush_every = flush_every
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._ids = []
+        self._rows = {}
+        self._communities = np.zeros(0, dtype=np.int64)
+        self._matrix = None
+        self._size = 0
+        self._pending_writes = 0
+        self._community_rows = {}
+        self._version = -1
+        atexit.register(self.flush)
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_loaded()
+            return self._size
+
+    def load(self):
+        """Load the index now rather than on the first search or write."""
+        with self._lock:
+            self._ensure_loaded()
+
+    def _ensure_loaded(self):
+        # Only marked loaded once a load or rebuild went through; a failure (Mongo
+        # unreachable, encoder error) is raised and the next caller tries again
+        if self._loaded:
+            return
+        if self._load():
+            # The file may be stale if another process wrote questions since it was saved;
+            # only the questions missing from it, or upserted since, are encoded
+            self._sync()
+            self._loaded = True
+            return
+        self.rebuild()
+
+    def _db_version(self):
+        doc = self.db.index_versions.find_one({"_id": VERSION_KEY}, {"version": 1})
+        return doc["version"] if doc else 0
+
+    def _bump(self):
+        doc = self.db.index_versions.find_one_and_update(
+            {"_id": VERSION_KEY}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        # Still current only if no other process wrote since this copy last synced
+        if doc["version"] == self._version + 1:
+            self._version = doc["version"]
+        return doc["version"]
+
+    def sync(self):
+        """
+        Catch up with questions other processes added, edited or removed. A no-op
+        (one find_one) while this copy is current.
+
+        Returns:
+            Number of rows added, re-embedded or removed
+        """
+        if not self._loaded:
+            return 0
+        return self._sync()
+
+    def _sync(self):
+        version = self._db_version()
+        if version == self._version:
+            return 0
+        previous = self._version
+        stored = {str(q["_id"]) for q in self.db.questions.find(self.query, {"_id": 1})}
+        with self._lock:
+            missing = [qid for qid in stored if qid not in self._rows]
+            removed = [qid for qid in self._ids if qid not in stored]
+        # Encoded without the lock so searches keep running meanwhile. Stamps equal to
+        # the previous version are taken again: the stamp lands just after the bump
+        added = []
+        changed = [{"indexVersion": {"$gte": previous}}]
+        if missing:
+            changed.append({"_id": {"$in": [ObjectId(qid) for qid in missing]}})
+        questions = list(self.db.questions.find(
+            {"$and": [self.query, {"$or": changed}]}, {"title": 1, "content": 1, "communityId": 1}
+        ))
+        if questions:
+            embeddings = np.asarray(self.encoder([question_text(q.get("title"), q.get("content")) for q in questions]), dtype=np.float32)
+            added = [(str(q["_id"]), embedding, int(q.get("communityId", -1))) for q, embedding in zip(questions, embeddings)]
+        with self._lock:
+            for qid in removed:
+                self._delete(qid)
+            for qid, embedding, community_id in added:
+                self._put(qid, embedding, community_id)
+            self._community_rows = {}
+            self._version = version
+            if removed or added or self._pending_writes:
+                self._save()
+                self._pending_writes = 0
+            if removed or added:
+                logger.info(f"Synced question index: {len(added)} added or re-embedded, {len(removed)} removed")
+        return len(added) + len(removed)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                matrix = data['matrix'].astype(np.float32)
+                ids = [str(i) for i in data['ids']]
+                communities = data['communities'].astype(np.int64)
+                version = int(data['version']) if 'version' in data else -1
+        except Exception as e:
+            logger.warning(f"Failed to load question index from {self.path}: {str(e)}")
+            return False
+        self._matrix = matrix if ids else None
+        self._ids = ids
+        self._communities = communities
+        self._size = len(ids)
+        self._rows = {qid: row for row, qid in enumerate(ids)}
+        self._community_rows = {}
+        self._version = version
+        return True
+
+    def rebuild(self):
+        with self._lock:
+            # Read first: writes made while the questions are read are caught by the next sync
+            version = self._db_version()
+            questions = list(self.db.questions.find(self.query, {"title": 1, "content": 1, "communityId": 1}))
+            matrix = None
+            if questions:
+                texts = [question_text(q.get("title"), q.get("content")) for q in questions]
+                matrix = np.asarray(self.encoder(texts), dtype=np.float32)
+            # Swapped in only once everything is encoded, so a failure leaves the old copy intact
+            self._ids = [str(q["_id"]) for q in questions]
+            self._rows = {qid: row for row, qid in enumerate(self._ids)}
+            self._communities = np.array([int(q.get("communityId", -1)) for q in questions], dtype=np.int64)
+            self._size = len(questions)
+            self._community_rows = {}
+            self._matrix = matrix
+            self._loaded = True
+            self._pending_writes = 0
+            self._version = version
+            self._save()
+            logger.info(f"Built question index with {self._size} questions")
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        size = self._size
+        matrix = self._matrix[:size] if self._matrix is not None else np.zeros((0, 0), dtype=np.float32)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, matrix=matrix, ids=np.array(self._ids, dtype=str), communities=self._communities[:size], version=self._version)
+        os.replace(tmp_path, self.path)
+
+    def flush(self):
+        with self._lock:
+            if not self._loaded or not self._pending_writes:
+                return
+            try:
+                if self._version != self._db_version():
+                    # Behind another worker: saving would drop its rows. sync() saves once caught up
+                    return
+                self._save()
+                self._pending_writes = 0
+            except Exception as e:
+                logger.warning(f"Failed to save question index to {self.path}: {str(e)}")
+
+    def _written(self):
+        self._community_rows = {}
+        self._pending_writes += 1
+        if self._pending_writes >= self.flush_every:
+            self.flush()
+
+    def _append_row(self, embedding, community_id):
+        if self._matrix is None:
+            self._matrix = np.zeros((16, embedding.shape[0]), dtype=np.float32)
+            self._communities = np.zeros(16, dtype=np.int64)
+        elif self._size == self._matrix.shape[0]:
+            # Grow geometrically so appends stay amortized O(1)
+            capacity = max(16, self._size * 2)
+            matrix = np.zeros((capacity, self._matrix.shape[1]), dtype=np.float32)
+            matrix[:self._size] = self._matrix[:self._size]
+            communities = np.zeros(capacity, dtype=np.int64)
+            communities[:self._size] = self._communities[:self._size]
+            self._matrix, self._communities = matrix, communities
+        self._matrix[self._size] = embedding
+        self._communities[self._size] = community_id
+        self._size += 1
+        return self._size - 1
+
+    def _put(self, question_id, embedding, community_id):
+        row = self._rows.get(question_id)
+        if row is None:
+            self._rows[question_id] = self._append_row(embedding, community_id)
+            self._ids.append(question_id)
+        else:
+            self._matrix[row] = embedding
+            self._communities[row] = community_id
+
+    def _delete(self, question_id):
+        row = self._rows.pop(question_id, None)
+        if row is None:
+            return False
+        # Move the last row into the freed slot to keep the matrix dense
+        last = self._size - 1
+        if row != last:
+            moved_id = self._ids[last]
+            self._matrix[row] = self._matrix[last]
+            self._communities[row] = self._communities[last]
+            self._ids[row] = moved_id
+            self._rows[moved_id] = row
+        self._ids.pop()
+        self._size -= 1
+        return True
+
+    def upsert(self, question_id, title, content, community_id):
+        """Add or re-embed a question, e.g. after it was posted, approved or edited."""
+        embedding = np.asarray(self.encoder([question_text(title, content)]), dtype=np.float32)[0]
+        with self._lock:
+            self._ensure_loaded()
+            self._put(str(question_id), embedding, int(community_id))
+            version = self._bump()
+            self._written()
+        # Other processes re-embed questions stamped past the version they last synced
+        self.db.questions.update_one({"_id": ObjectId(question_id)}, {"$set": {"indexVersion": version}})
+
+    def remove(self, question_id):
+        with self._lock:
+            self._ensure_loaded()
+            if not self._delete(str(question_id)):
+                return
+            self._bump()
+            self._written()
+
+    def vectors(self, question_ids):
+        """Return (found_ids, matrix) with the stored embedding of each indexed question."""
+        with self._lock:
+            self._ensure_loaded()
+            found = [str(qid) for qid in question_ids if str(qid) in self._rows]
+            if not found:
+                return [], None
+            return found, self._matrix[[self._rows[qid] for qid in found]].copy()
+
+    def _rows_for(self, community_id):
+        rows = self._community_rows.get(community_id)
+        if rows is None:
+            rows = np.nonzero(self._communities[:self._size] == community_id)[0]
+            self._community_rows[community_id] = rows
+        return rows
+
+    def search(self, community_id, query_embedding, top_k=3, threshold=0.0):
+        """Return up to top_k (question_id, score) pairs from one community (or all if None), best first."""
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        with self._lock:
+            self._ensure_loaded()
+            if self._matrix is None or self._size == 0:
+                return []
+            if community_id is None:
+                scores = self._matrix[:self._size] @ query
+                ids = list(self._ids)
+            else:
+                rows = self._rows_for(int(community_id))
+                if rows.size == 0:
+                    return []
+                scores = self._matrix[rows] @ query
+                ids = [self._ids[r] for r in rows]
+
+        k = min(top_k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(ids[i], float(scores[i])) for i in top if scores[i] >= threshold]
@@ -0,0 +1,216 @@
+import math
+import time
+import atexit
+import hashlib
+import logging
+import threading
+from bson import ObjectId
+from pymongo import UpdateOne
+from app import background, metrics
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Fixed-size set membership with false positives but no false negatives."""
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        # Double hashing: k positions from two 64-bit hashes
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, key):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def add(self, key):
+        for p in self._positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+
+class RotatingBloomFilter:
+    """
+    Remembers keys for between `window` and 2 * `window` seconds using two
+    generations of Bloom filters; the older one is dropped on each rotation.
+    """
+
+    def __init__(self, window, capacity, error_rate):
+        self.window = window
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._current = BloomFilter(capacity, error_rate)
+        self._previous = BloomFilter(capacity, error_rate)
+        self._rotated_at = time.monotonic()
+
+    def _rotate(self):
+        if time.monotonic() - self._rotated_at >= self.window or self._current.count >= self.capacity:
+            self._previous = self._current
+            self._current = BloomFilter(self.capacity, self.error_rate)
+            self._rotated_at = time.monotonic()
+
+    def seen(self, key):
+        """Return True if key was added recently, otherwise remember it and return False."""
+        self._rotate()
+        if key in self._current or key in self._previous:
+            return True
+        self._current.add(key)
+        return False
+
+    def memory_bytes(self):
+        return len(self._current.bits) + len(self._previous.bits)
+
+
+class ViewCounter:
+    """
+    Write-behind buffer for question view counts.
+
+    Views are coalesced per question in memory and written with one bulk_write
+    every flush interval, or as soon as `max_pending` views are buffered. A
+    failed batch is kept for the next flush, but never more than `max_buffered`
+    views in all: past that, views are dropped (and counted), so at most
+    `max_buffered` views are lost if the process dies.
+
+    Args:
+        db: MongoDB database (mongo.db)
+        max_pending: Buffered views that trigger an early flush
+        max_buffered: Most views held while writes keep failing
+        dedup_window: Seconds during which repeat views by the same visitor are ignored
+        dedup_capacity: Expected distinct (visitor, question) pairs per window
+        dedup_error_rate: Chance a first view is wrongly treated as a repeat
+    """
+
+    def __init__(self, db, max_pending=1000, max_buffered=10000, dedup_window=1800, dedup_capacity=100000, dedup_error_rate=0.01):
+        self.db = db
+        self.max_pending = max_pending
+        self.max_buffered = max(max_buffered, max_pending)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._pending_views = 0
+        self._oldest_pending = None
+        self._flush_queued = False
+        self._seen = RotatingBloomFilter(dedup_window, dedup_capacity, dedup_error_rate)
+        self.recorded = 0
+        self.deduplicated = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_seconds = 0.0
+
+    def record(self, question_id, visitor=None):
+        """Buffer one view. Returns False if the visitor already viewed the question recently."""
+        question_id = str(question_id)
+        with self._lock:
+            if visitor is not None and self._seen.seen(f"{visitor}:{question_id}"):
+                self.deduplicated += 1
+                return False
+            if self._pending_views >= self.max_buffered:
+                # Writes are failing and the buffer is full; the view is not counted
+                self.dropped += 1
+                return True
+            self._pending[question_id] = self._pending.get(question_id, 0) + 1
+            self._pending_views += 1
+            self.recorded += 1
+            if self._oldest_pending is None:
+                self._oldest_pending = time.monotonic()
+            flush_now = self._pending_views >= self.max_pending and not self._flush_queued
+            if flush_now:
+                self._flush_queued = True
+        if flush_now:
+            background.submit(self.flush)
+        return True
+
+    def pending(self, question_id):
+        """Views of a question not yet written, so readers can add them to the stored count."""
+        with self._lock:
+            return self._pending.get(str(question_id), 0)
+
+    def flush(self):
+        # One flush at a time so a failed batch is merged back before the next one runs
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                views, self._pending_views = self._pending_views, 0
+                oldest, self._oldest_pending = self._oldest_pending, None
+                self._flush_queued = False
+            if not batch:
+                return 0
+
+            start = time.perf_counter()
+            try:
+                self.db.questions.bulk_write(
+                    [UpdateOne({"_id": ObjectId(qid)}, {"$inc": {"views": count}}) for qid, count in batch.items()],
+                    ordered=False
+                )
+            except Exception as e:
+                # Put the views back so the next flush retries them, as far as the buffer allows
+                with self._lock:
+                    room = max(0, self.max_buffered - self._pending_views)
+                    for qid, count in batch.items():
+                        kept = min(count, room)
+                        if kept:
+                            self._pending[qid] = self._pending.get(qid, 0) + kept
+                            room -= kept
+                        self.dropped += count - kept
+                    self._pending_views = sum(self._pending.values())
+                    if self._oldest_pending is None or oldest < self._oldest_pending:
+                        self._oldest_pending = oldest
+                self.failed_flushes += 1
+                logger.warning(f"Failed to flush {views} question views: {str(e)}")
+                return 0
+
+            self.last_flush_seconds = time.perf_counter() - start
+            self.flushed += views
+            self.flushes += 1
+            return views
+
+    def stats(self):
+        with self._lock:
+            oldest = self._oldest_pending
+            return {
+                "pendingViews": self._pending_views,
+                "pendingQuestions": len(self._pending),
+                # How long the oldest buffered view has been waiting to be written
+                "flushLagSeconds": round(time.monotonic() - oldest, 3) if oldest is not None else 0.0,
+                "recorded": self.recorded,
+                "deduplicated": self.deduplicated,
+                "flushed": self.flushed,
+                "dropped": self.dropped,
+                "flushes": self.flushes,
+                "failedFlushes": self.failed_flushes,
+                "lastFlushMs": round(self.last_flush_seconds * 1000, 2),
+                "dedupFilterBytes": self._seen.memory_bytes()
+            }
+
+
+_counter = None
+_counter_lock = threading.Lock()
+
+
+def get_counter(db):
+    global _counter
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                _counter = ViewCounter(
+                    db,
+                    max_pending=Config.VIEW_MAX_PENDING,
+                    max_buffered=Config.VIEW_MAX_BUFFERED,
+                    dedup_window=Config.VIEW_DEDUP_WINDOW,
+                    dedup_capacity=Config.VIEW_DEDUP_CAPACITY,
+                    dedup_error_rate=Config.VIEW_DEDUP_ERROR_RATE
+                )
+                background.every(Config.VIEW_FLUSH_INTERVAL, _counter.flush, 'flush_question_views')
+                atexit.register(_counter.flush)
+                metrics.register('views', _counter.stats)
+    return _counter
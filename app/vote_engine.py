@@ -0,0 +1,267 @@
+import logging
+from datetime import datetime
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from app import notifications, rollups
+from app.config import Config
+from app.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Vote kind -> (field on the vote document, collection holding the target)
+TARGETS = {
+    "question": ("questionId", "questions"),
+    "answer": ("answerId", "answers")
+}
+
+TARGET_PROJECTIONS = {
+    "question": {"memberId": 1, "title": 1},
+    "answer": {"memberId": 1}
+}
+
+
+class VoteConflict(Exception):
+    """The vote kept changing under concurrent requests and could not be applied."""
+
+
+def reputation_for(value):
+    return {1: Config.VOTE_REPUTATION_UP, -1: Config.VOTE_REPUTATION_DOWN}.get(value, 0)
+
+
+def _status(old, new):
+    if old == new:
+        return "unchanged"
+    if old == 0:
+        return "recorded"
+    if new == 0:
+        return "removed"
+    return "updated"
+
+
+def change_vote(db, member_id, kind, target_id, value, toggle=True, max_attempts=5):
+    """
+    Atomically move one member's vote on a target to its next state.
+
+    The unique (memberId, target) index makes the upsert the only way a vote can
+    be created, and every later change is conditional on the value that was read,
+    so concurrent requests can never both apply the same transition.
+
+    Args:
+        value: 1 or -1, or 0 to remove the vote
+        toggle: When True, casting the same value again removes the vote (POST /vote);
+            when False the call just sets the vote to `value` (bulk sync)
+
+    Returns:
+        (old_value, new_value, old_date) where 0 means no vote
+    """
+    field = TARGETS[kind][0]
+    selector = {"memberId": member_id, field: target_id}
+    for _ in range(max_attempts):
+        if value:
+            try:
+                before = db.votes.find_one_and_update(
+                    selector,
+                    {"$setOnInsert": {"value": value, "date": datetime.utcnow()}},
+                    upsert=True,
+                    return_document=ReturnDocument.BEFORE
+                )
+            except DuplicateKeyError:
+                # A concurrent request inserted the same vote first
+                continue
+            if before is None:
+                return 0, value, None
+        else:
+            before = db.votes.find_one(selector)
+            if before is None:
+                return 0, 0, None
+
+        old = before["value"]
+        new = 0 if value == 0 or (toggle and old == value) else value
+        if new == old:
+            return old, new, before.get("date")
+        if new == 0:
+            if db.votes.delete_one({"_id": before["_id"], "value": old}).deleted_count:
+                return old, new, before.get("date")
+        elif db.votes.update_one({"_id": before["_id"], "value": old}, {"$set": {"value": new}}).modified_count:
+            return old, new, before.get("date")
+        # The vote changed between the read and the write, try again from its new state
+    raise VoteConflict(f"Vote on {kind} {target_id} kept changing")
+
+
+def _notification(voter, kind, target, old, new):
+    if new == 0 or old == new or str(target["memberId"]) == str(voter.id):
+        return None
+    vote_action = "upvoted" if new == 1 else "downvoted"
+    subject = f"your question: {target.get('title', '')}" if kind == "question" else "your answer"
+    notification = {"member_id": target["memberId"], "type": "vote", "related_id": str(target["_id"])}
+    if old == 0:
+        notification["message"] = f"{voter.username} {vote_action} {subject}"
+        # New votes on the same target collapse into "X and 4 others upvoted ..."
+        notification["collapse"] = (f"vote:{vote_action}:{target['_id']}", voter.username, f"{vote_action} {subject}")
+    else:
+        notification["message"] = f"{voter.username} changed their vote to {vote_action} on {subject}"
+    return notification
+
+
+def _rollup_changes(voter, old, new, old_date):
+    if old == 0 and new != 0:
+        return [rollups.user(voter.id, "votes")]
+    if old != 0 and new == 0:
+        return [rollups.user(voter.id, "votes", -1, old_date)]
+    return []
+
+
+def _reputation_delta(voter, target, old, new):
+    if str(target["memberId"]) == str(voter.id):
+        return 0
+    return reputation_for(new) - reputation_for(old)
+
+
+def _queue_side_effects(db, pending, changes):
+    for notification in pending:
+        notifications.notify(db, **notification)
+    if changes:
+        rollups.record(db, *changes)
+
+
+def cast_vote(db, voter, kind, target_id, value):
+    """
+    Toggle voter's vote on a question or answer and apply its effects.
+
+    Returns:
+        Dict with status (recorded, updated, removed or unchanged) and newVote,
+        or None if the target does not exist
+    """
+    field, collection = TARGETS[kind]
+    member_id = ObjectId(voter.id)
+    old, new, old_date = change_vote(db, member_id, kind, target_id, value)
+
+    if new != old:
+        target = db[collection].find_one_and_update(
+            {"_id": target_id},
+            {"$inc": {"score": new - old}},
+            projection=TARGET_PROJECTIONS[kind]
+        )
+    else:
+        target = db[collection].find_one({"_id": target_id}, TARGET_PROJECTIONS[kind])
+    if target is None:
+        # Don't leave a vote behind on a target that does not exist
+        db.votes.delete_many({"memberId": member_id, field: target_id})
+        return None
+    if kind == "question" and new != old:
+        cache.invalidate(f"question:{target_id}")
+
+    reputation = _reputation_delta(voter, target, old, new)
+    if reputation:
+        db.users.update_one({"_id": target["memberId"]}, {"$inc": {"reputation": reputation}})
+
+    notification = _notification(voter, kind, target, old, new)
+    _queue_side_effects(db, [notification] if notification else [], _rollup_changes(voter, old, new, old_date))
+    return {"status": _status(old, new), "newVote": new}
+
+
+def cast_votes(db, voter, votes):
+    """
+    Set many of voter's votes at once, e.g. votes queued by a client while offline.
+
+    Unlike cast_vote, each value is the desired final state (1, -1 or 0 to clear),
+    so replaying the same batch is harmless. Score and reputation changes are
+    summed per document and written with one bulk_write per collection.
+
+    Args:
+        votes: List of (kind, target_id, value)
+
+    Returns:
+        One dict per vote with status (recorded, updated, removed, unchanged, not_found
+        or conflict) and newVote
+    """
+    member_id = ObjectId(voter.id)
+    targets = {}
+    for kind in TARGETS:
+        ids = list({target_id for k, target_id, _ in votes if k == kind})
+        if ids:
+            collection = TARGETS[kind][1]
+            for doc in db[collection].find({"_id": {"$in": ids}}, TARGET_PROJECTIONS[kind]):
+                targets[(kind, doc["_id"])] = doc
+
+    results = []
+    score_deltas = {}
+    reputation_deltas = {}
+    pending = []
+    changes = []
+    for kind, target_id, value in votes:
+        target = targets.get((kind, target_id))
+        if target is None:
+            results.append({"status": "not_found", "newVote": 0})
+            continue
+        try:
+            old, new, old_date = change_vote(db, member_id, kind, target_id, value, toggle=False)
+        except VoteConflict:
+            # Keep going so the votes already applied still get their score changes
+            results.append({"status": "conflict", "newVote": None})
+            continue
+        results.append({"status": _status(old, new), "newVote": new})
+        if old == new:
+            continue
+        score_deltas[(kind, target_id)] = score_deltas.get((kind, target_id), 0) + new - old
+        reputation = _reputation_delta(voter, target, old, new)
+        if reputation:
+            reputation_deltas[target["memberId"]] = reputation_deltas.get(target["memberId"], 0) + reputation
+        notification = _notification(voter, kind, target, old, new)
+        if notification:
+            pending.append(notification)
+        changes.extend(_rollup_changes(voter, old, new, old_date))
+
+    for kind, target_id in score_deltas:
+        if kind == "question":
+            cache.invalidate(f"question:{target_id}")
+
+    for kind, (field, collection) in TARGETS.items():
+        requests = [UpdateOne({"_id": target_id}, {"$inc": {"score": delta}})
+                    for (k, target_id), delta in score_deltas.items() if k == kind and delta]
+        if requests:
+            db[collection].bulk_write(requests, ordered=False)
+    requests = [UpdateOne({"_id": owner}, {"$inc": {"reputation": delta}}) for owner, delta in reputation_deltas.items() if delta]
+    if requests:
+        db.users.bulk_write(requests, ordered=False)
+
+    _queue_side_effects(db, pending, changes)
+    return results
+
+
+def reconcile(db):
+    """
+    Remove duplicate votes (keeping the newest) and recompute every question and
+    answer score from the votes collection. Needed once before the unique vote
+    indexes can be created on data written by the old vote handler.
+
+    Returns:
+        (duplicates_removed, scores_fixed)
+    """
+    removed = 0
+    for field in ("questionId", "answerId"):
+        duplicates = db.votes.aggregate([
+            {"$match": {field: {"$exists": True}}},
+            {"$sort": {"date": -1}},
+            {"$group": {"_id": {"memberId": "$memberId", "target": f"${field}"}, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}}
+        ], allowDiskUse=True)
+        for group in duplicates:
+            removed += db.votes.delete_many({"_id": {"$in": group["ids"][1:]}}).deleted_count
+
+    fixed = 0
+    for kind, (field, collection) in TARGETS.items():
+        totals = {row["_id"]: row["score"] for row in db.votes.aggregate([
+            {"$match": {field: {"$exists": True}}},
+            {"$group": {"_id": f"${field}", "score": {"$sum": "$value"}}}
+        ], allowDiskUse=True)}
+        requests = []
+        for doc in db[collection].find({}, {"score": 1}):
+            score = totals.get(doc["_id"], 0)
+            if doc.get("score", 0) != score:
+                requests.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"score": score}}))
+        for start in range(0, len(requests), 500):
+            fixed += db[collection].bulk_write(requests[start:start + 500], ordered=False).modified_count
+    logger.info(f"Vote reconcile removed {removed} duplicate votes and fixed {fixed} scores")
+    return removed, fixed
@@ -0,0 +1,437 @@
+"""
+Micro-benchmarks for the AskSphere backend.
+
+    python benchmark.py backends [--backends eager quantized onnx] [--runs 50]
+    python benchmark.py votes [--threads 32] [--voters 8] [--votes 200]
+    python benchmark.py chat [--runs 20000]
+    python benchmark.py moderation [--posts 50]
+    python benchmark.py segments [--lengths 50 200 800 3200] [--runs 10]
+    python benchmark.py passwords [--rounds 10 11 12 13] [--threads 32] [--logins 200]
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import subprocess
+import statistics
+
+SAMPLE_TEXTS = [
+    "How do I configure a reverse proxy for my Flask app behind Nginx?",
+    "What is the best strategy for the final boss in Elden Ring?",
+    "You are an idiot and nobody wants your stupid answers here.",
+    "Which DAW is best for recording acoustic guitar at home?",
+    "Can someone explain how CRISPR gene editing works?",
+    "I hate you, get lost, this is the worst community ever.",
+    "Tips for improving my marathon time?",
+    "x"
+]
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _latency_ms(fn, runs):
+    fn()  # warm-up
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50": round(statistics.median(samples), 2),
+        "p95": round(_percentile(samples, 95), 2),
+        "mean": round(statistics.mean(samples), 2)
+    }
+
+
+def _backend_child(backend, runs):
+    # Runs in its own process so the RSS numbers only include one backend
+    os.environ['INFERENCE_BACKEND'] = backend
+    from app import model_registry
+
+    rss_start = model_registry._rss_bytes()
+    detoxify = model_registry.get_detoxify()
+    minilm = model_registry.get_sentence_model()
+    rss_loaded = model_registry._rss_bytes()
+
+    result = {
+        "backend": backend,
+        "toxicitySingle": _latency_ms(lambda: detoxify.predict(SAMPLE_TEXTS[0]), runs),
+        "toxicityBatch8": _latency_ms(lambda: detoxify.predict(SAMPLE_TEXTS), runs),
+        "embeddingSingle": _latency_ms(lambda: minilm.encode([SAMPLE_TEXTS[0]], convert_to_numpy=True), runs),
+        "embeddingBatch8": _latency_ms(lambda: minilm.encode(SAMPLE_TEXTS, convert_to_numpy=True), runs),
+        "modelRssMB": round((rss_loaded - rss_start) / (1024 * 1024), 1),
+        "peakRssMB": round(model_registry._rss_bytes() / (1024 * 1024), 1)
+    }
+    print(json.dumps(result))
+
+
+def bench_backends(args):
+    if args.child:
+        _backend_child(args.child, args.runs)
+        return
+
+    print(f"{'backend':>10} {'tox 1 p50':>10} {'tox 8 p50':>10} {'emb 1 p50':>10} {'emb 8 p50':>10} {'models MB':>10} {'RSS MB':>8}")
+    for backend in args.backends:
+        proc = subprocess.run(
+            [sys.executable, __file__, 'backends', '--child', backend, '--runs', str(args.runs)],
+            capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            print(f"{backend:>10} failed: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode}")
+            continue
+        r = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(f"{backend:>10} {r['toxicitySingle']['p50']:>10} {r['toxicityBatch8']['p50']:>10} "
+              f"{r['embeddingSingle']['p50']:>10} {r['embeddingBatch8']['p50']:>10} {r['modelRssMB']:>10} {r['peakRssMB']:>8}")
+
+
+def bench_votes(args):
+    """
+    Hammer one answer from many threads, with voters shared between threads so the
+    same member races against itself, then check the score and the author's
+    reputation match the votes collection exactly. Runs in a scratch database.
+    """
+    from types import SimpleNamespace
+    from concurrent.futures import ThreadPoolExecutor
+    from bson import ObjectId
+    from pymongo import MongoClient
+    from app import background, vote_engine
+    from app.config import Config
+    from app.indexes import ensure_indexes
+
+    client = MongoClient(Config.MONGO_URI)
+    client.drop_database(args.database)
+    db = client[args.database]
+    ensure_indexes(db)
+
+    author = ObjectId()
+    db.users.insert_one({"_id": author, "username": "author", "reputation": 0})
+    answer_id = db.answers.insert_one({"memberId": author, "questionId": ObjectId(), "content": "x", "score": 0}).inserted_id
+    voters = [SimpleNamespace(id=str(ObjectId()), username=f"voter{i}") for i in range(args.voters)]
+    conflicts = []
+
+    def hammer(seed):
+        rng = random.Random(seed)
+        for _ in range(args.votes):
+            try:
+                vote_engine.cast_vote(db, rng.choice(voters), "answer", answer_id, rng.choice([1, -1]))
+            except vote_engine.VoteConflict:
+                conflicts.append(seed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(hammer, range(args.threads)))
+    elapsed = time.perf_counter() - start
+
+    votes = list(db.votes.find({"answerId": answer_id}))
+    expected_score = sum(v["value"] for v in votes)
+    expected_reputation = sum(vote_engine.reputation_for(v["value"]) for v in votes)
+    score = db.answers.find_one({"_id": answer_id})["score"]
+    reputation = db.users.find_one({"_id": author})["reputation"]
+    members = len({v["memberId"] for v in votes})
+
+    total = args.threads * args.votes
+    print(f"{total} votes from {args.threads} threads in {elapsed:.2f}s ({total / elapsed:.0f} votes/s), {len(conflicts)} conflicts")
+    print(f"score {score} (expected {expected_score}), reputation {reputation} (expected {expected_reputation}), "
+          f"{len(votes)} vote documents for {members} members")
+
+    # Let queued rollups and notifications land before dropping the database
+    while background.queue_depth():
+        time.sleep(0.05)
+    if not args.keep:
+        client.drop_database(args.database)
+
+    if score != expected_score or reputation != expected_reputation or len(votes) != members:
+        print("FAILED: vote counts drifted")
+        sys.exit(1)
+    print("OK")
+
+
+# The regex chain services.handle_chat_query ran before the intent engine, kept as the baseline
+LEGACY_CHAT_PATTERNS = [
+    ("join_community", r'\b(join|member|become)\b.*\b(community|communities)\b'),
+    ("password_reset", r'\b(password|login)\b.*\b(forgot|reset|recover|change)\b'),
+    ("ask_question", r'\b(ask|post|submit)\b.*\b(question|questions)\b'),
+    ("create_account", r'\b(create|sign\s*up|register|signup)\b.*\b(account|profile)\b'),
+    ("edit_post", r'\b(edit|update|change|modify)\b.*\b(question|answer|post)\b'),
+    ("delete_post", r'\b(delete|remove)\b.*\b(question|answer|post)\b'),
+    ("view_notifications", r'\b(view|check|see|look\s+at)\b.*\b(notification|notifications|alerts)\b'),
+    ("report_content", r'\b(report|flag)\b.*\b(content|user|post|question|answer)\b'),
+    ("account_ban", r'\b(ban|banned|restrict|restricted|suspend|suspension|appeal)\b.*\b(account|profile)\b'),
+    ("search", r'\b(search|find|look\s+for)\b.*\b(community|communities|question|questions)\b'),
+]
+
+CHAT_QUERIES = [
+    "how do i join the gaming community",
+    "i forgot my password, how do i reset it",
+    "where can i post a question about python",
+    "how to sign up for a new account",
+    "can i edit my answer after posting",
+    "please delete my question",
+    "how do i look at my notifications",
+    "i want to report a user who is spamming",
+    "why is my account banned",
+    "how can i search for questions about music",
+    "what is the meaning of life",
+    "hello there",
+    "my question about the community rules got deleted and i want to know why and how to appeal",
+    "login change",
+]
+
+
+def _legacy_chat(patterns, query):
+    for name, pattern in patterns:
+        if re.search(pattern, query):
+            return name
+    return None
+
+
+def bench_chat(args):
+    from app.intents import IntentEngine
+    from app.config import Config
+
+    engine = IntentEngine.from_file(Config.CHAT_INTENTS_PATH)
+    # Raw pattern strings, as the old handler passed them to re.search every time
+    legacy = LEGACY_CHAT_PATTERNS
+    queries = [q.lower() for q in CHAT_QUERIES]
+    with open(Config.CHAT_INTENTS_PATH, encoding='utf-8') as f:
+        queries += [e.lower() for intent in json.load(f)["intents"] for e in intent.get("examples", [])]
+
+    mismatches = [(q, _legacy_chat(legacy, q), engine.match_rules(q)) for q in queries
+                  if _legacy_chat(legacy, q) != engine.match_rules(q)]
+    for query, old, new in mismatches:
+        print(f"MISMATCH {query!r}: regex chain {old}, intent engine {new}")
+
+    def run(fn):
+        start = time.perf_counter()
+        for i in range(args.runs):
+            fn(queries[i % len(queries)])
+        return args.runs / (time.perf_counter() - start)
+
+    print(f"{len(queries)} distinct queries, {args.runs} runs each")
+    print(f"regex chain:   {run(lambda q: _legacy_chat(legacy, q)):>10.0f} queries/s")
+    print(f"intent engine: {run(engine.match_rules):>10.0f} queries/s")
+
+    if args.embedding:
+        from app import inference
+        engine.embed = inference.embed
+        unmatched = [q for q in queries if engine.match_rules(q) is None]
+        for query in unmatched:
+            name, score = engine.match_embedding(query)
+            print(f"embedding fallback {query!r}: {name} ({score:.2f})")
+        runs = min(args.runs, 200)
+        start = time.perf_counter()
+        for i in range(runs):
+            engine.match_embedding(unmatched[i % len(unmatched)] if unmatched else queries[0])
+        print(f"embedding fallback: {runs / (time.perf_counter() - start):>7.0f} queries/s")
+
+    if mismatches:
+        sys.exit(1)
+
+
+def _legacy_flag(db, member_id, community_id, content):
+    # The writes one flagged post used to make: AIContentFilter.filterContent's, then
+    # the same strike logic again inline in post_question
+    from datetime import datetime, timedelta
+    from app import notifications
+
+    for inline in (False, True):
+        db.inappropriate_content.insert_one({"content": content, "memberId": member_id, "communityId": community_id,
+                                             "timestamp": datetime.utcnow(), "keys": ["toxicity"], "isProcessed": False})
+        user = db.users.find_one({"_id": member_id})
+        restriction_level = (user.get('restrictionLevel', 0) or 0) + 1
+        db.users.update_one({"_id": member_id}, {"$set": {"restrictionLevel": restriction_level}})
+        feedback = "strike"
+        if 5 - restriction_level <= 0:
+            db.community_bans.insert_one({"memberId": member_id, "communityId": community_id, "startDate": datetime.utcnow(),
+                                          "expiresAt": datetime.utcnow() + timedelta(days=1)})
+            db.inappropriate_content.delete_many({"memberId": member_id, "communityId": community_id})
+            db.users.update_one({"_id": member_id}, {"$set": {"restrictionLevel": 0}})
+        if inline:
+            db.notifications.insert_one({"memberId": member_id, "type": "inappropriate", "message": feedback,
+                                         "isRead": False, "createdAt": datetime.utcnow(), "communityId": community_id})
+        else:
+            notifications.notify(db, member_id, feedback, "inappropriate", community_id=community_id)
+
+
+def bench_moderation(args):
+    """
+    Flag --posts posts by members who strike out after every strikesBeforeBan posts,
+    through the old duplicated strike logic and through the moderation engine.
+    Counts the MongoDB commands each flagged post issues on the request thread
+    (notifications queued for the background dispatcher are not included) and
+    checks the engine bans on the right strike. Runs in a scratch database.
+    """
+    import threading
+    from bson import ObjectId
+    from pymongo import MongoClient, monitoring
+    from app import background, moderation, notifications
+    from app.config import Config
+
+    class CommandCounter(monitoring.CommandListener):
+        # Started events are published on the thread that runs the command
+        def __init__(self):
+            self.thread = threading.get_ident()
+            self.commands = 0
+
+        def started(self, event):
+            if threading.get_ident() == self.thread:
+                self.commands += 1
+
+        def succeeded(self, event):
+            pass
+
+        def failed(self, event):
+            pass
+
+    counter = CommandCounter()
+    client = MongoClient(Config.MONGO_URI, event_listeners=[counter])
+    client.drop_database(args.database)
+    db = client[args.database]
+    rules = moderation.get_rules()
+    per_member = rules["strikesBeforeBan"]
+
+    def run(name, flag_post):
+        members = [db.users.insert_one({"username": f"{name}{i}", "restrictionLevel": 0, "community_bans": {}}).inserted_id
+                   for i in range(-(-args.posts // per_member))]
+        commands = counter.commands
+        start = time.perf_counter()
+        outcomes = [flag_post(members[i // per_member], 1, f"flagged post {i}") for i in range(args.posts)]
+        elapsed = time.perf_counter() - start
+        commands = counter.commands - commands
+        print(f"{name:<8} {commands / args.posts:>5.1f} commands per flagged post, {elapsed / args.posts * 1000:>6.2f} ms per post")
+        return outcomes
+
+    run("legacy", _legacy_flag)
+    outcomes = run("engine", lambda member_id, community_id, content: moderation.record_flag(
+        db, moderation.flag(member_id, community_id, content, ["toxicity"])))
+
+    wrong = [i for i, outcome in enumerate(outcomes) if (outcome["action"] == "ban") != ((i + 1) % per_member == 0)]
+
+    notifications.get_dispatcher(db).flush()
+    while background.queue_depth():
+        time.sleep(0.05)
+    if not args.keep:
+        client.drop_database(args.database)
+
+    if wrong:
+        print(f"FAILED: bans on the wrong strike for posts {wrong}")
+        sys.exit(1)
+    print("OK")
+
+
+def bench_segments(args):
+    """
+    Toxicity and relevance latency against post length: the whole post in one
+    model call (the tokenizer truncates it) versus segmented into windows that
+    are all scored in one batch.
+    """
+    from app import segmentation
+    from app.config import Config
+    from app.inference import score_toxicity, embed
+
+    words = " ".join(SAMPLE_TEXTS).split()
+    print(f"windows of {Config.SEGMENT_WINDOW_WORDS} words, {Config.SEGMENT_OVERLAP_WORDS} overlap, "
+          f"at most {Config.SEGMENT_MAX_WINDOWS} per post; p50 ms over {args.runs} runs")
+    print(f"{'words':>7} {'windows':>8} {'tox whole':>10} {'tox windows':>12} {'emb whole':>10} {'emb windows':>12}")
+    for length in args.lengths:
+        text = " ".join(words[i % len(words)] for i in range(length))
+        windows = segmentation.split_windows(text)
+        row = [
+            _latency_ms(lambda: score_toxicity([text]), args.runs)["p50"],
+            _latency_ms(lambda: score_toxicity(windows), args.runs)["p50"],
+            _latency_ms(lambda: embed([text]), args.runs)["p50"],
+            _latency_ms(lambda: embed(windows), args.runs)["p50"]
+        ]
+        print(f"{length:>7} {len(windows):>8} {row[0]:>10} {row[1]:>12} {row[2]:>10} {row[3]:>12}")
+
+
+def bench_passwords(args):
+    """
+    Login throughput at several bcrypt costs: --threads clients check a password
+    through the hashing pool at once, as concurrent /login requests do. Checks
+    refused by the queue limit or timed out are counted, not retried.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from app import passwords
+    from app.config import Config
+
+    password = "correct horse battery staple"
+    print(f"{Config.PASSWORD_HASH_WORKERS} hashing threads, queue limit {Config.PASSWORD_HASH_QUEUE}, "
+          f"{args.threads} clients, {args.logins} logins per cost")
+    print(f"{'cost':>5} {'check ms':>9} {'logins/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'refused':>8}")
+    for rounds in args.rounds:
+        stored = passwords.hash_password(password, rounds)
+        single = _latency_ms(lambda: passwords.check_password(stored, password), 3)["p50"]
+        latencies = []
+        refused = []
+
+        def login(_):
+            start = time.perf_counter()
+            try:
+                passwords.check_password(stored, password)
+            except (passwords.HashingBusy, passwords.HashingTimeout):
+                refused.append(1)
+                return
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            list(pool.map(login, range(args.logins)))
+        elapsed = time.perf_counter() - start
+        p50 = round(statistics.median(latencies), 1) if latencies else "-"
+        p95 = round(_percentile(latencies, 95), 1) if latencies else "-"
+        print(f"{rounds:>5} {single:>9} {len(latencies) / elapsed:>9.1f} {p50:>8} {p95:>8} {len(refused):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    backends = subparsers.add_parser('backends', help='Latency and RSS of each inference backend')
+    backends.add_argument('--backends', nargs='+', default=['eager', 'quantized', 'onnx'])
+    backends.add_argument('--runs', type=int, default=50)
+    backends.add_argument('--child', help=argparse.SUPPRESS)
+    backends.set_defaults(func=bench_backends)
+
+    votes = subparsers.add_parser('votes', help='Concurrent voting on one answer; checks the score stays exact')
+    votes.add_argument('--threads', type=int, default=32)
+    votes.add_argument('--voters', type=int, default=8)
+    votes.add_argument('--votes', type=int, default=200, help='Votes cast by each thread')
+    votes.add_argument('--database', default='asksphere_vote_check')
+    votes.add_argument('--keep', action='store_true', help='Keep the scratch database afterwards')
+    votes.set_defaults(func=bench_votes)
+
+    chat = subparsers.add_parser('chat', help='Chatbot intent engine against the old regex chain')
+    chat.add_argument('--runs', type=int, default=20000)
+    chat.add_argument('--embedding', action='store_true', help='Also time the MiniLM fallback (loads the model)')
+    chat.set_defaults(func=bench_chat)
+
+    moderation = subparsers.add_parser('moderation', help='MongoDB round trips per flagged post, old strike logic against the moderation engine')
+    moderation.add_argument('--posts', type=int, default=50)
+    moderation.add_argument('--database', default='asksphere_moderation_check')
+    moderation.add_argument('--keep', action='store_true', help='Keep the scratch database afterwards')
+    moderation.set_defaults(func=bench_moderation)
+
+    segments = subparsers.add_parser('segments', help='Scoring latency against post length, whole post versus windows')
+    segments.add_argument('--lengths', type=int, nargs='+', default=[50, 200, 800, 3200], help='Post lengths in words')
+    segments.add_argument('--runs', type=int, default=10)
+    segments.set_defaults(func=bench_segments)
+
+    passwords = subparsers.add_parser('passwords', help='Login throughput through the hashing pool at several bcrypt costs')
+    passwords.add_argument('--rounds', type=int, nargs='+', default=[10, 11, 12, 13], help='bcrypt cost factors')
+    passwords.add_argument('--threads', type=int, default=32, help='Concurrent clients')
+    passwords.add_argument('--logins', type=int, default=200, help='Logins per cost factor')
+    passwords.set_defaults(func=bench_passwords)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Export Detoxify and MiniLM to ONNX for INFERENCE_BACKEND=onnx and check them against eager PyTorch.
+
+    python export_onnx.py                # export to ONNX_MODEL_DIR
+    python export_onnx.py --check        # export, then compare quantized and ONNX with eager on sample texts
+    python export_onnx.py --check-only   # compare without exporting again
+"""
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import torch
+from detoxify import Detoxify
+from sentence_transformers import SentenceTransformer
+from benchmark import SAMPLE_TEXTS
+
+DEFAULT_CHECKPOINT = '/root/.cache/torch/hub/checkpoints/toxic_original-c1212f89.ckpt'
+DEFAULT_MINILM = '/root/.cache/huggingface/hub/models--sentence-transformers--all-MiniLM-L6-v2/snapshots/c9745ed1d9f207416be6d2e6f8de32d1f16199bf'
+
+class _ClassifierLogits(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask, token_type_ids):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)[0]
+
+
+class _TokenEmbeddings(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask, token_type_ids):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)[0]
+
+
+def _export(module, tokenizer, path, output_name):
+    inputs = tokenizer(["export sample", "a second, longer export sample"], return_tensors='pt', padding=True)
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in ('input_ids', 'attention_mask', 'token_type_ids')}
+    dynamic_axes[output_name] = {0: 'batch'}
+    torch.onnx.export(
+        module.eval(),
+        (inputs['input_ids'], inputs['attention_mask'], inputs['token_type_ids']),
+        path,
+        input_names=['input_ids', 'attention_mask', 'token_type_ids'],
+        output_names=[output_name],
+        dynamic_axes=dynamic_axes,
+        opset_version=14
+    )
+
+
+def export_detoxify(checkpoint, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    detox = Detoxify('original', checkpoint=checkpoint)
+    _export(_ClassifierLogits(detox.model), detox.tokenizer, os.path.join(out_dir, 'model.onnx'), 'logits')
+    detox.tokenizer.save_pretrained(out_dir)
+    with open(os.path.join(out_dir, 'asksphere.json'), 'w') as f:
+        json.dump({"class_names": list(detox.class_names)}, f)
+    print(f"Exported Detoxify to {out_dir}")
+
+
+def export_minilm(model_path, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    model = SentenceTransformer(model_path)
+    transformer = model[0]
+    _export(_TokenEmbeddings(transformer.auto_model), transformer.tokenizer, os.path.join(out_dir, 'model.onnx'), 'token_embeddings')
+    transformer.tokenizer.save_pretrained(out_dir)
+    normalize = any(type(module).__name__ == 'Normalize' for module in model)
+    with open(os.path.join(out_dir, 'asksphere.json'), 'w') as f:
+        json.dump({"max_seq_length": model.max_seq_length, "normalize": normalize}, f)
+    print(f"Exported MiniLM to {out_dir}")
+
+
+def check_parity(checkpoint, model_path, toxicity_tolerance, embedding_tolerance):
+    from app.models import load_toxicity_model, load_sentence_model
+
+    eager_toxicity = load_toxicity_model('eager', checkpoint).predict(SAMPLE_TEXTS)
+    eager_embeddings = load_sentence_model('eager', model_path, 'all-MiniLM-L6-v2', None).encode(SAMPLE_TEXTS, convert_to_numpy=True, normalize_embeddings=True)
+
+    ok = True
+    for backend in ('quantized', 'onnx'):
+        toxicity = load_toxicity_model(backend, checkpoint).predict(SAMPLE_TEXTS)
+        toxicity_error = max(
+            float(np.max(np.abs(np.array(toxicity[label]) - np.array(eager_toxicity[label]))))
+            for label in eager_toxicity
+        )
+        embeddings = load_sentence_model(backend, model_path, 'all-MiniLM-L6-v2', None).encode(SAMPLE_TEXTS, convert_to_numpy=True, normalize_embeddings=True)
+        # 1 - cosine similarity between each backend embedding and its eager counterpart
+        embedding_error = float(np.max(1 - np.sum(embeddings * eager_embeddings, axis=1)))
+
+        passed = toxicity_error <= toxicity_tolerance and embedding_error <= embedding_tolerance
+        ok = ok and passed
+        print(f"{backend:>9}: max toxicity diff {toxicity_error:.4f} (tolerance {toxicity_tolerance}), "
+              f"max embedding cosine distance {embedding_error:.5f} (tolerance {embedding_tolerance}) -> {'OK' if passed else 'FAIL'}")
+    return ok
+
+
+def main():
+    from app.config import Config
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out-dir', default=Config.ONNX_MODEL_DIR)
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT)
+    parser.add_argument('--minilm', default=DEFAULT_MINILM)
+    parser.add_argument('--check', action='store_true', help='Compare quantized and ONNX scores with eager after exporting')
+    parser.add_argument('--check-only', action='store_true', help='Compare backends without exporting')
+    parser.add_argument('--toxicity-tolerance', type=float, default=0.05)
+    parser.add_argument('--embedding-tolerance', type=float, default=0.02)
+    args = parser.parse_args()
+
+    if not args.check_only:
+        export_detoxify(args.checkpoint, os.path.join(args.out_dir, 'detoxify'))
+        export_minilm(args.minilm, os.path.join(args.out_dir, 'minilm'))
+    if args.check or args.check_only:
+        Config.ONNX_MODEL_DIR = args.out_dir
+        if not check_parity(args.checkpoint, args.minilm, args.toxicity_tolerance, args.embedding_tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
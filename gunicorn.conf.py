@@ -0,0 +1,34 @@
+import gc
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+workers = int(os.getenv('WEB_CONCURRENCY', 1))
+# gevent serves each connection from a greenlet, so idle notification streams
+# (GET /notifications/stream) do not each hold an OS thread
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+# Off by default: each worker imports the app after gevent has patched it and answers
+# /health at once, loading its own model copies in the background (app/startup.py).
+# PRELOAD_MODELS=1 loads the models once in the master so workers share the weights
+# copy-on-write, at the cost of no worker existing (and /health not answering) until they are in.
+preload_app = os.getenv('PRELOAD_MODELS', '0') == '1'
+# TLS when a certificate is configured (the container image sets both)
+certfile = os.getenv('SSL_CERTFILE') or None
+keyfile = os.getenv('SSL_KEYFILE') or None
+loglevel = 'debug'
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    if preload_app:
+        from app import model_registry
+        model_registry.preload()
+        # Keep the garbage collector from touching (and so copying) the preloaded objects in every worker
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    # Mongo, seeding, models and warm-up in the background; /ready turns 200 once this worker is done
+    from app import mongo, init_db, startup
+    startup.begin(mongo.db, init_db)
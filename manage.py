@@ -0,0 +1,100 @@
+"""
+Maintenance commands for the AskSphere backend.
+
+    python manage.py indexes ensure    # create every declared index
+    python manage.py indexes report    # list missing, unused and undeclared indexes
+    python manage.py rollups backfill  # rebuild the activity rollups from history
+    python manage.py votes reconcile   # drop duplicate votes and recompute scores
+    python manage.py avatars migrate   # move base64 avatars into the GridFS bucket
+    python manage.py bans migrate      # move bans from the old community_bans collection onto users, index ban expiry
+"""
+import sys
+import argparse
+
+
+def indexes_command(args):
+    from app import mongo
+    from app.indexes import ensure_indexes, report
+
+    if args.action == 'ensure':
+        failed = ensure_indexes(mongo.db)
+        if failed:
+            print(f"Failed to create: {', '.join(failed)}")
+            sys.exit(1)
+        print("All declared indexes exist.")
+        return
+
+    result = report(mongo.db)
+    for section in ('missing', 'unused', 'undeclared'):
+        print(f"{section.capitalize()} indexes:")
+        for name in result[section] or ['(none)']:
+            print(f"  {name}")
+
+
+def rollups_command(args):
+    from app import mongo, rollups
+
+    groups = rollups.backfill(mongo.db)
+    print(f"Rebuilt activity rollups from {groups} day groups.")
+
+
+def votes_command(args):
+    from app import mongo, vote_engine
+    from app.indexes import ensure_indexes
+
+    removed, fixed = vote_engine.reconcile(mongo.db)
+    print(f"Removed {removed} duplicate votes, fixed {fixed} scores.")
+    failed = [name for name in ensure_indexes(mongo.db) if name.startswith('votes.')]
+    if failed:
+        print(f"Failed to create: {', '.join(failed)}")
+        sys.exit(1)
+
+
+def avatars_command(args):
+    from app import mongo, avatars
+
+    migrated, failed = avatars.migrate(mongo.db)
+    print(f"Migrated {migrated} avatars, {failed} could not be read and were left in place.")
+    if failed:
+        sys.exit(1)
+
+
+def bans_command(args):
+    from app import mongo, moderation
+
+    updated = moderation.migrate_legacy_bans(mongo.db)
+    print(f"Moved legacy community bans onto {updated} users and dropped the community_bans collection.")
+    backfilled = moderation.backfill_ban_expiry(mongo.db)
+    print(f"Set banExpiresAt on {backfilled} users banned before it existed.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    indexes = subparsers.add_parser('indexes', help='Create or audit MongoDB indexes')
+    indexes.add_argument('action', choices=['ensure', 'report'])
+    indexes.set_defaults(func=indexes_command)
+
+    rollup = subparsers.add_parser('rollups', help='Maintain the pre-aggregated activity rollups')
+    rollup.add_argument('action', choices=['backfill'])
+    rollup.set_defaults(func=rollups_command)
+
+    votes = subparsers.add_parser('votes', help='Repair vote data written before the unique vote indexes')
+    votes.add_argument('action', choices=['reconcile'])
+    votes.set_defaults(func=votes_command)
+
+    avatar = subparsers.add_parser('avatars', help='Move avatars out of the user documents')
+    avatar.add_argument('action', choices=['migrate'])
+    avatar.set_defaults(func=avatars_command)
+
+    bans = subparsers.add_parser('bans', help='Move bans out of the old community_bans collection')
+    bans.add_argument('action', choices=['migrate'])
+    bans.set_defaults(func=bans_command)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,5 +4,5 @@ Set-Content -Path startup.sh -Value @'
 echo "Installing dependencies..."
 pip install -r requirements.txt > pip_install.log 2>&1
 echo "Starting Gunicorn..."
-gunicorn --workers=1 --bind=0.0.0.0:$PORT --log-level=debug --access-logfile=- --error-logfile=- app:app
+gunicorn -c gunicorn.conf.py app:app
 '@
\ No newline at end of file
@@ -0,0 +1,22 @@
+import os
+import uuid
+import pytest
+
+# Importing the app builds the Flask-PyMongo client, which needs a URI but connects
+# lazily, so tests that never touch the database run without a server
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017/asksphere_test")
+
+
+@pytest.fixture
+def db():
+    """A scratch database on TEST_MONGO_URI, dropped afterwards. Skipped when no server answers."""
+    pymongo = pytest.importorskip("pymongo")
+    client = pymongo.MongoClient(os.getenv("TEST_MONGO_URI", "mongodb://localhost:27017"), serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command("ping")
+    except pymongo.errors.PyMongoError:
+        pytest.skip("MongoDB is not reachable")
+    name = f"asksphere_test_{uuid.uuid4().hex[:8]}"
+    yield client[name]
+    client.drop_database(name)
+    client.close()
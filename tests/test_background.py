@@ -0,0 +1,33 @@
+import time
+import threading
+import pytest
+
+background = pytest.importorskip("app.background")
+
+
+def test_full_queue_drops_tasks():
+    worker = background.BackgroundWorker('test', max_queue=2)
+    release = threading.Event()
+    done = []
+    worker.submit(release.wait)
+    # Wait for the blocking task to leave the queue
+    while worker.stats()["queueDepth"]:
+        time.sleep(0.01)
+    for i in range(5):
+        worker.submit(done.append, i)
+    assert worker.stats()["dropped"] == 3
+    release.set()
+    while len(done) < 2:
+        time.sleep(0.01)
+    assert done == [0, 1]
+
+
+def test_heavy_lane_does_not_hold_up_the_fast_lane():
+    release = threading.Event()
+    ran = threading.Event()
+    background.submit_heavy(release.wait)
+    background.submit(ran.set)
+    try:
+        assert ran.wait(timeout=5)
+    finally:
+        release.set()
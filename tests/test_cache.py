@@ -0,0 +1,51 @@
+import pytest
+
+cache_module = pytest.importorskip("app.cache")
+
+
+def test_least_recently_used_entry_is_evicted():
+    backend = cache_module.MemoryBackend(max_entries=2)
+    backend.set("a", 1)
+    backend.set("b", 2)
+    assert backend.get("a") == (True, 1)
+    backend.set("c", 3)
+    assert backend.get("b") == (False, None)
+    assert backend.get("a") == (True, 1)
+    assert backend.stats()["evictions"] == 1
+
+
+def test_expired_entry_is_a_miss(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    backend = cache_module.MemoryBackend()
+    backend.set("a", 1, ttl=10)
+    assert backend.get("a") == (True, 1)
+    now[0] += 10
+    assert backend.get("a") == (False, None)
+
+
+def test_invalidating_a_tag_drops_only_its_entries():
+    backend = cache_module.MemoryBackend()
+    backend.set("q1", 1, tags=["question:1", "community:7"])
+    backend.set("q2", 2, tags=["question:2", "community:7"])
+    backend.set("q3", 3, tags=["question:3"])
+
+    assert backend.invalidate_tags(["community:7"]) == 2
+    assert backend.get("q1") == (False, None)
+    assert backend.get("q3") == (True, 3)
+    # The dropped keys left no stale entries in the tag index
+    assert backend.stats()["tags"] == 1
+
+
+def test_get_or_set_computes_once_and_counts_hits():
+    cache = cache_module.Cache(cache_module.MemoryBackend())
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "value"
+
+    assert cache.get_or_set("thing", "k", compute) == "value"
+    assert cache.get_or_set("thing", "k", compute) == "value"
+    assert len(calls) == 1
+    assert cache.stats()["endpoints"]["thing"] == {"hits": 1, "misses": 1, "hitRatio": 0.5}
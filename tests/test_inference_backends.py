@@ -0,0 +1,51 @@
+import os
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("torch")
+pytest.importorskip("detoxify")
+pytest.importorskip("sentence_transformers")
+
+from benchmark import SAMPLE_TEXTS
+from export_onnx import DEFAULT_CHECKPOINT, DEFAULT_MINILM
+
+models = pytest.importorskip("app.models")
+
+# Same tolerances as `python export_onnx.py --check`
+TOXICITY_TOLERANCE = 0.05
+EMBEDDING_TOLERANCE = 0.02
+
+pytestmark = pytest.mark.skipif(
+    not (os.path.exists(DEFAULT_CHECKPOINT) and os.path.isdir(DEFAULT_MINILM)),
+    reason="Model weights are not in the local cache"
+)
+
+
+def _load(backend):
+    if backend == 'onnx':
+        pytest.importorskip("onnxruntime")
+        if not os.path.exists(os.path.join(models.Config.ONNX_MODEL_DIR, 'detoxify', 'model.onnx')):
+            pytest.skip("ONNX models not exported (python export_onnx.py)")
+    toxicity = models.load_toxicity_model(backend, DEFAULT_CHECKPOINT)
+    encoder = models.load_sentence_model(backend, DEFAULT_MINILM, 'all-MiniLM-L6-v2', None)
+    return toxicity, encoder
+
+
+@pytest.fixture(scope="module")
+def eager():
+    toxicity, encoder = _load('eager')
+    return toxicity.predict(SAMPLE_TEXTS), encoder.encode(SAMPLE_TEXTS, convert_to_numpy=True, normalize_embeddings=True)
+
+
+@pytest.mark.parametrize("backend", ["quantized", "onnx"])
+def test_backend_matches_eager(backend, eager):
+    eager_toxicity, eager_embeddings = eager
+    toxicity, encoder = _load(backend)
+
+    scores = toxicity.predict(SAMPLE_TEXTS)
+    for label, expected in eager_toxicity.items():
+        assert np.max(np.abs(np.array(scores[label]) - np.array(expected))) <= TOXICITY_TOLERANCE, label
+
+    embeddings = encoder.encode(SAMPLE_TEXTS, convert_to_numpy=True, normalize_embeddings=True)
+    cosine_distance = 1 - np.sum(embeddings * eager_embeddings, axis=1)
+    assert np.max(cosine_distance) <= EMBEDDING_TOLERANCE
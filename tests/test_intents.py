@@ -0,0 +1,32 @@
+import os
+import pytest
+
+intents = pytest.importorskip("app.intents")
+
+INTENTS_PATH = os.path.join(os.path.dirname(__file__), "..", "app", "intents.json")
+
+
+@pytest.fixture
+def engine():
+    return intents.IntentEngine.from_file(INTENTS_PATH)
+
+
+def test_shipped_intents_compile_into_one_matcher(engine):
+    assert engine._matcher.pattern
+    for intent in engine.intents:
+        assert engine._responses[intent["name"]] == intent["response"]
+
+
+def test_first_term_must_come_before_then_term(engine):
+    assert engine.match_rules("How do I join a community?") == "join_community"
+    assert engine.match_rules("community join") is None
+
+
+def test_phrases_and_extra_whitespace_match(engine):
+    assert engine.match_rules("I want to sign   up for an account") == "create_account"
+
+
+def test_unmatched_query_gets_the_fallback_without_embeddings(engine):
+    name, response, matched_by = engine.match("zzz qqq")
+    assert name is None and matched_by is None
+    assert response == engine.fallback
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+import pytest
+
+moderation = pytest.importorskip("app.moderation")
+user_loader = pytest.importorskip("app.user_loader")
+
+RULES = {
+    "toxicityThreshold": 0.5,
+    "categoryThreshold": 0.5,
+    "strikesBeforeBan": 2,
+    "warnAtStrikesLeft": 1,
+    "banDays": [1, 3, 7]
+}
+
+
+def _strike(db, member_id, now):
+    return moderation.apply(db, [moderation.flag(member_id, 1, "flagged post", ["toxicity"])], RULES, now)[0]
+
+
+def test_ban_escalates_after_the_previous_one_expires(db):
+    member_id = db.users.insert_one({"username": "member", "community_bans": {}}).inserted_id
+    now = datetime(2026, 1, 1)
+
+    assert _strike(db, member_id, now)["action"] == "warning"
+    first = _strike(db, member_id, now)
+    assert first["action"] == "ban"
+    assert first["banDays"] == 1
+    assert db.users.find_one({"_id": member_id})["banExpiresAt"] == first["expiresAt"]
+    assert user_loader.expire_bans(db, now) == 0
+
+    later = now + timedelta(days=2)
+    assert user_loader.expire_bans(db, later) == 1
+    user = db.users.find_one({"_id": member_id})
+    assert user["banExpiresAt"] is None
+    state = user["community_bans"]["1"]
+    assert "status" not in state and "expiration" not in state
+    assert state["ban_count"] == 1
+
+    assert _strike(db, member_id, later)["action"] == "warning"
+    second = _strike(db, member_id, later)
+    assert second["action"] == "ban"
+    assert second["banDays"] == 3
+
+
+def test_active_bans_keeps_ban_count_of_expired_bans():
+    now = datetime(2026, 1, 1)
+    bans = user_loader.active_bans({
+        "1": {"status": "banned", "ban_count": 2, "duration_days": 3, "expiration": now - timedelta(hours=1)},
+        "2": {"status": "banned", "ban_count": 1, "duration_days": 1, "expiration": now + timedelta(hours=1)}
+    }, now)
+    assert bans["1"] == {"ban_count": 2, "duration_days": 3}
+    assert bans["2"]["status"] == "banned"
+
+
+def test_legacy_bans_are_moved_onto_users(db):
+    now = datetime(2026, 1, 1)
+    member_id = db.users.insert_one({"username": "member", "community_bans": {}}).inserted_id
+    db.community_bans.insert_many([
+        {"memberId": member_id, "communityId": 2, "startDate": now - timedelta(days=5), "expiresAt": now - timedelta(days=4)},
+        {"memberId": member_id, "communityId": 2, "startDate": now - timedelta(days=1), "expiresAt": now + timedelta(days=2)}
+    ])
+
+    assert moderation.migrate_legacy_bans(db, now) == 1
+    state = db.users.find_one({"_id": member_id})["community_bans"]["2"]
+    assert state["status"] == "banned"
+    assert state["ban_count"] == 2
+    assert state["expiration"] == now + timedelta(days=2)
+    assert "community_bans" not in db.list_collection_names()
@@ -0,0 +1,57 @@
+import pytest
+
+notifications = pytest.importorskip("app.notifications")
+indexes = pytest.importorskip("app.indexes")
+
+
+def test_redelivered_events_are_written_once(db):
+    from bson import ObjectId
+
+    indexes.ensure_indexes(db)
+    member = ObjectId()
+    plain = notifications._event(member, "Someone answered", "answer", "a1")
+    votes = [notifications._event(member, "upvote", "vote", "q1", collapse=("vote:q1", f"user{i}", "upvoted your question"))
+             for i in range(3)]
+
+    notifications.write_events(db, [plain] + votes)
+    # An outbox batch retried after a partial failure
+    notifications.write_events(db, [plain] + votes)
+
+    assert db.notifications.count_documents({"type": "answer"}) == 1
+    collapsed = db.notifications.find_one({"collapseKey": "vote:q1"})
+    assert collapsed["count"] == 3
+    assert collapsed["message"].endswith(" and 2 others upvoted your question")
+
+
+def test_failed_flush_parks_events_in_the_outbox(db, monkeypatch):
+    from bson import ObjectId
+
+    monkeypatch.setattr(notifications.background, "submit", lambda *args, **kwargs: None)
+    dispatcher = notifications.NotificationDispatcher(db, batch_size=10)
+    member = ObjectId()
+    for i in range(3):
+        dispatcher.enqueue(notifications._event(member, f"event {i}", "badge"))
+
+    def fail(_db, _events):
+        raise RuntimeError("write failed")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(notifications, "write_events", fail)
+        assert dispatcher.flush() == 0
+    assert db.notification_outbox.count_documents({}) == 3
+    assert dispatcher.stats()["failedFlushes"] == 1
+
+    dispatcher.drain_outbox()
+    assert db.notification_outbox.count_documents({}) == 0
+    assert db.notifications.count_documents({"memberId": member}) == 3
+
+
+def test_full_queue_falls_back_to_the_outbox(db, monkeypatch):
+    from bson import ObjectId
+
+    monkeypatch.setattr(notifications.background, "submit", lambda *args, **kwargs: None)
+    dispatcher = notifications.NotificationDispatcher(db, batch_size=10, max_queued=2)
+    for i in range(5):
+        dispatcher.enqueue(notifications._event(ObjectId(), f"event {i}", "vote"))
+    assert dispatcher.stats()["queued"] == 2
+    assert dispatcher.stats()["outboxed"] == 3
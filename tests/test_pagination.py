@@ -0,0 +1,32 @@
+import pytest
+
+pagination = pytest.importorskip("app.pagination")
+
+SORT = [("score", -1), ("_id", -1)]
+
+
+def test_cursor_round_trip():
+    from bson import ObjectId
+
+    values = [3, ObjectId()]
+    assert pagination.decode_cursor(pagination.encode_cursor(values), 2) == values
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", pagination.encode_cursor([1])])
+def test_bad_cursor_is_rejected(cursor):
+    with pytest.raises(pagination.InvalidCursor):
+        pagination.decode_cursor(cursor, 2)
+
+
+def test_pages_reach_documents_without_the_sort_field(db):
+    db.questions.insert_many(
+        [{"score": score} for score in (5, 3, 3, 1)] + [{"title": "legacy"} for _ in range(3)] + [{"score": None}]
+    )
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = pagination.paginate(db.questions, {}, SORT, 3, cursor)
+        seen.extend(doc["_id"] for doc in page)
+        if cursor is None:
+            break
+    assert len(seen) == len(set(seen)) == 8
@@ -0,0 +1,54 @@
+import time
+import threading
+import pytest
+
+passwords = pytest.importorskip("app.passwords")
+
+
+@pytest.fixture
+def slow_pool(monkeypatch):
+    """One hashing thread, one queue slot, and a hash that waits until released."""
+    monkeypatch.setattr(passwords.Config, "PASSWORD_HASH_WORKERS", 1)
+    monkeypatch.setattr(passwords.Config, "PASSWORD_HASH_QUEUE", 1)
+    monkeypatch.setattr(passwords.Config, "PASSWORD_HASH_TIMEOUT", 5)
+    monkeypatch.setattr(passwords, "_executor", None)
+    release = threading.Event()
+    monkeypatch.setattr(passwords, "_check", lambda password_hash, password: release.wait() or True)
+    yield release
+    release.set()
+
+
+def test_hash_round_trip_at_the_configured_cost(monkeypatch):
+    monkeypatch.setattr(passwords.Config, "BCRYPT_ROUNDS", 4)
+    stored = passwords.hash_password("secret")
+    assert passwords.rounds_of(stored) == 4
+    assert passwords.check_password(stored, "secret")
+    assert not passwords.check_password(stored, "wrong")
+    assert not passwords.needs_rehash(stored)
+    assert passwords.needs_rehash(passwords.hash_password("secret", rounds=5))
+
+
+def test_malformed_hash_does_not_match():
+    assert not passwords.check_password("not a bcrypt hash", "secret")
+    assert passwords.rounds_of("not a bcrypt hash") is None
+
+
+def test_requests_past_the_queue_are_refused(slow_pool):
+    # One check runs and one waits; the third is refused (429)
+    waiting = [threading.Thread(target=passwords.check_password, args=("hash", "pw")) for _ in range(2)]
+    for thread in waiting:
+        thread.start()
+    while passwords.stats()["inFlight"] < 2:
+        time.sleep(0.01)
+    with pytest.raises(passwords.HashingBusy):
+        passwords.check_password("hash", "pw")
+    slow_pool.set()
+    for thread in waiting:
+        thread.join()
+    assert passwords.stats()["inFlight"] == 0
+
+
+def test_slow_hash_times_out(slow_pool, monkeypatch):
+    monkeypatch.setattr(passwords.Config, "PASSWORD_HASH_TIMEOUT", 0.05)
+    with pytest.raises(passwords.HashingTimeout):
+        passwords.check_password("hash", "pw")
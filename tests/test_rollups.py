@@ -0,0 +1,23 @@
+from datetime import datetime
+import pytest
+
+rollups = pytest.importorskip("app.rollups")
+
+
+def test_backfill_dates_undated_votes_from_their_id(db):
+    from bson import ObjectId
+
+    member = ObjectId()
+    db.votes.insert_many([
+        {"memberId": member, "value": 1, "date": datetime(2025, 6, 17, 12)},
+        {"memberId": member, "value": 1},
+        {"memberId": member, "value": -1, "date": None}
+    ])
+    db.activity_rollups.insert_one({"_id": "user:stale:all", "totals": {"votes": 99}})
+
+    assert rollups.backfill(db) == 2
+    docs = {doc["_id"]: doc for doc in db.activity_rollups.find()}
+    assert "user:stale:all" not in docs
+    assert docs[f"user:{member}:all"]["totals"]["votes"] == 3
+    assert docs[f"user:{member}:2025-06"]["days"]["17"]["votes"] == 1
+    assert "activity_rollups_backfill" not in db.list_collection_names()
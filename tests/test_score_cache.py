@@ -0,0 +1,31 @@
+import threading
+import pytest
+
+score_cache = pytest.importorskip("app.score_cache")
+
+
+def test_disk_entries_are_shared_and_use_one_connection(tmp_path):
+    path = str(tmp_path / "scores.sqlite")
+    writer = score_cache.ScoreCache(path, max_entries=10, ttl=60)
+    reader = score_cache.ScoreCache(path, max_entries=10, ttl=60)
+    writer.set("k", [0.1, 0.2])
+
+    connections = set()
+
+    def read():
+        assert reader.get("k") == [0.1, 0.2]
+        connections.add(id(reader._conn))
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(connections) == 1
+    assert reader.disk_hits >= 1
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = score_cache.ScoreCache(str(tmp_path / "scores.sqlite"), max_entries=10, ttl=-1)
+    cache.set("k", [0.5])
+    assert cache.get("k") is None
@@ -0,0 +1,34 @@
+import pytest
+
+segmentation = pytest.importorskip("app.segmentation")
+
+
+def _text(words):
+    return " ".join(f"w{i}" for i in range(words))
+
+
+def test_short_text_is_one_window():
+    assert segmentation.split_windows("a short post", size=10, overlap=2, budget=4) == ["a short post"]
+
+
+def test_windows_overlap_and_cover_the_end():
+    windows = segmentation.split_windows(_text(25), size=10, overlap=2, budget=8)
+    assert [w.split()[0] for w in windows] == ["w0", "w8", "w15"]
+    assert all(len(w.split()) == 10 for w in windows)
+    assert windows[-1].split()[-1] == "w24"
+
+
+def test_long_text_is_spread_over_the_budget():
+    windows = segmentation.split_windows(_text(1000), size=10, overlap=0, budget=3)
+    assert [w.split()[0] for w in windows] == ["w0", "w495", "w990"]
+
+
+def test_segment_many_slices_map_back_to_texts():
+    texts = ["one window", _text(25)]
+    windows, slices = segmentation.segment_many(texts)
+    assert windows[slices[0]] == ["one window"]
+    assert len(windows[slices[1]]) == len(segmentation.split_windows(texts[1]))
+
+
+def test_max_scores_takes_the_worst_window():
+    assert segmentation.max_scores([{"toxicity": 0.1, "insult": 0.7}, {"toxicity": 0.9, "insult": 0.2}]) == {"toxicity": 0.9, "insult": 0.7}
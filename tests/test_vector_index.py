@@ -0,0 +1,43 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+vector_index = pytest.importorskip("app.vector_index")
+
+
+def _encoder(texts):
+    # Deterministic stand-in for MiniLM: a normalized bag of character codes
+    rows = np.zeros((len(texts), 8), dtype=np.float32)
+    for i, text in enumerate(texts):
+        for ch in text:
+            rows[i, ord(ch) % 8] += 1
+    return rows / np.maximum(np.linalg.norm(rows, axis=1, keepdims=True), 1e-9)
+
+
+def test_sync_re_embeds_questions_edited_by_another_process(db, tmp_path):
+    qid = db.questions.insert_one({"title": "aaaa", "content": "", "communityId": 1}).inserted_id
+    first = vector_index.QuestionIndex(db, _encoder, str(tmp_path / "a.npz"))
+    second = vector_index.QuestionIndex(db, _encoder, str(tmp_path / "b.npz"))
+    first.load()
+    second.load()
+
+    db.questions.update_one({"_id": qid}, {"$set": {"title": "bbbb"}})
+    first.upsert(qid, "bbbb", "", 1)
+
+    assert second.sync() >= 1
+    _, matrix = second.vectors([qid])
+    assert np.allclose(matrix[0], _encoder(["bbbb "])[0])
+
+
+def test_failed_load_is_retried(db, tmp_path):
+    db.questions.insert_one({"title": "aaaa", "content": "", "communityId": 1})
+    failures = [RuntimeError("encoder not ready")]
+
+    def flaky(texts):
+        if failures:
+            raise failures.pop()
+        return _encoder(texts)
+
+    index = vector_index.QuestionIndex(db, flaky, str(tmp_path / "index.npz"))
+    with pytest.raises(RuntimeError):
+        index.load()
+    assert len(index) == 1
@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+import pytest
+
+view_counter = pytest.importorskip("app.view_counter")
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = view_counter.BloomFilter(capacity=1000, error_rate=0.01)
+    keys = [f"visitor{i}:question" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    false_positives = sum(f"other{i}" in bloom for i in range(1000))
+    assert false_positives < 50
+
+
+def test_rotating_filter_forgets_after_two_windows(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(view_counter.time, "monotonic", lambda: now[0])
+    seen = view_counter.RotatingBloomFilter(window=60, capacity=100, error_rate=0.01)
+
+    assert not seen.seen("a")
+    assert seen.seen("a")
+    now[0] = 61
+    # Rotated once: "a" is still in the previous generation
+    assert seen.seen("a")
+    now[0] = 122
+    assert not seen.seen("a")
+
+
+def test_rotating_filter_rotates_when_full():
+    seen = view_counter.RotatingBloomFilter(window=3600, capacity=10, error_rate=0.01)
+    for i in range(25):
+        seen.seen(f"key{i}")
+    assert not seen.seen("key0")
+
+
+def _failing_db():
+    def bulk_write(requests, ordered=True):
+        raise RuntimeError("primary stepped down")
+    return SimpleNamespace(questions=SimpleNamespace(bulk_write=bulk_write))
+
+
+def test_repeat_views_are_deduplicated():
+    counter = view_counter.ViewCounter(_failing_db(), max_pending=100)
+    assert counter.record("5f0000000000000000000001", "visitor")
+    assert not counter.record("5f0000000000000000000001", "visitor")
+    assert counter.record("5f0000000000000000000001", "someone else")
+    assert counter.pending("5f0000000000000000000001") == 2
+
+
+def test_failed_flushes_keep_at_most_max_buffered_views(monkeypatch):
+    # Flushed by hand below, not by the early flush a full buffer schedules
+    monkeypatch.setattr(view_counter.background, "submit", lambda *args, **kwargs: None)
+    counter = view_counter.ViewCounter(_failing_db(), max_pending=100, max_buffered=100)
+    for i in range(60):
+        counter.record(f"5f00000000000000000000{i % 3:02d}")
+    assert counter.flush() == 0
+    for i in range(60):
+        counter.record(f"5f00000000000000000000{i % 3:02d}")
+    assert counter.flush() == 0
+
+    stats = counter.stats()
+    assert stats["pendingViews"] == 100
+    assert stats["dropped"] == 20
+    assert stats["failedFlushes"] == 2
@@ -0,0 +1,45 @@
+import random
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+vote_engine = pytest.importorskip("app.vote_engine")
+indexes = pytest.importorskip("app.indexes")
+
+
+def test_concurrent_votes_keep_score_and_reputation_exact(db):
+    from bson import ObjectId
+
+    indexes.ensure_indexes(db)
+    author = ObjectId()
+    db.users.insert_one({"_id": author, "username": "author", "reputation": 0})
+    answer_id = db.answers.insert_one({"memberId": author, "questionId": ObjectId(), "content": "x", "score": 0}).inserted_id
+    # Fewer voters than threads, so the same member races against themselves
+    voters = [SimpleNamespace(id=str(ObjectId()), username=f"voter{i}") for i in range(4)]
+
+    def hammer(seed):
+        rng = random.Random(seed)
+        for _ in range(50):
+            try:
+                vote_engine.cast_vote(db, rng.choice(voters), "answer", answer_id, rng.choice([1, -1]))
+            except vote_engine.VoteConflict:
+                pass
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(hammer, range(16)))
+
+    votes = list(db.votes.find({"answerId": answer_id}))
+    assert len(votes) == len({v["memberId"] for v in votes})
+    assert db.answers.find_one({"_id": answer_id})["score"] == sum(v["value"] for v in votes)
+    assert db.users.find_one({"_id": author})["reputation"] == sum(vote_engine.reputation_for(v["value"]) for v in votes)
+
+
+def test_ensure_indexes_drops_retired_vote_indexes(db):
+    from pymongo import ASCENDING
+
+    db.votes.create_index([("memberId", ASCENDING), ("questionId", ASCENDING)], name="member_question")
+    db.votes.create_index([("memberId", ASCENDING), ("answerId", ASCENDING)], name="member_answer")
+    indexes.ensure_indexes(db)
+    names = set(db.votes.index_information())
+    assert "member_question" not in names and "member_answer" not in names
+    assert {"member_question_unique", "member_answer_unique"} <= names